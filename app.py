@@ -1,42 +1,265 @@
-from fastapi import FastAPI, Query, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Query, UploadFile, File, HTTPException
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
-import chromadb
-from sentence_transformers import SentenceTransformer
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import os
 import json
+import re
+import time
+from datetime import datetime
+from typing import Optional
+from chroma_store import ChromaStore, read_version
+from search_batcher import QueryBatcher
+from query_cache import LRUCache, normalize_query
+from lexical_index import LexicalIndex
+from segment_store import SegmentStore
+from encoders import load_encoder
+from metrics import REGISTRY, CONTENT_TYPE, SEARCH_SECONDS, SEARCH_CACHE_HITS
 # from add_embedding import load_json, generate_embeddings, store_in_chromadb
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The query batcher's worker task runs on the server's event loop
+    query_batcher.start()
+    try:
+        yield
+    finally:
+        await query_batcher.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files (HTML, CSS, JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Initialize ChromaDB client
-client = chromadb.PersistentClient(path="./chromadb_store")
-collection = client.get_or_create_collection("patents_collection", metadata={"hnsw:space": "cosine"})
+store = ChromaStore()
+collection = store.collection
+
+TOP_K = 3  # Patents returned per search unless k= is given
+MAX_K = 50  # Largest page size a client may request
+MAX_OFFSET = 200  # Deepest result a client may page to
+PASSAGES_PER_PATENT = 10  # Passage hits fetched per returned patent before grouping
+SNIPPET_CHARS = 300  # Characters of the best matching passage returned with a hit
+RRF_K = 60  # Reciprocal rank fusion constant for hybrid search
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+VERSION_CHECK_INTERVAL = 1.0  # Seconds between checks for new ingestion writes
+HIT_FIELDS = ("publication_number", "title", "assignee", "filing_date", "ipfs_hash", "score", "section", "snippet")
+
+# Load the sentence encoder; ENCODER_BACKEND=onnx-int8 skips PyTorch entirely
+model = load_encoder()
+
+# BM25 index over titles, abstracts, claims and assignees; postings are memory-mapped
+lexical_index = LexicalIndex()
+# Full patent records, read straight from their compressed segment
+patent_store = SegmentStore()
+
+# Coalesces concurrent searches into one encode and one ChromaDB query
+query_batcher = QueryBatcher(model, collection)
+
+# Normalized query -> embedding, and (query, k, filters) -> hits for the current collection version
+embedding_cache = LRUCache(maxsize=10000, ttl=24 * 3600)
+result_cache = LRUCache(maxsize=2000, ttl=600)
+collection_version = {"version": read_version(store.path), "checked_at": time.monotonic()}
 
-# Load BERT model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+def current_collection_version():
+    """Return the store version, clearing cached results once ingestion has written new data"""
+    now = time.monotonic()
+    if now - collection_version["checked_at"] >= VERSION_CHECK_INTERVAL:
+        collection_version["checked_at"] = now
+        version = read_version(store.path)
+        if version != collection_version["version"]:
+            collection_version["version"] = version
+            result_cache.clear()
+        if lexical_index.reload_if_changed():
+            result_cache.clear()
+    return collection_version["version"]
 
 @app.get("/")
 def serve_homepage():
     return FileResponse("static/index.html")  # Serve the HTML file
 
 @app.get("/search")
-def search(query: str = Query(..., description="Search query text")):
-    # Compute query embedding
-    query_embedding = model.encode([query])[0].tolist()
-
-    # Perform search in ChromaDB
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=3  # Return top 5 results
-    )
+async def search(query: str = Query(..., description="Search query text"),
+                 fields: Optional[str] = Query(None, description="Comma-separated hit fields to return"),
+                 k: int = Query(TOP_K, ge=1, le=MAX_K, description="Number of patents to return"),
+                 offset: int = Query(0, ge=0, le=MAX_OFFSET, description="Number of patents to skip, see next_offset"),
+                 assignee: Optional[str] = Query(None, description="Only patents with exactly this assignee"),
+                 filed_after: Optional[str] = Query(None, description="Only patents filed on or after YYYY-MM-DD"),
+                 filed_before: Optional[str] = Query(None, description="Only patents filed on or before YYYY-MM-DD"),
+                 mode: str = Query("vector", description="vector, lexical, or hybrid (both fused by reciprocal rank)")):
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    start = time.perf_counter()
+    hit_fields = parse_fields(fields)
+    where = build_where(assignee, filed_after, filed_before)
+    normalized = normalize_query(query)
+    n_patents = offset + k
+    # Checking for new data may reload the lexical index from disk, keep it off the event loop
+    version = await run_in_threadpool(current_collection_version)
+    cache_key = (normalized, n_patents, json.dumps(where, sort_keys=True), mode, version)
+
+    hits = result_cache.get(cache_key)
+    if hits is not None:
+        SEARCH_CACHE_HITS.inc(mode)
+    else:
+        # Hybrid mode fuses deeper candidate lists from both sides
+        depth = n_patents * 2 if mode == "hybrid" else n_patents
+        vector_hits = []
+        lexical_hits = []
+        if mode != "lexical":
+            vector_hits = await vector_search(normalized, depth, where)
+        if mode != "vector":
+            lexical_hits = await run_in_threadpool(
+                lexical_search, normalized, depth, assignee, filed_after, filed_before
+            )
+        if mode == "hybrid":
+            hits = reciprocal_rank_fusion([vector_hits, lexical_hits])[:n_patents]
+        else:
+            hits = vector_hits if mode == "vector" else lexical_hits
+        result_cache.set(cache_key, hits)
 
     # Format response
+    page = hits[offset:offset + k]
+    next_offset = offset + k if len(hits) == n_patents and offset + k <= MAX_OFFSET else None
+    SEARCH_SECONDS.observe(mode, value=time.perf_counter() - start)
+    return {
+        "query": query,
+        "results": [project_hit(hit, hit_fields) for hit in page],
+        "next_offset": next_offset,
+    }
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the query embedding and result caches"""
+    return {
+        "collection_version": collection_version["version"],
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Search latency and cache counters in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/patents/{publication_number}")
+def get_patent(publication_number: str):
+    """Return the full stored record of one patent"""
+    if not re.fullmatch(r"[A-Z0-9]+", publication_number):
+        raise HTTPException(status_code=400, detail="Invalid publication number")
+    record = patent_store.get_bytes(publication_number)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Patent not found")
+    return Response(record, media_type="application/json")
+
+async def vector_search(normalized, n_patents, where):
+    """Nearest passages for the query, grouped into one hit per patent"""
+    # Embed the query (unless cached) and search ChromaDB together with concurrent requests;
+    # the filters run inside the index query
+    embedding, results = await query_batcher.search(
+        normalized,
+        n_results=n_patents * PASSAGES_PER_PATENT,
+        where=where,
+        embedding=embedding_cache.get(normalized)
+    )
+    embedding_cache.set(normalized, embedding)
+    return group_passage_hits(results, n_patents)
+
+def lexical_search(normalized, n_patents, assignee, filed_after, filed_before):
+    """BM25 hits for the query, shaped like the vector hits"""
+    matches = lexical_index.search(
+        normalized,
+        n_patents,
+        assignee=assignee,
+        min_day=parse_date(filed_after, "filed_after") if filed_after else None,
+        max_day=parse_date(filed_before, "filed_before") if filed_before else None
+    )
+    return [
+        {
+            "publication_number": meta["publication_number"],
+            "title": meta["title"],
+            "assignee": meta["assignee"],
+            "filing_date": meta["filing_date"],
+            "ipfs_hash": meta["ipfs_hash"],
+            "score": score,
+            "section": "lexical",
+            "snippet": meta["snippet"],
+        }
+        for meta, score in matches
+    ]
+
+def reciprocal_rank_fusion(rankings):
+    """Merge ranked hit lists, scoring each patent by the sum of 1 / (RRF_K + rank)"""
+    fused = {}
+    for hits in rankings:
+        for rank, hit in enumerate(hits, start=1):
+            patent_no = hit["publication_number"]
+            if patent_no not in fused:
+                # Keep the first (vector) hit's passage snippet when both sides found the patent
+                fused[patent_no] = dict(hit, score=0.0)
+            fused[patent_no]["score"] += 1 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+def parse_date(value, name):
+    """Parse a YYYY-MM-DD query parameter into the YYYYMMDD int stored as filing_day"""
+    try:
+        return int(datetime.strptime(value, "%Y-%m-%d").strftime("%Y%m%d"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a YYYY-MM-DD date")
+
+def build_where(assignee, filed_after, filed_before):
+    """Translate the search filters into a ChromaDB where clause, None when unfiltered"""
+    clauses = []
+    if assignee:
+        clauses.append({"assignee": assignee})
+    if filed_after:
+        clauses.append({"filing_day": {"$gte": parse_date(filed_after, "filed_after")}})
+    if filed_before:
+        clauses.append({"filing_day": {"$lte": parse_date(filed_before, "filed_before")}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def parse_fields(fields):
+    """Validate a comma-separated fields= projection, None means every field"""
+    if not fields:
+        return HIT_FIELDS
+    hit_fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in hit_fields if field not in HIT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return hit_fields
+
+def project_hit(hit, hit_fields):
+    """Keep only the requested fields of a hit"""
+    return {field: hit[field] for field in hit_fields}
+
+def group_passage_hits(results, k):
+    """Collapse passage hits into one lightweight hit per patent, ranked by its best passage"""
     documents = results.get("documents", [[]])[0]
-    return {"query": query, "results": documents}
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = results.get("distances", [[]])[0]
+
+    # Hits come back sorted by distance, so the first passage seen is the best
+    patents = {}
+    for text, metadata, distance in zip(documents, metadatas, distances):
+        patent_no = metadata["publication_number"]
+        if patent_no in patents:
+            continue
+        patents[patent_no] = {
+            "publication_number": patent_no,
+            "title": metadata.get("title", ""),
+            "assignee": metadata.get("assignee", ""),
+            "filing_date": metadata.get("filing_date", ""),
+            "ipfs_hash": metadata.get("ipfs_hash", ""),
+            "score": 1 - distance,
+            "section": metadata["section"],
+            "snippet": text[:SNIPPET_CHARS],
+        }
+        if len(patents) == k:
+            break
+    return list(patents.values())
 
 
 
@@ -0,0 +1,123 @@
+"""
+Compare the sentence encoder backends (PyTorch, ONNX, ONNX int8) on cold
+start, memory and encode speed. Each backend runs in a fresh process, so
+the cold start includes importing its libraries and peak RSS is its own.
+
+    python encoders.py export
+    python -m benchmarks.bench_encoders --backends torch,onnx,onnx-int8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.bench_pipeline import FIXTURES_DIR, REPO_ROOT, RESULTS_DIR, load_pages, peak_rss_mb, percentile
+
+QUERIES = 200
+PASSAGES = 512
+BATCH_SIZE = 64
+
+
+def fixture_texts(pages_dir, passages):
+    """Query-sized and passage-sized texts cut from the fixture pages"""
+    from html_extract import extract_patent_fields
+    from chunking import chunk_patent
+
+    texts = []
+    for html in load_pages(pages_dir):
+        patent_data = extract_patent_fields(html)
+        patent_data["inventions"] = [patent_data.pop("claims_text") or ""]
+        texts.extend(passage["text"] for passage in chunk_patent(patent_data))
+    if not texts:
+        raise SystemExit(f"No passages in the pages of {pages_dir}")
+    passage_texts = [texts[i % len(texts)] for i in range(passages)]
+    # Queries: the first few words of each passage
+    query_texts = [" ".join(text.split()[2 + i % 5:6 + i % 9]) for i, text in enumerate(texts)]
+    return query_texts, passage_texts
+
+
+def run_backend(backend, pages_dir, queries, passages, batch_size):
+    query_texts, passage_texts = fixture_texts(pages_dir, passages)
+
+    start = time.perf_counter()
+    from encoders import load_encoder
+    model = load_encoder(backend)
+    model.encode(["warm up"])
+    cold_start = time.perf_counter() - start
+    rss_loaded = peak_rss_mb()
+
+    latencies = []
+    for i in range(queries):
+        query_start = time.perf_counter()
+        model.encode([query_texts[i % len(query_texts)]], batch_size=1)
+        latencies.append(time.perf_counter() - query_start)
+
+    start = time.perf_counter()
+    model.encode(passage_texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "cold_start_s": round(cold_start, 3),
+        "rss_after_load_mb": rss_loaded,
+        "query_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "query_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "passages_per_s": round(len(passage_texts) / batch_seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8", help="Comma-separated encoder backends")
+    parser.add_argument("--pages", default=FIXTURES_DIR, help="Directory of patent pages (*.html) to cut texts from")
+    parser.add_argument("--queries", type=int, default=QUERIES, help="Single-query encodes timed per backend")
+    parser.add_argument("--passages", type=int, default=PASSAGES, help="Passages encoded in the batch run")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Passages per encode batch")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/encoders-<time>.json)")
+    parser.add_argument("--single", metavar="RESULTS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pages_dir = os.path.abspath(args.pages)
+    if args.single:
+        result = run_backend(args.backends, pages_dir, args.queries, args.passages, args.batch_size)
+        with open(args.single, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for backend in [backend for backend in args.backends.split(",") if backend]:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_path = f.name
+        command = [sys.executable, "-m", "benchmarks.bench_encoders", "--backends", backend,
+                   "--pages", pages_dir, "--queries", str(args.queries), "--passages", str(args.passages),
+                   "--batch-size", str(args.batch_size), "--single", result_path]
+        try:
+            subprocess.run(command, cwd=REPO_ROOT, check=True)
+            with open(result_path, "r") as f:
+                result = json.load(f)
+        finally:
+            os.remove(result_path)
+        results.append(result)
+        print(f"{backend:10s} cold start {result['cold_start_s']:6.2f} s  "
+              f"RSS {result['rss_after_load_mb']} MB loaded, {result['peak_rss_mb']} MB peak  "
+              f"query p50 {result['query_p50_ms']:.2f} ms p99 {result['query_p99_ms']:.2f} ms  "
+              f"{result['passages_per_s']:.1f} passages/s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"encoders-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "config": {"queries": args.queries, "passages": args.passages, "batch_size": args.batch_size},
+            "results": results,
+        }, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
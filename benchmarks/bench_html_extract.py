@@ -0,0 +1,104 @@
+"""
+Compare the single-pass lxml extractor with the previous BeautifulSoup +
+html2text extraction on saved Google Patents pages.
+
+The metadata fields are compared with runs of whitespace collapsed, since
+the two parsers keep the source's indentation differently. claims_text and
+patent_text are not compared: the lxml extractor returns plain text lines,
+without html2text's Markdown ("## Claims", "1\\." escapes).
+
+    python -m benchmarks.bench_html_extract --pages saved_pages --download 20
+    python -m benchmarks.bench_html_extract --pages saved_pages --repeat 5
+"""
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+from html_extract import extract_patent_fields, extract_patent_fields_bs4
+
+# Fields that should have the same text, up to whitespace, from both extractors
+COMPARED_FIELDS = ("patent_title", "abstract", "inventor_name", "assignee_name", "filing_date")
+
+
+def normalize(value):
+    return " ".join(value.split()) if isinstance(value, str) else value
+
+
+def download_pages(pages_dir, count, urls_file="patent_urls.txt"):
+    """Save the first count patent pages from the URL list for offline runs"""
+    os.makedirs(pages_dir, exist_ok=True)
+    session = requests.Session()
+    with open(urls_file, "r") as f:
+        urls = [line.strip() for line in f if line.strip()][:count]
+    for url in urls:
+        path = os.path.join(pages_dir, url.rstrip("/").rsplit("/", 1)[-1] + ".html")
+        if os.path.exists(path):
+            continue
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            f.write(response.content)
+        print(f"Saved {url} -> {path}")
+        time.sleep(2)
+
+
+def time_extractor(extract, pages, repeat):
+    """Return per-page timings in milliseconds and the last results"""
+    timings = []
+    results = {}
+    for _ in range(repeat):
+        for name, html in pages.items():
+            start = time.perf_counter()
+            results[name] = extract(html)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="benchmarks/pages", help="Directory of saved patent pages (*.html)")
+    parser.add_argument("--download", type=int, default=0, help="First save this many pages from patent_urls.txt")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each page is extracted")
+    args = parser.parse_args()
+
+    if args.download:
+        download_pages(args.pages, args.download)
+
+    pages = {}
+    for filename in sorted(os.listdir(args.pages)):
+        if filename.endswith(".html"):
+            with open(os.path.join(args.pages, filename), "rb") as f:
+                pages[filename] = f.read()
+    if not pages:
+        print(f"No .html pages in {args.pages}, use --download to save some")
+        return
+    total_mb = sum(len(html) for html in pages.values()) / 1e6
+    print(f"{len(pages)} pages, {total_mb:.1f} MB, {args.repeat} repeats")
+
+    bs4_timings, bs4_results = time_extractor(
+        lambda html: extract_patent_fields_bs4(html.decode("utf-8", errors="replace")), pages, args.repeat
+    )
+    lxml_timings, lxml_results = time_extractor(extract_patent_fields, pages, args.repeat)
+
+    for label, timings in (("bs4 + html2text", bs4_timings), ("lxml single pass", lxml_timings)):
+        print(f"{label:18s} mean {statistics.mean(timings):8.1f} ms/page  "
+              f"median {statistics.median(timings):8.1f} ms/page")
+    print(f"Speedup: {statistics.mean(bs4_timings) / statistics.mean(lxml_timings):.1f}x")
+
+    mismatches = [
+        (name, field)
+        for name in pages
+        for field in COMPARED_FIELDS
+        if normalize(bs4_results[name][field]) != normalize(lxml_results[name][field])
+    ]
+    for name, field in mismatches:
+        print(f"Mismatch in {name} {field}: {bs4_results[name][field]!r} != {lxml_results[name][field]!r}")
+    if not mismatches:
+        print(f"All {len(COMPARED_FIELDS)} metadata fields match on every page")
+
+
+if __name__ == "__main__":
+    main()
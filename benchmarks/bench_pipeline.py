@@ -0,0 +1,375 @@
+"""
+Offline benchmark of every ingestion and search stage, on a laptop without
+network access or an IPFS daemon.
+
+Patent pages are served from benchmarks/fixtures/pages (hand-built pages in
+Google Patents markup; --pages takes a directory of real saved pages, see
+bench_html_extract --download) by a local HTTP server, IPFS is the in-memory
+stub from ipfs_stub.py, and ChromaDB, the lexical index, patent_store/ and
+html_cache/ live in a temporary directory. A corpus of N patents cycles
+through the fixture pages under distinct publication numbers.
+
+Per stage it reports throughput, p50/p99 latency per call and the process's
+peak RSS so far, and writes everything to benchmarks/results/<time>.json.
+
+    python -m benchmarks.bench_pipeline --sizes 100,1000
+    python -m benchmarks.bench_pipeline --sizes 100 --compare benchmarks/results/20240101-120000.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The stages run inside a temporary directory, so the modules are imported from an absolute path
+sys.path.insert(0, REPO_ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIXTURES_DIR = os.path.join(REPO_ROOT, "benchmarks", "fixtures", "pages")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+SIZES = (100,)
+QUERIES = 200
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+EMBED_BATCH_SIZE = 64
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None where it is not available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class StageTimer:
+    """Collect per-call latencies of one stage and summarise them"""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.latencies = []
+        self.elapsed = 0.0
+
+    def call(self, func, *args, items=1):
+        start = time.perf_counter()
+        result = func(*args)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.elapsed += latency
+        self.items += items
+        return result
+
+    def summary(self):
+        return {
+            "unit": self.unit,
+            "items": self.items,
+            "calls": len(self.latencies),
+            "seconds": round(self.elapsed, 4),
+            "throughput": round(self.items / self.elapsed, 2) if self.elapsed else None,
+            "p50_ms": round(percentile(self.latencies, 0.50) * 1000, 3) if self.latencies else None,
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 3) if self.latencies else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def load_pages(pages_dir):
+    pages = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith(".html"):
+            with open(os.path.join(pages_dir, filename), "rb") as f:
+                pages.append(f.read())
+    if not pages:
+        raise SystemExit(f"No .html pages in {pages_dir}")
+    return pages
+
+
+def start_page_server(pages):
+    """Serve /patent/<number>/en from the fixture pages; returns (server, base url)"""
+    etags = [f'"{hashlib.sha256(page).hexdigest()[:16]}"' for page in pages]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = 1 << 16
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            patent_no = self.path.strip("/").split("/")[1] if self.path.startswith("/patent/") else ""
+            digits = "".join(c for c in patent_no if c.isdigit())
+            if not digits:
+                self.send_error(404)
+                return
+            body = pages[int(digits) % len(pages)]
+            etag = etags[int(digits) % len(pages)]
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_queries(patents, count):
+    """Search queries made of title words and phrases from the corpus"""
+    queries = []
+    titles = list(dict.fromkeys(patent["patent_title"] for patent in patents))
+    i = 0
+    while titles and len(queries) < count:
+        words = titles[i % len(titles)].split()
+        width = 2 + i % 4
+        start = (i // len(titles)) % max(1, len(words) - width + 1)
+        queries.append(" ".join(words[start:start + width]))
+        i += 1
+    return queries
+
+
+def run_size(size, pages_dir, queries, search_modes, batch_size, ipfs_latency_ms):
+    """Run every stage on a corpus of size patents inside a temporary directory"""
+    from ipfs_stub import start_stub
+    from ipfs_handler import IPFSHandler
+    from chunking import chunk_patent
+    from chroma_store import ChromaStore
+    from lexical_index import LexicalIndex
+    import working
+
+    stages = {}
+    pages = load_pages(pages_dir)
+    page_server, base_url = start_page_server(pages)
+    ipfs_server, _, api_url = start_stub(latency=ipfs_latency_ms / 1000)
+    workdir = tempfile.mkdtemp(prefix="patent_bench_")
+    os.chdir(workdir)
+    # app.py serves its homepage from ./static
+    os.symlink(os.path.join(REPO_ROOT, "static"), os.path.join(workdir, "static"), target_is_directory=True)
+    print(f"\n{size} patents in {workdir}")
+
+    try:
+        # Fetch + extract, i.e. clean_html_content over a local HTTP connection
+        timer = StageTimer("fetch_extract", "pages")
+        patents = []
+        for i in range(size):
+            url = f"{base_url}/patent/US{20000000 + i}B2/en"
+            patent_data = timer.call(working.extract_patent_info_with_llm, url)
+            if patent_data:
+                patents.append(patent_data)
+        stages[timer.name] = timer.summary()
+
+        # The same pages again: conditional requests answered 304 from the HTML cache
+        timer = StageTimer("fetch_revalidate", "pages")
+        for i in range(size):
+            timer.call(working.extract_patent_info_with_llm, f"{base_url}/patent/US{20000000 + i}B2/en")
+        stages[timer.name] = timer.summary()
+
+        # Offline re-extraction of every cached page, as working.py --reparse-from-cache
+        timer = StageTimer("reparse_cache", "pages")
+        for url, content in working.get_html_cache().iter_pages():
+            timer.call(lambda: working.build_patent_info(url, working.extract_patent_fields(content)))
+        stages[timer.name] = timer.summary()
+
+        timer = StageTimer("ipfs_upload", "patents")
+        with IPFSHandler(ipfs_api_url=api_url) as ipfs_handler:
+            for patent_data in patents:
+                patent_data["ipfs_hash"] = timer.call(
+                    ipfs_handler.save_and_upload, patent_data, patent_data["publication_number"]
+                )
+        stages[timer.name] = timer.summary()
+
+        timer = StageTimer("chunk", "patents")
+        passages = []
+        for patent_data in patents:
+            passages.extend(timer.call(chunk_patent, patent_data))
+        stages[timer.name] = timer.summary()
+
+        working.model.encode(["warm up"])
+        timer = StageTimer("embed", "passages")
+        embeddings = []
+        for start in range(0, len(passages), batch_size):
+            texts = [passage["text"] for passage in passages[start:start + batch_size]]
+            embeddings.extend(timer.call(
+                lambda: asyncio.run(working.generate_embeddings(texts, batch_size=batch_size)), items=len(texts)
+            ))
+        stages[timer.name] = timer.summary()
+
+        timer = StageTimer("chroma_store", "passages")
+        with ChromaStore() as store:
+            for start in range(0, len(passages), batch_size):
+                batch = passages[start:start + batch_size]
+                timer.call(
+                    lambda: asyncio.run(working.store_in_chromadb(batch, embeddings[start:start + batch_size], store)),
+                    items=len(batch)
+                )
+        stages[timer.name] = timer.summary()
+
+        timer = StageTimer("lexical_index", "patents")
+        lexical_index = LexicalIndex()
+        for patent_data in patents:
+            timer.call(lexical_index.add, patent_data)
+        timer.call(lexical_index.flush, items=0)
+        lexical_index.close()
+        stages[timer.name] = timer.summary()
+
+        if search_modes and queries:
+            stages.update(run_search(make_queries(patents, queries), search_modes))
+    finally:
+        working.close_html_cache()
+        os.chdir(REPO_ROOT)
+        page_server.shutdown()
+        ipfs_server.shutdown()
+
+    for name, stage in stages.items():
+        print(f"{name:16s} {stage['throughput'] or 0:10.1f} {stage['unit']}/s  "
+              f"p50 {stage['p50_ms'] or 0:9.2f} ms  p99 {stage['p99_ms'] or 0:9.2f} ms  "
+              f"peak RSS {stage['peak_rss_mb']} MB")
+    return {"size": size, "patents": len(patents), "passages": len(passages), "stages": stages}
+
+
+def run_search(queries, search_modes):
+    """Time /search through the ASGI app, with its caches cleared before every request"""
+    from fastapi.testclient import TestClient
+    import app as app_module
+
+    stages = {}
+    with TestClient(app_module.app) as client:
+        client.get("/search", params={"query": "warm up"})
+        for mode in search_modes:
+            timer = StageTimer(f"search_{mode}", "queries")
+            for query in queries:
+                app_module.result_cache.clear()
+                app_module.embedding_cache.clear()
+                response = timer.call(
+                    lambda: client.get("/search", params={"query": query, "mode": mode, "k": 10})
+                )
+                response.raise_for_status()
+            stages[timer.name] = timer.summary()
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the throughput of each stage relative to an earlier results file"""
+    with open(baseline_path, "r") as f:
+        baseline = {run["size"]: run["stages"] for run in json.load(f)["runs"]}
+    print(f"\nCompared with {baseline_path}:")
+    for run in results["runs"]:
+        old_stages = baseline.get(run["size"])
+        if not old_stages:
+            print(f"{run['size']} patents: not in the baseline")
+            continue
+        for name, stage in run["stages"].items():
+            old = old_stages.get(name)
+            if old and old["throughput"] and stage["throughput"]:
+                print(f"{run['size']:>6} {name:16s} {stage['throughput'] / old['throughput']:6.2f}x throughput, "
+                      f"p99 {old['p99_ms']:.2f} -> {stage['p99_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="Comma-separated corpus sizes; each runs in a fresh process and directory")
+    parser.add_argument("--pages", default=FIXTURES_DIR, help="Directory of patent pages (*.html)")
+    parser.add_argument("--queries", type=int, default=QUERIES, help="Search queries per mode")
+    parser.add_argument("--search-modes", default=",".join(SEARCH_MODES),
+                        help="Comma-separated /search modes to time, empty to skip search")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Passages per embed/store call")
+    parser.add_argument("--ipfs-latency-ms", type=float, default=0.0,
+                        help="Delay the stub IPFS API adds to every call, to mimic a real daemon")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", metavar="RESULTS", help="Earlier results file to compare throughput with")
+    parser.add_argument("--single", metavar="RESULTS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pages_dir = os.path.abspath(args.pages)
+    search_modes = [mode for mode in args.search_modes.split(",") if mode]
+
+    if args.single:
+        # One corpus size in this process, so peak RSS is per size
+        run = run_size(int(args.sizes), pages_dir, args.queries, search_modes, args.batch_size,
+                       args.ipfs_latency_ms)
+        with open(args.single, "w") as f:
+            json.dump(run, f)
+        return
+
+    runs = []
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            run_path = f.name
+        command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--sizes", str(size),
+                   "--pages", pages_dir, "--queries", str(args.queries),
+                   "--search-modes", ",".join(search_modes), "--batch-size", str(args.batch_size),
+                   "--ipfs-latency-ms", str(args.ipfs_latency_ms), "--single", run_path]
+        try:
+            subprocess.run(command, cwd=REPO_ROOT, check=True)
+            with open(run_path, "r") as f:
+                runs.append(json.load(f))
+        finally:
+            os.remove(run_path)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "pages": pages_dir,
+            "queries": args.queries,
+            "search_modes": search_modes,
+            "batch_size": args.batch_size,
+            "ipfs_latency_ms": args.ipfs_latency_ms,
+        },
+        "runs": runs,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
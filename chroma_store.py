@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+
+import chromadb
+
+from chunking import content_hash
+from segment_store import SegmentStore, STORE_DIR
+
+CHROMA_PATH = "./chromadb_store"
+# One record per passage, see chunking.chunk_patent
+COLLECTION_NAME = "patent_passages"
+# Whole-patent JSON documents under random uuid ids, written before passages existed
+LEGACY_COLLECTION_NAME = "patents_collection"
+PAGE_SIZE = 1000  # Records read per collection.get call when scanning a collection
+# Rewritten after every write so other processes (the API's result cache) notice new data
+VERSION_FILE = "collection_version"
+
+
+class ChromaStore:
+    """
+    Long-lived ChromaDB client and collection for one process.
+
+    Opening a PersistentClient reloads the SQLite and HNSW files, so the
+    ingestion run creates one store up front, sends every write through it
+    and closes it once at shutdown.
+    """
+
+    def __init__(self, path: str = CHROMA_PATH, collection_name: str = COLLECTION_NAME):
+        self.path = path
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            collection_name,
+            metadata={"hnsw:space": "cosine"},
+            embedding_function=None
+        )
+        self.documents_written = 0
+
+    def upsert(self, ids, embeddings, documents, metadatas=None):
+        """Insert or replace a batch of documents in a single ChromaDB call"""
+        kwargs = {"ids": ids, "embeddings": embeddings, "documents": documents}
+        if metadatas is not None:
+            kwargs["metadatas"] = metadatas
+        self.collection.upsert(**kwargs)
+        self.documents_written += len(ids)
+        bump_version(self.path)
+
+    def stored_hashes(self, patent_numbers):
+        """Return {publication_number: content_hash} for the patents already stored"""
+        if not patent_numbers:
+            return {}
+        # Every stored section has a passage at offset 0, which is enough to read the hash
+        records = self.collection.get(
+            where={"$and": [
+                {"publication_number": {"$in": list(patent_numbers)}},
+                {"offset": 0},
+            ]},
+            include=["metadatas"]
+        )
+        return {
+            metadata["publication_number"]: metadata.get("content_hash", "")
+            for metadata in records["metadatas"]
+        }
+
+    def delete_stale(self, patent_hashes):
+        """Delete passages of the given patents that belong to an older content hash"""
+        if not patent_hashes:
+            return
+        self.collection.delete(where={"$and": [
+            {"publication_number": {"$in": list(patent_hashes)}},
+            {"content_hash": {"$nin": list(set(patent_hashes.values()))}},
+        ]})
+        bump_version(self.path)
+
+    def close(self):
+        """Release the client so the SQLite and HNSW files are flushed and closed"""
+        if self.client is None:
+            return
+        try:
+            self.client.clear_system_cache()
+        finally:
+            self.client = None
+            self.collection = None
+        print(f"Closed ChromaDB store at {self.path} ({self.documents_written} documents written)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def bump_version(path: str = CHROMA_PATH):
+    """Record that the store changed by writing a new version stamp"""
+    version_path = os.path.join(path, VERSION_FILE)
+    tmp_path = f"{version_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, version_path)
+
+
+def read_version(path: str = CHROMA_PATH) -> str:
+    """Return the store's current version stamp, empty if it was never written to"""
+    try:
+        with open(os.path.join(path, VERSION_FILE), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def iter_records(collection, include):
+    """Yield (id, record fields) for every record in a collection, one page at a time"""
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            return
+        for i, record_id in enumerate(page["ids"]):
+            yield record_id, {field: page[field][i] for field in include}
+        offset += len(page["ids"])
+
+
+def delete_ids(collection, ids):
+    for start in range(0, len(ids), PAGE_SIZE):
+        collection.delete(ids=ids[start:start + PAGE_SIZE])
+
+
+def dedupe_legacy_collection(client):
+    """Keep one whole-patent document per publication number in the legacy collection"""
+    try:
+        collection = client.get_collection(LEGACY_COLLECTION_NAME, embedding_function=None)
+    except Exception:
+        print(f"No {LEGACY_COLLECTION_NAME} collection, nothing to dedupe")
+        return 0
+
+    seen = set()
+    duplicates = []
+    for record_id, record in iter_records(collection, ["documents"]):
+        try:
+            patent_no = json.loads(record["documents"]).get("publication_number")
+        except (TypeError, ValueError):
+            continue
+        if not patent_no:
+            continue
+        if patent_no in seen:
+            duplicates.append(record_id)
+        else:
+            seen.add(patent_no)
+
+    delete_ids(collection, duplicates)
+    print(f"{LEGACY_COLLECTION_NAME}: kept {len(seen)} patents, deleted {len(duplicates)} duplicates")
+    return len(duplicates)
+
+
+def dedupe_passage_collection(collection, store_dir=STORE_DIR):
+    """
+    Delete passages left behind by an older version of a patent.
+
+    A patent whose passages carry more than one content hash keeps the ones
+    matching its current record in the patent store; without a local record they are
+    all kept.
+    """
+    ids_by_patent = defaultdict(lambda: defaultdict(list))
+    for record_id, record in iter_records(collection, ["metadatas"]):
+        metadata = record["metadatas"]
+        ids_by_patent[metadata["publication_number"]][metadata.get("content_hash", "")].append(record_id)
+
+    stale = []
+    with SegmentStore(store_dir) as patent_store:
+        for patent_no, ids_by_hash in ids_by_patent.items():
+            if len(ids_by_hash) < 2:
+                continue
+            patent_data = patent_store.get(patent_no)
+            if patent_data is None:
+                continue
+            current_hash = content_hash(patent_data)
+            if current_hash not in ids_by_hash:
+                continue
+            for stored_hash, ids in ids_by_hash.items():
+                if stored_hash != current_hash:
+                    stale.extend(ids)
+
+    delete_ids(collection, stale)
+    print(f"{collection.name}: {len(ids_by_patent)} patents, deleted {len(stale)} stale passages")
+    return len(stale)
+
+
+def rebuild_collection(client, name):
+    """Copy the live records of a collection into a fresh HNSW index and swap it in"""
+    collection = client.get_collection(name, embedding_function=None)
+    rebuilt_name = f"{name}_rebuilt"
+    rebuilt = client.get_or_create_collection(
+        rebuilt_name,
+        metadata=collection.metadata,
+        embedding_function=None
+    )
+
+    ids, batch = [], defaultdict(list)
+    include = ["embeddings", "documents", "metadatas"]
+    for record_id, record in iter_records(collection, include):
+        ids.append(record_id)
+        for field in include:
+            batch[field].append(record[field])
+        if len(ids) == PAGE_SIZE:
+            rebuilt.add(ids=ids, **batch)
+            ids, batch = [], defaultdict(list)
+    if ids:
+        rebuilt.add(ids=ids, **batch)
+
+    client.delete_collection(name)
+    rebuilt.modify(name=name)
+    print(f"Rebuilt {name} with {rebuilt.count()} records")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove duplicate vectors from the ChromaDB store")
+    parser.add_argument("--path", default=CHROMA_PATH, help="ChromaDB store directory")
+    parser.add_argument("--store", default=STORE_DIR, help="Directory of the patent segment store")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Also rebuild the deduplicated collections to drop deleted vectors from the index")
+    args = parser.parse_args()
+
+    with ChromaStore(path=args.path) as store:
+        dedupe_legacy_collection(store.client)
+        dedupe_passage_collection(store.collection, args.store)
+        if args.rebuild:
+            for name in (LEGACY_COLLECTION_NAME, COLLECTION_NAME):
+                try:
+                    rebuild_collection(store.client, name)
+                except Exception as e:
+                    print(f"Could not rebuild {name}: {e}")
+        bump_version(args.path)
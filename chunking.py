@@ -0,0 +1,99 @@
+import hashlib
+import json
+from typing import Dict, Iterator, List, Tuple
+
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces, so passages are
+# kept comfortably below that in whitespace-separated words.
+CHUNK_WORDS = 160  # Words per passage
+CHUNK_OVERLAP = 32  # Words shared between consecutive passages
+
+# Bump when the passage metadata layout changes so stored patents are re-written
+METADATA_VERSION = 2
+
+# Passage section name -> patent_data field it is cut from
+SECTIONS = (
+    ("abstract", "abstract"),
+    ("claims", "inventions"),
+    ("description", "patent_text"),
+)
+
+
+def split_passages(text: str, chunk_words: int = CHUNK_WORDS,
+                   overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, str]]:
+    """Yield (word_offset, passage) windows of chunk_words words with overlap"""
+    words = text.split()
+    if not words:
+        return
+    step = max(chunk_words - overlap, 1)
+    for offset in range(0, len(words), step):
+        yield offset, " ".join(words[offset:offset + chunk_words])
+        if offset + chunk_words >= len(words):
+            break
+
+
+def section_text(patent_data: Dict, field: str) -> str:
+    """Return a patent field as plain text, skipping the 'N/A' placeholders"""
+    value = patent_data.get(field) or ""
+    if isinstance(value, list):
+        value = "\n".join(str(item) for item in value)
+    return "" if value == "N/A" else value
+
+
+def filing_day(filing_date: str) -> int:
+    """Turn a YYYY-MM-DD filing date into a YYYYMMDD int ChromaDB can range-filter, 0 if unknown"""
+    digits = filing_date.replace("-", "")
+    return int(digits) if len(digits) == 8 and digits.isdigit() else 0
+
+
+def content_hash(patent_data: Dict, chunk_words: int = CHUNK_WORDS,
+                 overlap: int = CHUNK_OVERLAP) -> str:
+    """Hash everything that ends up in a patent's passages and their metadata"""
+    digest = hashlib.sha256(f"{METADATA_VERSION}:{chunk_words}:{overlap}".encode())
+    for field in ("patent_title", "abstract", "inventions", "patent_text",
+                  "assignee_name", "filing_date", "ipfs_hash"):
+        digest.update(b"\0")
+        digest.update(json.dumps(patent_data.get(field), ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chunk_patent(patent_data: Dict, chunk_words: int = CHUNK_WORDS,
+                 overlap: int = CHUNK_OVERLAP) -> List[Dict]:
+    """
+    Split a patent's abstract, claims and description into overlapping passages.
+
+    Each passage is a dict with a stable id, the passage text and the
+    metadata stored with its embedding: the passage's section and word
+    offset plus the patent fields /search returns without loading the
+    full record, and the patent's content hash so unchanged patents can
+    be skipped on re-ingestion.
+    """
+    patent_no = patent_data.get("publication_number", "")
+    title = section_text(patent_data, "patent_title")
+    patent_metadata = {
+        "publication_number": patent_no,
+        "title": title,
+        "assignee": section_text(patent_data, "assignee_name"),
+        "filing_date": section_text(patent_data, "filing_date"),
+        "filing_day": filing_day(section_text(patent_data, "filing_date")),
+        "ipfs_hash": patent_data.get("ipfs_hash") or "",
+        "content_hash": content_hash(patent_data, chunk_words, overlap),
+    }
+    passages = []
+
+    for section, field in SECTIONS:
+        text = section_text(patent_data, field)
+        for offset, passage in split_passages(text, chunk_words, overlap):
+            if section == "abstract" and title:
+                # The title is short, so it rides along with the abstract passages
+                passage = f"{title}\n{passage}"
+            passages.append({
+                "id": f"{patent_no}:{section}:{offset}",
+                "text": passage,
+                "metadata": {
+                    **patent_metadata,
+                    "section": section,
+                    "offset": offset,
+                },
+            })
+
+    return passages
@@ -0,0 +1,237 @@
+import argparse
+import inspect
+import json
+import os
+import sys
+from typing import List, Union
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch" (sentence-transformers), "onnx" or "onnx-int8"; set ENCODER_BACKEND in .env
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_MODEL_DIR = os.path.join("models", f"{MODEL_NAME}-onnx")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "encoder_config.json"
+# Smallest cosine similarity to the PyTorch vector a backend may produce for any text
+PARITY_MIN_COSINE = {"onnx": 0.9999, "onnx-int8": 0.99}
+
+PARITY_TEXTS = [
+    "A battery pack with a phase change material between adjacent cells.",
+    "Method for low-latency video encoding using adaptive reference frame selection",
+    "soil moisture sensor",
+    "1. A method of encoding video, comprising: maintaining a pool of candidate reference frames; "
+    "estimating a rate-distortion cost for each candidate; and selecting the frame with the lowest cost.",
+    "wireless charging coil alignment",
+    "The controller increases the coolant flow rate when a temperature difference between any two "
+    "cells exceeds a threshold, and decreases it once the phase change material has solidified.",
+]
+
+
+class OnnxEncoder:
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime: the exported transformer, followed by
+    the same mean pooling and L2 normalisation as the sentence-transformers
+    pipeline, so its vectors can be mixed with the ones already stored in
+    ChromaDB. Needs only onnxruntime and tokenizers, not PyTorch.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantized: bool = False, threads: int = 0):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), "r") as f:
+            config = json.load(f)
+        self.max_seq_length = config["max_seq_length"]
+        self.dimension = config["dimension"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_token = config.get("pad_token", "[PAD]")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = ONNX_INT8_FILE if quantized else ONNX_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.name = f"onnx{'-int8' if quantized else ''}:{MODEL_NAME}"
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean over the real tokens, then unit length, as the sentence-transformers model does
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        embeddings = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               **kwargs) -> np.ndarray:
+        """Same call as SentenceTransformer.encode for the arguments this project uses"""
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        # Batch texts of similar length together so little time goes into padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            embeddings[indices] = self._encode_batch([texts[i] for i in indices])
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(backend: str = None, model_dir: str = ONNX_MODEL_DIR):
+    """
+    Return the configured sentence encoder. The ONNX backends fall back to
+    PyTorch when the exported model is missing (see `python encoders.py export`).
+    """
+    backend = backend or ENCODER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend != "torch":
+        quantized = backend == "onnx-int8"
+        model_file = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if os.path.exists(model_file):
+            return OnnxEncoder(model_dir, quantized=quantized)
+        print(f"{model_file} not found, run `python encoders.py export` first. Using PyTorch instead.")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+
+def export_onnx(model_dir: str = ONNX_MODEL_DIR, quantize: bool = True):
+    """
+    Export the transformer of the sentence-transformers model to ONNX, with
+    its tokenizer, and optionally an int8 dynamically quantized copy. Needs
+    PyTorch (and onnx for quantization) once, on the machine that exports.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    tokenizer = model.tokenizer
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The Hugging Face model called by keyword, returning only the token embeddings"""
+
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.transformer(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    transformer = TokenEmbeddings(model[0].auto_model).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    onnx_path = os.path.join(model_dir, ONNX_FILE)
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter, which newer PyTorch no longer uses by default
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs
+        )
+    print(f"Exported {onnx_path}")
+
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, TOKENIZER_FILE))
+    with open(os.path.join(model_dir, CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": MODEL_NAME,
+            "max_seq_length": model.max_seq_length,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "pad_token": tokenizer.pad_token,
+        }, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(model_dir, ONNX_INT8_FILE)
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {int8_path}")
+
+
+def check_parity(backend: str, texts: List[str] = None, model_dir: str = ONNX_MODEL_DIR):
+    """Compare a backend's vectors with the PyTorch ones; returns (min cosine, mean cosine)"""
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or PARITY_TEXTS
+    reference = SentenceTransformer(MODEL_NAME).encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    candidate = OnnxEncoder(model_dir, quantized=backend == "onnx-int8").encode(texts)
+    cosines = (reference * candidate).sum(axis=1)
+    return float(cosines.min()), float(cosines.mean())
+
+
+def sample_passages(count: int, store_dir: str = "patent_store") -> List[str]:
+    """Passages of saved patents, to check parity on real text"""
+    from chunking import chunk_patent
+    from segment_store import SegmentStore
+
+    texts = []
+    if os.path.isdir(store_dir):
+        with SegmentStore(store_dir) as store:
+            for _, patent_data in store.iter_records():
+                if len(texts) >= count:
+                    break
+                texts.extend(passage["text"] for passage in chunk_patent(patent_data))
+    return texts[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ONNX encoder and check it against PyTorch")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export the model to ONNX (needs PyTorch)")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    export_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parity_parser = subparsers.add_parser("parity", help="Compare ONNX vectors with the PyTorch ones")
+    parity_parser.add_argument("--backend", choices=BACKENDS[1:], action="append",
+                               help="Backend to check (default: both)")
+    parity_parser.add_argument("--passages", type=int, default=200,
+                               help="Also check this many passages of patents in patent_store/")
+    parity_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model_dir, quantize=not args.no_quantize)
+    else:
+        texts = PARITY_TEXTS + sample_passages(args.passages)
+        failed = False
+        for backend in args.backend or BACKENDS[1:]:
+            min_cosine, mean_cosine = check_parity(backend, texts, args.model_dir)
+            ok = min_cosine >= PARITY_MIN_COSINE[backend]
+            failed = failed or not ok
+            print(f"{backend:10s} {len(texts)} texts  min cosine {min_cosine:.6f}  mean {mean_cosine:.6f}  "
+                  f"{'OK' if ok else 'FAIL'} (threshold {PARITY_MIN_COSINE[backend]})")
+        sys.exit(1 if failed else 0)
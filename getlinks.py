@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import re
+import sqlite3
+import threading
 import time
 from dotenv import load_dotenv
 import os
+import requests
+from url_frontier import URLFrontier
+from http_discovery import HTTPDiscovery, DiscoveryError, ThrottledError
+from rate_limiter import HostRateLimiter
+from getlinks_final import create_driver, load_results_page, ThrottleBackoff, iter_pages_with_backoff
 
 # Load environment variables
 load_dotenv()
@@ -15,169 +20,317 @@ load_dotenv()
 PATENTS_FILE = "patent_urls.txt"
 no_of_results = 100
 CHUNK_DAYS = 10  # Number of days to process in each chunk
+BACKFILL_START = datetime(1700, 1, 1)
+# Window length by era: (windows starting before this date, days per window).
+# Early years publish few patents, so their windows are much larger.
+WINDOW_TIERS = [
+    (datetime(1900, 1, 1), 365),
+    (datetime(1976, 1, 1), 90),
+    (None, CHUNK_DAYS),
+]
+WORKERS = 4  # Date windows scraped in parallel
+MIN_REQUEST_INTERVAL = 2.0  # Shared budget: minimum seconds between requests across all workers
+MANIFEST_PATH = "backfill_manifest.db"
+PROGRESS_FILE = "scraping_progress.txt"  # Checkpoint of the old serial backfill
 
-def get_date_chunks():
-    """Generate date chunks from 1700 to present"""
-    start = datetime(1700, 1, 1)
-    end = datetime.now()
+def window_days(start_date):
+    for before, days in WINDOW_TIERS:
+        if before is None or start_date < before:
+            return days
+
+def get_date_chunks(start=BACKFILL_START, end=None):
+    """Generate date windows from 1700 to present, coarser for early years"""
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     current = start
-    
+
     while current < end:
-        chunk_end = min(current + timedelta(days=CHUNK_DAYS-1), end)
+        chunk_end = min(current + timedelta(days=window_days(current) - 1), end)
         yield current, chunk_end
         current = chunk_end + timedelta(days=1)
 
-def load_existing_patents():
-    if os.path.exists(PATENTS_FILE):
-        with open(PATENTS_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    return set()
-
-def save_new_patents(new_patents, existing_patents):
-    with open(PATENTS_FILE, 'a') as f:
-        for patent in new_patents:
-            if patent not in existing_patents:
-                f.write(f"{patent}\n")
-                print(f"Saved new unique patent: {patent}")
-
-def save_progress(date):
-    """Save the last processed date to resume later"""
-    with open("scraping_progress.txt", "w") as f:
-        f.write(date.strftime("%Y-%m-%d"))
-
 def load_progress():
-    """Load the last processed date"""
+    """Load the last date processed by the old serial backfill, if any"""
     try:
-        with open("scraping_progress.txt", "r") as f:
+        with open(PROGRESS_FILE, "r") as f:
             date_str = f.read().strip()
             return datetime.strptime(date_str, "%Y-%m-%d")
     except FileNotFoundError:
-        return datetime(1700, 1, 1)
+        return None
+
+class BackfillManifest:
+    """
+    Durable record of every backfill window in SQLite: its status
+    (pending, running, done, failed), page and patent counts and last error.
+
+    Workers claim pending windows one at a time, so windows are independent;
+    after a crash only the windows that were running are scraped again.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS windows (
+                start_date TEXT PRIMARY KEY,
+                end_date TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                pages INTEGER,
+                patents INTEGER,
+                new_patents INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS windows_status ON windows (status, start_date);
+        """)
+
+    def plan(self, windows):
+        """
+        Add windows not in the manifest yet, and extend the window an earlier
+        run cut short at its end date, queueing it again if it was done (the
+        frontier drops the patents it already found). Window starts do not
+        depend on the end date, so a window is always keyed the same way.
+        Returns how many windows were added or extended.
+        """
+        now = time.time()
+        rows = [(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")) for start, end in windows]
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO windows (start_date, end_date, updated_at) VALUES (?, ?, ?)",
+                [(start, end, now) for start, end in rows]
+            )
+            self.conn.executemany(
+                "UPDATE windows SET end_date = ?, updated_at = ?, "
+                "status = CASE WHEN status = 'done' THEN 'pending' ELSE status END "
+                "WHERE start_date = ? AND end_date < ?",
+                [(end, now, start, end) for start, end in rows]
+            )
+            return self.conn.total_changes - before
+
+    def import_progress(self, done_until):
+        """Mark the windows the old serial backfill finished as done"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE windows SET status = 'done', updated_at = ? WHERE end_date <= ? AND status = 'pending'",
+                (time.time(), done_until.strftime("%Y-%m-%d"))
+            )
+
+    def requeue(self):
+        """Put windows left running by a crashed run, and failed ones, back in the queue"""
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "UPDATE windows SET status = 'pending' WHERE status IN ('running', 'failed')"
+            ).rowcount
+
+    def claim(self):
+        """Atomically take the oldest pending window, or None when none are left"""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "UPDATE windows SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE start_date = (SELECT start_date FROM windows WHERE status = 'pending' "
+                "ORDER BY start_date LIMIT 1) RETURNING start_date, end_date",
+                (time.time(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return datetime.strptime(row[0], "%Y-%m-%d"), datetime.strptime(row[1], "%Y-%m-%d")
+
+    def finish(self, start_date, pages, patents, new_patents):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE windows SET status = 'done', pages = ?, patents = ?, new_patents = ?, error = NULL, "
+                "updated_at = ? WHERE start_date = ?",
+                (pages, patents, new_patents, time.time(), start_date.strftime("%Y-%m-%d"))
+            )
+
+    def fail(self, start_date, error):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE windows SET status = 'failed', error = ?, updated_at = ? WHERE start_date = ?",
+                (error, time.time(), start_date.strftime("%Y-%m-%d"))
+            )
+
+    def status_counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM windows GROUP BY status"))
+
+    def close(self):
+        self.conn.close()
 
 def construct_url(page_num, start_date, end_date):
     formatted_start_date = start_date.strftime("%Y%m%d")
     formatted_end_date = end_date.strftime("%Y%m%d")
     return f"https://patents.google.com/?country=US&before=publication:{formatted_end_date}&after=publication:{formatted_start_date}&language=ENGLISH&type=PATENT&num={no_of_results}&dups=language&page={page_num}"
 
-# Setup Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--remote-debugging-port=9222")
-chrome_options.binary_location = "/snap/bin/chromium"  # Path to Chromium binary from snap
-
-def scrape_date_range(driver, start_date, end_date, existing_patents):
-    """Scrape patents for a specific date range"""
+def save_page_links(tag, page_num, patent_numbers, frontier):
+    """Append the new patents of one results page to the frontier, return them"""
+    patent_numbers = list(dict.fromkeys(patent_numbers))
+    patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
+    # Appends only the links not already in the frontier
+    new_patents = frontier.add(patent_links)
+
+    print(f"{tag}Patents found on page {page_num + 1}: {len(patent_links)}")
+    print(f"{tag}New patents found: {len(new_patents)}")
+    for patent in new_patents:
+        print(f"{tag}Saved new unique patent: {patent}")
+    return new_patents
+
+def scrape_date_range(worker, start_date, end_date, frontier, rate_limiter, backoff, max_retries=3):
+    """Scrape patents for a specific date range with a browser; returns (pages, patents found, new links)"""
+    tag = f"[worker {worker.index + 1}] "
     all_patent_links = []
+    found = 0
     page_num = 0
-    max_retries = 3
-    
+
     while True:
         current_url = construct_url(page_num, start_date, end_date)
-        print(f"\nFetching page {page_num + 1} for date range: {start_date.date()} to {end_date.date()}")
-        print(f"URL: {current_url}")
-        
+        print(f"\n{tag}Fetching page {page_num + 1} for date range: {start_date.date()} to {end_date.date()}")
+        print(f"{tag}URL: {current_url}")
+
         for retry in range(max_retries):
             try:
-                driver.get(current_url)
-                time.sleep(15)  # Wait for content to load
-                
-                html_content = driver.page_source
+                html_content = load_results_page(worker.get_driver(), current_url, rate_limiter, backoff)
                 patent_numbers = re.findall(r"US\d{1,11}", html_content)
-                
+
                 if not patent_numbers:
-                    print(f"No more results found after page {page_num + 1}")
-                    return all_patent_links
-                
-                patent_numbers = list(dict.fromkeys(patent_numbers))
-                patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
-                new_patents = [link for link in patent_links if link not in existing_patents]
-                
-                print(f"Patents found on page {page_num + 1}: {len(patent_links)}")
-                print(f"New patents found: {len(new_patents)}")
-                
-                save_new_patents(new_patents, existing_patents)
-                existing_patents.update(new_patents)
-                all_patent_links.extend(new_patents)
-                
+                    print(f"{tag}No more results found after page {page_num + 1}")
+                    return page_num, found, all_patent_links
+
+                found += len(set(patent_numbers))
+                all_patent_links.extend(save_page_links(tag, page_num, patent_numbers, frontier))
                 page_num += 1
-                time.sleep(15)  # Delay between pages
                 break  # Success, exit retry loop
-                
+
             except Exception as e:
-                print(f"Error on attempt {retry + 1}/{max_retries}: {str(e)}")
+                print(f"{tag}Error on attempt {retry + 1}/{max_retries}: {str(e)}")
                 if retry < max_retries - 1:
-                    print("Recreating WebDriver session...")
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-                    
-                    # Reinitialize the driver
-                    driver = webdriver.Chrome(
-                        service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-                        options=chrome_options
-                    )
+                    print(f"{tag}Recreating WebDriver session...")
+                    worker.quit_driver()
                     time.sleep(5)  # Wait before retry
                 else:
-                    print(f"Failed after {max_retries} attempts")
-                    return all_patent_links
-    
-    return all_patent_links
-
-def getLinks():
-    while True:  # Main retry loop
-        try:
-            # Initialize the driver
-            driver = webdriver.Chrome(
-                service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-                options=chrome_options
-            )
-            existing_patents = load_existing_patents()
-            print(f"Found {len(existing_patents)} existing patents in {PATENTS_FILE}")
-            
-            # Load progress
-            start_from = load_progress()
-            print(f"Resuming scraping from: {start_from.date()}")
-            
-            total_new_patents = 0
-            
-            for start_date, end_date in get_date_chunks():
-                if start_date < start_from:
-                    continue
-                    
-                print(f"\nProcessing date chunk: {start_date.date()} to {end_date.date()}")
-                
-                new_patents = scrape_date_range(driver, start_date, end_date, existing_patents)
-                total_new_patents += len(new_patents)
-                
-                # Save progress after each chunk
-                save_progress(end_date)
-                
-                print(f"Completed chunk. Total patents so far: {len(existing_patents)}")
-                time.sleep(15)  # Delay between chunks
-            
-            break  # Success, exit main retry loop
-            
-        except KeyboardInterrupt:
-            print("\nScraping interrupted by user. Progress has been saved.")
-            break
-        except Exception as e:
-            print(f"\nAn error occurred in main loop: {str(e)}")
-            print("Waiting 60 seconds before retrying...")
-            time.sleep(60)
-        finally:
+                    raise RuntimeError(f"Failed after {max_retries} attempts: {e}")
+
+def scrape_date_range_http(worker, discovery, start_date, end_date, frontier, backoff):
+    """Scrape patents for a specific date range from the results JSON, without a browser"""
+    tag = f"[worker {worker.index + 1}] "
+    all_patent_links = []
+    found = 0
+    pages = 0
+    for page_num, patent_numbers in iter_pages_with_backoff(discovery, start_date, end_date, backoff):
+        pages = page_num + 1
+        found += len(patent_numbers)
+        all_patent_links.extend(save_page_links(tag, page_num, patent_numbers, frontier))
+    return pages, found, all_patent_links
+
+class BackfillWorker:
+    """One backfill worker; its browser is only started if HTTP discovery fails"""
+
+    def __init__(self, index):
+        self.index = index
+        self.driver = None
+
+    def get_driver(self):
+        if self.driver is None:
+            self.driver = create_driver(self.index)
+        return self.driver
+
+    def quit_driver(self):
+        if self.driver is not None:
             try:
-                driver.quit()
-            except:
+                self.driver.quit()
+            except Exception:
                 pass
-    
+            self.driver = None
+
+def run_worker(worker, manifest, frontier, discovery, rate_limiter, backoff, stop):
+    """Claim and scrape windows until none are left; returns the number of new patents"""
+    tag = f"[worker {worker.index + 1}] "
+    total_new_patents = 0
+    try:
+        while not stop.is_set():
+            window = manifest.claim()
+            if window is None:
+                break
+            start_date, end_date = window
+            print(f"\n{tag}Processing date chunk: {start_date.date()} to {end_date.date()}")
+            try:
+                try:
+                    pages, found, new_patents = scrape_date_range_http(
+                        worker, discovery, start_date, end_date, frontier, backoff)
+                except ThrottledError:
+                    # Fails the window for a later retry; a browser would be throttled too
+                    raise
+                except (DiscoveryError, requests.RequestException) as e:
+                    print(f"{tag}HTTP discovery failed ({e}), falling back to Selenium")
+                    pages, found, new_patents = scrape_date_range(
+                        worker, start_date, end_date, frontier, rate_limiter, backoff)
+            except Exception as e:
+                print(f"{tag}Window {start_date.date()} to {end_date.date()} failed: {str(e)}")
+                manifest.fail(start_date, str(e))
+                continue
+            manifest.finish(start_date, pages, found, len(new_patents))
+            total_new_patents += len(new_patents)
+            print(f"{tag}Completed chunk: {pages} pages, {found} patents, {len(new_patents)} new")
+    finally:
+        worker.quit_driver()
+    return total_new_patents
+
+def getLinks(workers=WORKERS, min_request_interval=MIN_REQUEST_INTERVAL):
+    frontier = URLFrontier(PATENTS_FILE)
+    print(f"Found {len(frontier)} existing patents in {PATENTS_FILE}")
+
+    manifest = BackfillManifest()
+    added = manifest.plan(get_date_chunks())
+    if added:
+        print(f"Planned {added} new or extended date windows")
+        done_until = load_progress()
+        if done_until:
+            manifest.import_progress(done_until)
+            print(f"Windows up to {done_until.date()} marked done from {PROGRESS_FILE}")
+    requeued = manifest.requeue()
+    if requeued:
+        print(f"Retrying {requeued} windows that were interrupted or failed")
+    print(f"Backfill windows: {manifest.status_counts()}")
+
+    # One request budget for every worker, over HTTP or in a browser
+    rate_limiter = HostRateLimiter(min_request_interval)
+    discovery = HTTPDiscovery(rate_limiter)
+    backoff = ThrottleBackoff()
+    stop = threading.Event()
+    total_new_patents = 0
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            executor.submit(run_worker, BackfillWorker(index), manifest, frontier, discovery,
+                            rate_limiter, backoff, stop)
+            for index in range(workers)
+        ]
+        for future in futures:
+            total_new_patents += future.result()
+    except KeyboardInterrupt:
+        # Workers finish their current window; the rest stays pending in the manifest
+        stop.set()
+        print("\nScraping interrupted by user. Progress has been saved.")
+    finally:
+        executor.shutdown(wait=True)
+
     print(f"\nScraping completed or interrupted.")
     print(f"Total new patents found: {total_new_patents}")
-    print(f"Total unique patents in {PATENTS_FILE}: {len(existing_patents)}")
+    print(f"Total unique patents in {PATENTS_FILE}: {len(frontier)}")
+    print(f"Backfill windows: {manifest.status_counts()}")
+    manifest.close()
+    frontier.close()
+    discovery.close()
     return total_new_patents
 
 if __name__ == "__main__":
-    getLinks()
+    parser = argparse.ArgumentParser(description="Backfill patent URLs from 1700 to today, one date window at a time")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Date windows scraped in parallel")
+    parser.add_argument("--min-request-interval", type=float, default=MIN_REQUEST_INTERVAL,
+                        help="Minimum seconds between requests, shared by all workers")
+    args = parser.parse_args()
+    getLinks(workers=args.workers, min_request_interval=args.min_request_interval)
@@ -1,12 +1,22 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
+import argparse
 import re
+import requests
+import threading
 import time
 from dotenv import load_dotenv
 import os
+from url_frontier import URLFrontier
+from rate_limiter import HostRateLimiter
+from http_discovery import HTTPDiscovery, DiscoveryError, ThrottledError
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +25,21 @@ load_dotenv()
 PATENTS_FILE = "patent_urls.txt"
 no_of_results = 100
 
-PAGE_LOAD_DELAY = 15  # Seconds to wait for page load
-BETWEEN_PAGES_DELAY = 10  # Seconds to wait between pages
+PAGE_LOAD_TIMEOUT = 30  # Seconds to wait for the result list to render
+MIN_PAGE_INTERVAL = 2.0  # Minimum seconds between page loads, across all browsers
+BACKOFF_INITIAL = 30  # Seconds to pause after the first throttling signal
+MAX_BACKOFF = 600  # Longest pause after repeated throttling
 MAX_RETRIES = 3  # Maximum number of retries per page
+BROWSERS = 1  # Headless browsers scraping disjoint date windows in parallel
+DEBUGGING_PORT = 9222  # Remote debugging port of the first browser, the others count up
+# "http" reads the results JSON without a browser and falls back to Selenium if that fails
+BACKEND = "http"
+
+# Elements that appear once Google Patents has rendered the result list
+RESULT_SELECTOR = "search-result-item"
+NO_RESULTS_SELECTOR = "#noResultsMessage, .no-results"
+# Page text or URL fragments that mean Google is throttling us
+THROTTLE_MARKERS = ("/sorry/", "unusual traffic", "Too Many Requests")
 
 def get_date_range():
     # end_date = datetime.now()
@@ -25,139 +47,300 @@ def get_date_range():
     start_date = end_date - timedelta(days=10)
     return start_date, end_date
 
-def load_existing_patents():
-    if os.path.exists(PATENTS_FILE):
-        with open(PATENTS_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    return set()
-
-def save_new_patents(new_patents, existing_patents):
-    with open(PATENTS_FILE, 'a') as f:
-        for patent in new_patents:
-            if patent not in existing_patents:
-                f.write(f"{patent}\n")
-
 def construct_url(page_num, start_date, end_date):
     formatted_start_date = start_date.strftime("%Y%m%d")
     formatted_end_date = end_date.strftime("%Y%m%d")
     return f"https://patents.google.com/?country=US&before=publication:{formatted_end_date}&after=publication:{formatted_start_date}&language=ENGLISH&type=PATENT&num={no_of_results}&dups=language&page={page_num}"
 
+STATE_FILE = "recent_scraping_state.txt"
+_state_lock = threading.Lock()
+
 def save_scraping_state(date, page_num):
-    """Save the current scraping state"""
-    with open("recent_scraping_state.txt", "w") as f:
-        f.write(f"{date.strftime('%Y-%m-%d')},{page_num}")
+    """Save the current scraping state (last page reached) of the window starting at date"""
+    with _state_lock:
+        states = load_scraping_state()
+        states[date.strftime('%Y-%m-%d')] = page_num
+        _write_scraping_state(states)
+
+def clear_scraping_state(date):
+    """Forget the window starting at date once all of its pages are read, so the file does not grow"""
+    with _state_lock:
+        states = load_scraping_state()
+        if states.pop(date.strftime('%Y-%m-%d'), None) is not None:
+            _write_scraping_state(states)
+
+def _write_scraping_state(states):
+    with open(STATE_FILE, "w") as f:
+        f.write("\n".join(f"{day},{page}" for day, page in sorted(states.items())))
 
 def load_scraping_state():
-    """Load the last scraping state"""
+    """Load the last page reached per window start date, {YYYY-MM-DD: page_num}"""
+    states = {}
     try:
-        with open("recent_scraping_state.txt", "r") as f:
-            date_str, page_num = f.read().strip().split(",")
-            return datetime.strptime(date_str, "%Y-%m-%d"), int(page_num)
+        with open(STATE_FILE, "r") as f:
+            for line in f:
+                if line.strip():
+                    date_str, page_num = line.strip().split(",")
+                    states[date_str] = int(page_num)
     except FileNotFoundError:
-        return None, 0
-
-# Setup Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--remote-debugging-port=9222")
-chrome_options.binary_location = "/snap/bin/chromium"  # Path to Chromium binary from snap
-
-def getLinks():
-    # Get dynamic date range
-    start_date, end_date = get_date_range()
-    print(f"\nScraping patents from {start_date.date()} to {end_date.date()}")
-    
-    # Initialize the driver with specific ChromeDriver path
-    driver = webdriver.Chrome(
+        pass
+    return states
+
+def create_driver(index=0):
+    """Start headless browser number index, each on its own debugging port"""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument(f"--remote-debugging-port={DEBUGGING_PORT + index}")
+    chrome_options.binary_location = "/snap/bin/chromium"  # Path to Chromium binary from snap
+    return webdriver.Chrome(
         service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
         options=chrome_options
     )
+
+class ThrottleBackoff:
+    """
+    Pause shared by all browsers that only grows after a throttling signal.
+
+    Pages load back to back (subject to MIN_PAGE_INTERVAL) until Google
+    throttles us; then every browser waits BACKOFF_INITIAL seconds, doubling
+    on each further signal up to MAX_BACKOFF, and the pause halves again
+    with every page that loads normally.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self.delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttled(self):
+        with self._lock:
+            self.delay = min(max(self.delay * 2, BACKOFF_INITIAL), MAX_BACKOFF)
+            print(f"Throttling detected, backing off {self.delay:.0f}s between pages")
+
+    def succeeded(self):
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay >= 1 else 0.0
+
+def page_state(driver):
+    """WebDriverWait condition: "throttled", "results" or "empty" once known, False while loading"""
+    if any(marker in driver.current_url for marker in THROTTLE_MARKERS):
+        return "throttled"
+    if driver.find_elements(By.CSS_SELECTOR, RESULT_SELECTOR):
+        return "results"
+    if driver.find_elements(By.CSS_SELECTOR, NO_RESULTS_SELECTOR):
+        return "empty"
+    if driver.execute_script("return document.readyState") == "complete":
+        title = driver.title or ""
+        if any(marker in title for marker in THROTTLE_MARKERS):
+            return "throttled"
+    return False
+
+def load_results_page(driver, url, rate_limiter, backoff):
+    """Load a results page and return its HTML as soon as the result list has rendered"""
+    for attempt in range(MAX_RETRIES):
+        rate_limiter.wait(url)
+        backoff.wait()
+        driver.get(url)
+        try:
+            state = WebDriverWait(driver, PAGE_LOAD_TIMEOUT, poll_frequency=0.25).until(page_state)
+        except TimeoutException:
+            # Nothing recognisable rendered; let the caller look for patent numbers anyway
+            state = "timeout"
+        html_content = driver.page_source
+        if state == "throttled" or any(marker in html_content for marker in THROTTLE_MARKERS[1:]):
+            backoff.throttled()
+            continue
+        backoff.succeeded()
+        return html_content
+    raise RuntimeError(f"Still throttled after {MAX_RETRIES} attempts")
+
+def split_date_range(start_date, end_date, parts):
+    """Split a date range into at most parts windows; neighbours share their boundary day"""
+    days = max((end_date - start_date).days, 1)
+    parts = max(1, min(parts, days))
+    step = days / parts
+    bounds = [start_date + timedelta(days=round(i * step)) for i in range(parts)] + [end_date]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def save_page_links(tag, page_num, patent_numbers, frontier):
+    """Append the new patents of one results page to the frontier, return them"""
+    # Remove duplicates while preserving order
+    patent_numbers = list(dict.fromkeys(patent_numbers))
+
+    # Generate full URLs
+    patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
+
+    # Save new patents to file, filtering out already existing ones
+    new_patents = frontier.add(patent_links)
+
+    # Print the extracted links for current page
+    print(f"{tag}Patents found on page {page_num + 1}: {len(patent_links)}")
+    print(f"{tag}New patents found: {len(new_patents)}")
+    for i, link in enumerate(new_patents, 1):
+        print(f"{i}. {link}")
+    return new_patents
+
+def iter_pages_with_backoff(discovery, start_date, end_date, backoff, start_page=0):
+    """
+    discovery.iter_pages, but a throttled request waits out the shared
+    backoff and resumes at the same page instead of failing the window.
+    Raises ThrottledError once MAX_RETRIES attempts in a row were throttled.
+    """
+    page_num = start_page
+    for attempt in range(MAX_RETRIES):
+        try:
+            for page_num, patent_numbers in discovery.iter_pages(start_date, end_date, page_num):
+                backoff.succeeded()
+                yield page_num, patent_numbers
+                page_num += 1
+                backoff.wait()
+            return
+        except ThrottledError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            backoff.throttled()
+            backoff.wait()
+
+def scrape_window_http(tag, start_date, end_date, frontier, discovery, backoff):
+    """Page through one date window with the browserless HTTP backend"""
     all_patent_links = []
-    
-    # Load existing patents
-    existing_patents = load_existing_patents()
-    print(f"Found {len(existing_patents)} existing patents in {PATENTS_FILE}")
-    
+    page_num = load_scraping_state().get(start_date.strftime('%Y-%m-%d'), 0)
+    if page_num:
+        print(f"{tag}Resuming from page {page_num + 1}")
+
+    for page_num, patent_numbers in iter_pages_with_backoff(discovery, start_date, end_date, backoff, page_num):
+        all_patent_links.extend(save_page_links(tag, page_num, patent_numbers, frontier))
+        save_scraping_state(start_date, page_num)
+    print(f"{tag}No more results found after page {page_num + 1}")
+    clear_scraping_state(start_date)
+    return all_patent_links
+
+def scrape_window(index, start_date, end_date, frontier, rate_limiter, backoff, discovery=None):
+    """Scrape every results page of one date window, over HTTP if a discovery backend is given"""
+    tag = f"[worker {index + 1}] "
+    print(f"\n{tag}Scraping patents from {start_date.date()} to {end_date.date()}")
+    all_patent_links = []
+
+    if discovery is not None:
+        try:
+            return scrape_window_http(tag, start_date, end_date, frontier, discovery, backoff)
+        except ThrottledError:
+            # Still throttled after backing off: a browser would only be throttled too
+            raise
+        except (DiscoveryError, requests.RequestException) as e:
+            if discovery.replay_dir:
+                raise  # Offline replays never start a browser
+            print(f"{tag}HTTP discovery failed ({e}), falling back to Selenium")
+
     # Load last state
-    last_date, page_num = load_scraping_state()
-    if last_date and last_date == start_date:
-        print(f"Resuming from page {page_num + 1}")
-    else:
-        page_num = 0
-    
+    page_num = load_scraping_state().get(start_date.strftime('%Y-%m-%d'), 0)
+    if page_num:
+        print(f"{tag}Resuming from page {page_num + 1}")
+
+    driver = create_driver(index)
     try:
         while True:
             # Load the page
             current_url = construct_url(page_num, start_date, end_date)
-            print(f"\nFetching page {page_num + 1}")
-            print(f"URL: {current_url}")
-            
+            print(f"\n{tag}Fetching page {page_num + 1}")
+            print(f"{tag}URL: {current_url}")
+
             retry_count = 0
             while retry_count < MAX_RETRIES:
                 try:
-                    driver.get(current_url)
-                    time.sleep(PAGE_LOAD_DELAY)  # Wait for content to load
-                    
-                    # Get the page source after JavaScript execution
-                    html_content = driver.page_source
-                    
+                    html_content = load_results_page(driver, current_url, rate_limiter, backoff)
+
                     # Use regex to find all patent numbers
                     patent_numbers = re.findall(r"US\d{1,11}", html_content)
                     break
                 except Exception as e:
                     retry_count += 1
-                    print(f"Attempt {retry_count} failed: {str(e)}")
+                    print(f"{tag}Attempt {retry_count} failed: {str(e)}")
                     if retry_count == MAX_RETRIES:
                         raise
-                    time.sleep(PAGE_LOAD_DELAY)
-            
+                    # The browser may have died; start a fresh one
+                    try:
+                        driver.quit()
+                    except Exception:
+                        pass
+                    driver = create_driver(index)
+
             # If no patents found on the page, break the loop
             if not patent_numbers:
-                print(f"No more results found after page {page_num + 1}")
+                print(f"{tag}No more results found after page {page_num + 1}")
+                clear_scraping_state(start_date)
                 break
-            
-            # Remove duplicates while preserving order
-            patent_numbers = list(dict.fromkeys(patent_numbers))
-            
-            # Generate full URLs
-            patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
-            
-            # Filter out already existing patents
-            new_patents = [link for link in patent_links if link not in existing_patents]
-            
-            # Print the extracted links for current page
-            print(f"Patents found on page {page_num + 1}: {len(patent_links)}")
-            print(f"New patents found: {len(new_patents)}")
-            for i, link in enumerate(new_patents, 1):
-                print(f"{i}. {link}")
-            
-            # Save new patents to file
-            save_new_patents(new_patents, existing_patents)
-            existing_patents.update(new_patents)
-            
+
             # Add to master list
-            all_patent_links.extend(new_patents)  # Only extend with new patents
-            
+            all_patent_links.extend(save_page_links(tag, page_num, patent_numbers, frontier))
+
             # Save current state
             save_scraping_state(start_date, page_num)
-            
-            # Move to next page with increased delay
+
+            # Move to next page
             page_num += 1
-            time.sleep(BETWEEN_PAGES_DELAY)
-            
+    finally:
+        driver.quit()
+    return all_patent_links
+
+def getLinks(browsers=BROWSERS, backend=BACKEND, replay_dir=None, record_dir=None):
+    # Get dynamic date range
+    start_date, end_date = get_date_range()
+    # Whole days, so window start dates match across runs for resuming
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    print(f"\nScraping patents from {start_date.date()} to {end_date.date()} with {browsers} worker(s)")
+
+    # Known patents are checked against the frontier's on-disk index
+    frontier = URLFrontier(PATENTS_FILE)
+    print(f"Found {len(frontier)} existing patents in {PATENTS_FILE}")
+
+    rate_limiter = HostRateLimiter(MIN_PAGE_INTERVAL)
+    backoff = ThrottleBackoff()
+    discovery = None
+    if backend == "http":
+        discovery = HTTPDiscovery(rate_limiter, record_dir=record_dir, replay_dir=replay_dir)
+    windows = split_date_range(start_date, end_date, browsers)
+    all_patent_links = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+            futures = [
+                executor.submit(scrape_window, index, window_start, window_end, frontier, rate_limiter, backoff,
+                                discovery)
+                for index, (window_start, window_end) in enumerate(windows)
+            ]
+            for future in futures:
+                try:
+                    all_patent_links.extend(future.result())
+                except Exception as e:
+                    print(f"\nAn error occurred: {str(e)}")
     except KeyboardInterrupt:
         print("\nScraping interrupted by user. Progress has been saved.")
-    except Exception as e:
-        print(f"\nAn error occurred: {str(e)}")
     finally:
-        driver.quit()
         print(f"\nScraping completed or interrupted.")
         print(f"Total new patents found: {len(all_patent_links)}")
-        print(f"Total unique patents in {PATENTS_FILE}: {len(existing_patents)}")
-        return all_patent_links
+        print(f"Total unique patents in {PATENTS_FILE}: {len(frontier)}")
+        frontier.close()
+        if discovery is not None:
+            discovery.close()
+    return all_patent_links
 
 if __name__ == "__main__":
-    getLinks()
+    parser = argparse.ArgumentParser(description="Collect recent patent URLs from Google Patents into patent_urls.txt")
+    parser.add_argument("--browsers", type=int, default=BROWSERS,
+                        help="Parallel workers, each on its own slice of the date range")
+    parser.add_argument("--backend", choices=["http", "selenium"], default=BACKEND,
+                        help="http reads the results JSON without a browser, falling back to Selenium")
+    parser.add_argument("--replay", metavar="DIR", help="Serve HTTP discovery from recorded fixtures in DIR")
+    parser.add_argument("--record", metavar="DIR", help="Save HTTP discovery responses as fixtures in DIR")
+    args = parser.parse_args()
+    getLinks(browsers=args.browsers, backend=args.backend, replay_dir=args.replay, record_dir=args.record)
@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import zstandard
+
+CACHE_DIR = "html_cache"
+INDEX_FILE = "index.db"
+OBJECTS_DIR = "objects"
+ZSTD_LEVEL = 9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL,
+    validated_at REAL
+);
+CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest);
+"""
+PAGE_COLUMNS = ("url", "digest", "size", "etag", "last_modified", "fetched_at", "validated_at")
+
+
+class HTMLCache:
+    """
+    Raw patent page responses, kept so pages can be parsed again without
+    fetching them. Bodies are content-addressed: objects/<ab>/<sha256>.zst
+    holds one zstd-compressed body, written once however many URLs or
+    fetches return it. An SQLite index maps each URL to the digest of its
+    latest body with the ETag and Last-Modified it was served with, which
+    become the validators of the next, conditional, request for the URL.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, level: int = ZSTD_LEVEL):
+        self.directory = directory
+        self.level = level
+        os.makedirs(os.path.join(directory, OBJECTS_DIR), exist_ok=True)
+        # Shared by the fetcher threads; every use of the connection holds the lock
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_FILE), timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # zstd contexts are not thread-safe, each thread gets its own
+        self._local = threading.local()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, OBJECTS_DIR, digest[:2], f"{digest}.zst")
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def _write_object(self, digest: str, content: bytes):
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first, so a crash or a concurrent writer never leaves half an object
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._compressor().compress(content))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """The index entry of a URL (digest, size, validators, times), None if it was never cached"""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(PAGE_COLUMNS)} FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(zip(PAGE_COLUMNS, row)) if row else None
+
+    def read(self, digest: str) -> Optional[bytes]:
+        """The body stored under a digest, None if its object is missing"""
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                return self._decompressor().decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def get(self, url: str) -> Optional[bytes]:
+        entry = self.lookup(url)
+        return self.read(entry["digest"]) if entry else None
+
+    def put(self, url: str, content: bytes, etag: str = None, last_modified: str = None) -> str:
+        """Store a full response body for a URL with its validators; returns its digest"""
+        digest = hashlib.sha256(content).hexdigest()
+        self._write_object(digest, content)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, digest, size, etag, last_modified, fetched_at, validated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, len(content), etag, last_modified, now, now)
+            )
+        return digest
+
+    def revalidated(self, url: str):
+        """Record a 304 Not Modified answer for a URL"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE pages SET validated_at = ? WHERE url = ?", (time.time(), url))
+
+    def iter_pages(self) -> Iterator[Tuple[str, bytes]]:
+        """(url, body) of every cached page, skipping any whose object is missing"""
+        with self.lock:
+            rows = self.conn.execute("SELECT url, digest FROM pages ORDER BY url").fetchall()
+        for url, digest in rows:
+            content = self.read(digest)
+            if content is None:
+                print(f"Cached page of {url} is missing its object {digest}")
+                continue
+            yield url, content
+
+    def prune(self) -> int:
+        """Delete the objects no URL points at any more, e.g. earlier versions of changed pages"""
+        with self.lock:
+            live = {row[0] for row in self.conn.execute("SELECT DISTINCT digest FROM pages")}
+            removed = 0
+            for root, _, filenames in os.walk(os.path.join(self.directory, OBJECTS_DIR)):
+                for filename in filenames:
+                    if filename.endswith(".zst") and filename[:-len(".zst")] not in live:
+                        os.remove(os.path.join(root, filename))
+                        removed += 1
+        return removed
+
+    def stats(self) -> Dict:
+        with self.lock:
+            pages, objects, raw_bytes = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT digest), COALESCE(SUM(size), 0) FROM pages"
+            ).fetchone()
+        stored_bytes = 0
+        for root, _, filenames in os.walk(os.path.join(self.directory, OBJECTS_DIR)):
+            stored_bytes += sum(os.path.getsize(os.path.join(root, filename)) for filename in filenames)
+        return {"pages": pages, "objects": objects, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since headers revalidating a cached page"""
+    headers = {}
+    if entry:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the cache of raw patent page responses")
+    parser.add_argument("--dir", default=CACHE_DIR, help="Cache directory")
+    parser.add_argument("--get", metavar="URL", help="Print the cached page of a URL")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete objects no URL refers to any more (stop ingestion first)")
+    args = parser.parse_args()
+
+    with HTMLCache(args.dir) as cache:
+        if args.get:
+            content = cache.get(args.get)
+            if content is None:
+                sys.exit(f"{args.get} is not cached")
+            sys.stdout.buffer.write(content)
+            sys.exit(0)
+        if args.prune:
+            print(f"Removed {cache.prune()} unreferenced objects")
+        stats = cache.stats()
+        print(f"{stats['pages']} pages in {stats['objects']} objects, "
+              f"{stats['raw_bytes'] / 1e6:.1f} MB raw, {stats['stored_bytes'] / 1e6:.1f} MB compressed")
@@ -0,0 +1,160 @@
+import re
+from typing import Dict, Union
+
+import lxml.html
+from lxml import etree
+
+# (tag, itemprop) of the elements read from a Google Patents page -> field name
+FIELD_ELEMENTS = {
+    ("span", "title"): "title",
+    ("section", "abstract"): "abstract",
+    ("section", "claims"): "claims",
+    ("dd", "inventor"): "inventor",
+    ("dd", "assigneeCurrent"): "assigneeCurrent",
+    ("dd", "assigneeOriginal"): "assigneeOriginal",
+    ("time", "filingDate"): "filingDate",
+}
+# Fields whose text keeps line breaks between block elements; the others are
+# read like BeautifulSoup's .text, i.e. plain concatenated text
+BLOCK_FIELDS = {"claims"}
+
+SKIP_TAGS = {"head", "script", "style", "noscript", "template"}
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+    "tbody", "td", "th", "thead", "tr", "ul",
+    # Google Patents markup for claims and description paragraphs
+    "claim", "claim-text", "description-paragraph", "heading",
+}
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _clean_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def extract_patent_fields(html: Union[str, bytes]) -> Dict:
+    """
+    Extract the patent fields from a Google Patents page in a single pass.
+
+    The page is parsed once with lxml, and one walk over the tree collects
+    the itemprop fields, the claims text and the text of the whole page
+    (which includes the description). Returns the same keys as the
+    BeautifulSoup/html2text based extract_patent_fields_bs4.
+    """
+    root = lxml.html.document_fromstring(html)
+
+    page_parts = []
+    field_parts = {}
+    active = []  # (element, field) captures the walk is currently inside
+    skipping = None
+
+    def emit(text: str):
+        page_parts.append(WHITESPACE_RE.sub(" ", text))
+        for _, field in active:
+            if field in BLOCK_FIELDS:
+                field_parts[field].append(WHITESPACE_RE.sub(" ", text))
+            else:
+                field_parts[field].append(text)
+
+    def emit_break():
+        page_parts.append("\n")
+        for _, field in active:
+            if field in BLOCK_FIELDS:
+                field_parts[field].append("\n")
+
+    for event, element in etree.iterwalk(root, events=("start", "end")):
+        tag = element.tag if isinstance(element.tag, str) else None
+
+        if event == "start":
+            if skipping is not None:
+                continue
+            if tag is None:
+                continue
+            if tag in SKIP_TAGS:
+                skipping = element
+                continue
+            field = FIELD_ELEMENTS.get((tag, element.get("itemprop")))
+            if field and field not in field_parts:
+                field_parts[field] = []
+                active.append((element, field))
+            if tag in BLOCK_TAGS:
+                emit_break()
+            if element.text:
+                emit(element.text)
+            continue
+
+        # "end" event
+        if skipping is not None:
+            if element is not skipping:
+                continue
+            skipping = None
+        elif tag in BLOCK_TAGS:
+            emit_break()
+        if active and active[-1][0] is element:
+            active.pop()
+        if element.tail and skipping is None:
+            emit(element.tail)
+
+    fields = {
+        field: "".join(parts).strip()
+        for field, parts in field_parts.items()
+    }
+
+    def value(field: str) -> str:
+        return fields[field] if field in fields else 'N/A'
+
+    claims_text = fields.get("claims")
+    return {
+        'patent_title': value("title"),
+        'abstract': value("abstract"),
+        'inventor_name': value("inventor"),
+        'assignee_name': value("assigneeCurrent") if "assigneeCurrent" in fields else value("assigneeOriginal"),
+        'filing_date': value("filingDate"),
+        'claims_text': _clean_lines(claims_text) if claims_text else None,
+        "patent_text": _clean_lines("".join(page_parts)),
+    }
+
+
+def extract_patent_fields_bs4(html: str) -> Dict:
+    """
+    Previous extraction: BeautifulSoup's html.parser plus html2text, which
+    parses the page three times. Kept as the baseline for
+    benchmarks/bench_html_extract.py.
+    """
+    from bs4 import BeautifulSoup
+    import html2text
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    h = html2text.HTML2Text()
+    h.ignore_links = True  # Ignore hyperlinks
+    h.ignore_images = True  # Ignore images
+    h.ignore_tables = False  # Keep tables as they might contain important data
+    h.body_width = 0  # Don't wrap text at a certain width
+
+    claims = soup.find('section', itemprop='claims')
+    abstract = soup.find('section', itemprop='abstract')
+    inventor = soup.find('dd', itemprop='inventor')
+    assigneeCurrent = soup.find('dd', itemprop='assigneeCurrent')
+    assigneeOriginal = soup.find('dd', itemprop='assigneeOriginal')
+    filingDate = soup.find('time', itemprop='filingDate')
+    title = soup.find('span', itemprop='title')
+
+    full_text = _clean_lines(h.handle(str(soup)))
+    claims_text = h.handle(str(claims)) if claims else None
+    if claims_text:
+        claims_text = _clean_lines(claims_text)
+
+    return {
+        'patent_title': title.text.strip() if title else 'N/A',
+        'abstract': abstract.text.strip() if abstract else 'N/A',
+        'inventor_name': inventor.text.strip() if inventor else 'N/A',
+        'assignee_name': (assigneeCurrent.text.strip() if assigneeCurrent else
+                          assigneeOriginal.text.strip() if assigneeOriginal else 'N/A'),
+        'filing_date': filingDate.text.strip() if filingDate else 'N/A',
+        'claims_text': claims_text,
+        "patent_text": full_text
+    }
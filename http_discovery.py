@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import re
+from datetime import datetime
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limiter import HostRateLimiter
+
+load_dotenv()
+
+# JSON endpoint the Google Patents results page itself loads its results from
+XHR_URL = "https://patents.google.com/xhr/query"
+REQUEST_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds
+MIN_REQUEST_INTERVAL = 2.0  # Minimum seconds between requests to the host
+MAX_RETRIES = 3  # Retries for connection errors and transient 5xx responses
+POOL_SIZE = 8  # Keep-alive connections shared by the discovery threads
+THROTTLE_STATUSES = (429, 503)
+PATENT_NUMBER_RE = re.compile(r"US\d{1,11}")
+FIXTURES_DIR = os.path.join("fixtures", "discovery")
+
+
+class DiscoveryError(Exception):
+    """The results endpoint returned something that is not a result list"""
+
+
+class ThrottledError(Exception):
+    """The results endpoint is throttling us; wait and retry, a browser would be throttled too"""
+
+
+def search_query(start_date, end_date, page_num, num_results=100):
+    """Query string of the results page, the same search getlinks_final.construct_url opens"""
+    return (f"country=US&before=publication:{end_date.strftime('%Y%m%d')}"
+            f"&after=publication:{start_date.strftime('%Y%m%d')}"
+            f"&language=ENGLISH&type=PATENT&num={num_results}&dups=language&page={page_num}")
+
+
+def parse_results(text):
+    """
+    Return (patent numbers, total pages) from a results response. JSON from
+    the xhr endpoint gives both; for static HTML the patent numbers are
+    found with the same regex the Selenium scraper uses and the page count
+    is unknown (None).
+    """
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        if "<html" not in text[:1000].lower():
+            raise DiscoveryError("Response is neither JSON nor HTML")
+        return list(dict.fromkeys(PATENT_NUMBER_RE.findall(text))), None
+
+    results = payload.get("results") if isinstance(payload, dict) else None
+    if not isinstance(results, dict):
+        raise DiscoveryError("JSON response has no results object")
+    patent_numbers = []
+    for cluster in results.get("cluster", []):
+        for result in cluster.get("result", []):
+            publication_number = result.get("patent", {}).get("publication_number") or result.get("id", "")
+            # US12138008B2 -> US12138008, as the URLs in patent_urls.txt have no kind code
+            match = PATENT_NUMBER_RE.search(publication_number)
+            if match:
+                patent_numbers.append(match.group(0))
+    return list(dict.fromkeys(patent_numbers)), results.get("total_num_pages")
+
+
+class HTTPDiscovery:
+    """
+    Browserless patent discovery: pages through the Google Patents xhr/query
+    JSON endpoint over a pooled keep-alive session instead of rendering the
+    results page in Chromium.
+
+    With record_dir every response is also saved as a fixture file; with
+    replay_dir responses are read from fixture files only, so discovery runs
+    offline (see fixtures/discovery).
+    """
+
+    def __init__(self, rate_limiter=None, record_dir=None, replay_dir=None, num_results=100):
+        self.rate_limiter = rate_limiter or HostRateLimiter(MIN_REQUEST_INTERVAL)
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.num_results = num_results
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=1.0,
+            status_forcelist=(500, 502, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=POOL_SIZE))
+        self.session.headers.update({
+            "User-Agent": os.getenv("USER_AGENT", "Mozilla/5.0"),
+            "Accept": "application/json",
+        })
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    @staticmethod
+    def fixture_name(start_date, end_date, page_num):
+        return f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}_p{page_num}.json"
+
+    def fetch_page(self, start_date, end_date, page_num):
+        """Return the raw response text of one results page"""
+        name = self.fixture_name(start_date, end_date, page_num)
+        if self.replay_dir:
+            path = os.path.join(self.replay_dir, name)
+            if not os.path.exists(path):
+                raise DiscoveryError(f"No recorded response {path}")
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+
+        self.rate_limiter.wait(XHR_URL)
+        response = self.session.get(
+            XHR_URL,
+            params={"url": search_query(start_date, end_date, page_num, self.num_results), "exp": ""},
+            timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code in THROTTLE_STATUSES or "/sorry/" in response.url:
+            raise ThrottledError(f"Throttled by the results endpoint (HTTP {response.status_code})")
+        if response.status_code != 200:
+            raise DiscoveryError(f"Results endpoint returned HTTP {response.status_code}")
+
+        if self.record_dir:
+            with open(os.path.join(self.record_dir, name), "w", encoding="utf-8") as f:
+                f.write(response.text)
+        return response.text
+
+    def iter_pages(self, start_date, end_date, start_page=0):
+        """Yield (page number, patent numbers) for every results page of a date window"""
+        page_num = start_page
+        while True:
+            patent_numbers, total_pages = parse_results(self.fetch_page(start_date, end_date, page_num))
+            if not patent_numbers:
+                return
+            yield page_num, patent_numbers
+            page_num += 1
+            if total_pages is not None and page_num >= total_pages:
+                return
+
+    def close(self):
+        self.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the patents of a publication date window without a browser")
+    parser.add_argument("--start", required=True, help="First publication date, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="Last publication date, YYYY-MM-DD")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", metavar="DIR", help="Also save every response as a fixture in DIR")
+    group.add_argument("--replay", metavar="DIR", help="Read responses from fixtures in DIR instead of the network")
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start, "%Y-%m-%d")
+    end_date = datetime.strptime(args.end, "%Y-%m-%d")
+    discovery = HTTPDiscovery(record_dir=args.record, replay_dir=args.replay)
+    total = 0
+    try:
+        for page_num, patent_numbers in discovery.iter_pages(start_date, end_date):
+            total += len(patent_numbers)
+            print(f"Page {page_num + 1}: {len(patent_numbers)} patents")
+            for patent_number in patent_numbers:
+                print(f"https://patents.google.com/patent/{patent_number}")
+    finally:
+        discovery.close()
+    print(f"Total patents found: {total}")
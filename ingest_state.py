@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from chunking import content_hash
+from segment_store import SegmentStore, STORE_DIR, LEGACY_JSON_DIR, legacy_json_files
+
+STATE_PATH = "ingest_state.db"
+IMPORT_BATCH = 1000  # Patents inserted per executemany when seeding from existing records
+
+# Ingestion stages, in pipeline order. A patent's stage is the last one it completed.
+DISCOVERED = 0  # URL known, page not fetched yet
+FETCHED = 1  # Page parsed and saved to patent_store/
+PINNED = 2  # Uploaded and pinned to IPFS
+STORED = 3  # Passages embedded into ChromaDB
+STAGE_NAMES = {DISCOVERED: "discovered", FETCHED: "fetched", PINNED: "pinned", STORED: "stored"}
+
+PATENT_URL_RE = re.compile(r"/patent/([A-Z0-9]+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patents (
+    patent_no TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    stage INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    ipfs_hash TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS patents_stage ON patents (stage);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def parse_patent_url(url: str):
+    """Return (clean url, patent number), or (clean url, None) for an unrecognised URL"""
+    url = url.strip().replace("@", "")
+    match = PATENT_URL_RE.search(url)
+    return url, match.group(1) if match else None
+
+
+class IngestState:
+    """
+    Per-patent ingestion progress in a local SQLite database (WAL mode).
+
+    Each patent row records the last stage it completed, its content hash,
+    its IPFS CID and the last error, so a run computes its work set with one
+    indexed query and resumes every patent from where it stopped instead of
+    checking the local copies for each URL.
+    """
+
+    def __init__(self, path: str = STATE_PATH, store_dir: str = STORE_DIR):
+        self.path = path
+        # Shared by the pipeline's stage threads; every use of the connection holds the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL commits only need an fsync at checkpoints; losing the last few
+        # updates on power loss just repeats some work on the next run
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # True when this open created the store, so readers know to start from scratch
+        self.created = self.get_meta("imported_json") is None
+        if self.created:
+            self.import_existing(store_dir)
+
+    def get_meta(self, key: str):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def import_existing(self, store_dir: str = STORE_DIR, json_dir: str = LEGACY_JSON_DIR):
+        """
+        Seed the state from patent_store/, and from a patent_json/ directory
+        not migrated yet, once, so patents ingested before the state store
+        existed count as stored and are not fetched again.
+        """
+        def iter_existing():
+            if os.path.isdir(store_dir):
+                with SegmentStore(store_dir) as store:
+                    yield from store.iter_records()
+            for path in legacy_json_files(json_dir):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        patent_data = json.load(f)
+                except Exception as e:
+                    print(f"Error reading {path}: {e}")
+                    continue
+                yield os.path.basename(path)[:-len(".json")], patent_data
+
+        # Records are streamed and only their number, URL, hash and CID are kept, a batch at a time
+        imported = 0
+        rows = []
+        for patent_no, patent_data in iter_existing():
+            rows.append((
+                patent_no,
+                patent_data.get("patent_url", ""),
+                STORED,
+                content_hash(patent_data),
+                patent_data.get("ipfs_hash") or None,
+                time.time(),
+            ))
+            if len(rows) >= IMPORT_BATCH:
+                imported += self._insert_imported(rows)
+                rows = []
+        imported += self._insert_imported(rows)
+        self.set_meta("imported_json", str(time.time()))
+        if imported:
+            print(f"Imported {imported} existing patents from {store_dir}/ into {self.path}")
+
+    def _insert_imported(self, rows) -> int:
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO patents (patent_no, url, stage, content_hash, ipfs_hash, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def discover(self, urls: Iterable[str]) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Record patent URLs, return ((url, patent number) of the new patents, invalid URLs)"""
+        rows, invalid = [], []
+        now = time.time()
+        for url in urls:
+            url, patent_no = parse_patent_url(url)
+            if not url:
+                continue
+            if patent_no is None:
+                invalid.append(url)
+                continue
+            rows.append((patent_no, url, now))
+        new_patents = []
+        with self.lock, self.conn:
+            for patent_no, url, updated_at in rows:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO patents (patent_no, url, updated_at) VALUES (?, ?, ?)",
+                    (patent_no, url, updated_at)
+                )
+                if cursor.rowcount:
+                    new_patents.append((url, patent_no))
+        return new_patents, invalid
+
+    def pending(self, before_stage: int = STORED) -> List[Tuple[str, str, int]]:
+        """Return (url, patent number, stage) of every patent that has not reached before_stage"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT url, patent_no, stage FROM patents WHERE stage < ? ORDER BY stage DESC, rowid",
+                (before_stage,)
+            ).fetchall()
+
+    def mark(self, patent_no: str, stage: int, content_hash: str = None, ipfs_hash: str = None):
+        """Record that a patent completed a stage, clearing its last error"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE patents SET stage = ?, content_hash = COALESCE(?, content_hash), "
+                "ipfs_hash = COALESCE(?, ipfs_hash), error = NULL, updated_at = ? WHERE patent_no = ?",
+                (stage, content_hash, ipfs_hash, time.time(), patent_no)
+            )
+
+    def mark_stored(self, patent_numbers: Iterable[str]):
+        """Mark pinned patents whose passages were written to ChromaDB as stored"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE patents SET stage = ?, error = NULL, updated_at = ? WHERE patent_no = ? AND stage = ?",
+                [(STORED, now, patent_no, PINNED) for patent_no in patent_numbers]
+            )
+
+    def record_error(self, patent_no: str, error: str):
+        """Count a failed attempt; the patent stays at its last completed stage"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE patents SET attempts = attempts + 1, error = ?, updated_at = ? WHERE patent_no = ?",
+                (error, time.time(), patent_no)
+            )
+
+    def stage_counts(self) -> Dict[str, int]:
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT stage, COUNT(*) FROM patents GROUP BY stage"))
+        return {name: counts.get(stage, 0) for stage, name in STAGE_NAMES.items()}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the ingestion progress recorded in the state store")
+    parser.add_argument("--path", default=STATE_PATH, help="State database file")
+    parser.add_argument("--errors", type=int, default=10, help="Number of recent errors to list")
+    args = parser.parse_args()
+
+    with IngestState(args.path) as state:
+        for name, count in state.stage_counts().items():
+            print(f"{name:>10}: {count}")
+        errors = state.conn.execute(
+            "SELECT patent_no, stage, attempts, error FROM patents WHERE error IS NOT NULL "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (args.errors,)
+        ).fetchall()
+        if errors:
+            print("\nRecent errors:")
+            for patent_no, stage, attempts, error in errors:
+                print(f"- {patent_no} ({STAGE_NAMES[stage]}, {attempts} attempts): {error}")
@@ -1,16 +1,105 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
+import asyncio
 import json
-import os
 from typing import Dict, Any
 import logging
+import random
+import time
 from datetime import datetime
+from metrics import IPFS_SECONDS, IPFS_ERRORS
+from segment_store import SegmentStore
+
+CONNECT_TIMEOUT = 5  # Seconds to wait for a connection to the IPFS API
+READ_TIMEOUT = 120  # Seconds to wait for a response, /add of a large patent included
+MAX_RETRIES = 3  # Retries for refused connections and gateway/unavailable responses
+BACKOFF_FACTOR = 0.5  # Retry delays grow as 0.5s, 1s, 2s, ...
+# Kubo answers every failed command (already has entry, no link named ...) with a 500;
+# those are deterministic and add/pin are not idempotent, so only these are retried
+RETRY_STATUSES = (502, 503, 504)
+POOL_SIZE = 10  # Keep-alive connections kept open to the IPFS API
+BULK_READ_TIMEOUT = 600  # Seconds to wait for a bulk /add of a whole batch
+# MFS directory the wrapped directory of every bulk batch is linked into
+MFS_BATCH_DIR = "/patent_batches"
+
+
+def format_patent(patent_data: Dict[str, Any], patent_number: str) -> Dict[str, Any]:
+    """Format the data according to the required structure"""
+    return {
+        "patent_title": patent_data.get('patent_title', ''),
+        "abstract": patent_data.get('abstract', ''),
+        "inventions": patent_data.get('inventions', []),
+        "publication_number": patent_number,
+        "filing_date": patent_data.get('filing_date', ''),
+        "assignee_name": patent_data.get('assignee_name', ''),
+        "inventor_name": patent_data.get('inventor_name', ''),
+        "patent_url": patent_data.get('patent_url', ''),
+        "patent_text": patent_data.get('patent_text', '')
+    }
+
+
+def save_local(store: SegmentStore, formatted_data: Dict[str, Any], patent_number: str, ipfs_hash: str):
+    """Save the patent record locally with its IPFS hash alongside the uploaded fields"""
+    store.put(patent_number, dict(formatted_data, ipfs_hash=ipfs_hash))
+
+
+# Kubo's errors for an MFS path that is already taken; other texts, e.g.
+# "file does not exist", must not send a re-upload down the replace path
+ALREADY_EXISTS_ERRORS = ("directory already has entry by that name", "file already exists")
+
+
+def split_timeout(timeout):
+    """(connect, read) seconds of a requests-style timeout, a single number or None applying to both"""
+    if isinstance(timeout, (tuple, list)):
+        connect_timeout, read_timeout = timeout
+        return connect_timeout, read_timeout
+    return timeout, timeout
+
+
+def already_exists(error_text: str) -> bool:
+    """True for the error Kubo returns when an MFS path is taken"""
+    return any(message in error_text for message in ALREADY_EXISTS_ERRORS)
+
+
+def create_session(max_retries: int = MAX_RETRIES) -> requests.Session:
+    """Keep-alive session that retries refused connections and 502/503/504 responses"""
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # Every IPFS API call is a POST; retried only when it never reached a working daemon
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=POOL_SIZE)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 class IPFSHandler:
-    def __init__(self, ipfs_api_url: str = "http://127.0.0.1:5001/api/v0"):
+    def __init__(self, ipfs_api_url: str = "http://127.0.0.1:5001/api/v0",
+                 lean_upload: bool = True, verify_sample_rate: float = 0.0,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries: int = MAX_RETRIES,
+                 store: SegmentStore = None):
         self.ipfs_api_url = ipfs_api_url
-        self.output_dir = "patent_json"
-        # Create output directory if it doesn't exist
-        os.makedirs(self.output_dir, exist_ok=True)
+        # One pooled keep-alive session for every call to the local IPFS API
+        self.session = create_session(max_retries)
+        self.timeout = split_timeout(timeout)
+        # Local copies of the uploaded records
+        self.owns_store = store is None
+        # An empty store is falsy (it has a length), so test for None
+        self.store = store if store is not None else SegmentStore()
+        # Lean uploads add, pin and link into MFS in one /add call (see _save_and_upload_lean)
+        self.lean_upload = lean_upload
+        # Fraction of lean uploads read back from IPFS to verify them
+        self.verify_sample_rate = verify_sample_rate
         self.logger = self._setup_logger()
         
         # Initialize MFS directory structure
@@ -24,12 +113,39 @@ class IPFSHandler:
         )
         return logging.getLogger(__name__)
 
+    def _post(self, endpoint: str, timeout=None, **kwargs) -> requests.Response:
+        """POST to an IPFS API endpoint through the pooled session, with timeouts"""
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.ipfs_api_url}/{endpoint}", timeout=timeout or self.timeout, **kwargs
+            )
+        except Exception:
+            IPFS_ERRORS.inc(endpoint)
+            raise
+        finally:
+            IPFS_SECONDS.observe(endpoint, value=time.perf_counter() - start)
+        if response.status_code >= 400:
+            IPFS_ERRORS.inc(endpoint)
+        return response
+
+    def close(self):
+        self.session.close()
+        if self.owns_store:
+            self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def init_mfs_directory(self):
         """Initialize the MFS directory structure"""
         try:
             # Create /patents directory if it doesn't exist
-            mkdir_response = requests.post(
-                f"{self.ipfs_api_url}/files/mkdir",
+            mkdir_response = self._post(
+                "files/mkdir",
                 params={
                     'arg': '/patents',
                     'parents': 'true'
@@ -59,8 +175,8 @@ class IPFSHandler:
             }
             
             # Add to IPFS
-            response = requests.post(
-                f"{self.ipfs_api_url}/add",
+            response = self._post(
+                "add",
                 files=files
             )
             
@@ -81,8 +197,8 @@ class IPFSHandler:
         Retrieve data from IPFS using the hash
         """
         try:
-            response = requests.post(
-                f"{self.ipfs_api_url}/cat",
+            response = self._post(
+                "cat",
                 params={'arg': ipfs_hash}
             )
             
@@ -100,19 +216,11 @@ class IPFSHandler:
         """
         Save patent data as JSON and upload to IPFS
         """
+        if self.lean_upload:
+            return self._save_and_upload_lean(patent_data, patent_number)
+
         try:
-            # Format the data according to the required structure
-            formatted_data = {
-                "patent_title": patent_data.get('patent_title', ''),
-                "abstract": patent_data.get('abstract', ''),
-                "inventions": patent_data.get('inventions', []),
-                "publication_number": patent_number,
-                "filing_date": patent_data.get('filing_date', ''),
-                "assignee_name": patent_data.get('assignee_name', ''),
-                "inventor_name": patent_data.get('inventor_name', ''),
-                "patent_url": patent_data.get('patent_url', ''),
-                "patent_text": patent_data.get('patent_text', '')
-            }
+            formatted_data = format_patent(patent_data, patent_number)
 
             # First upload to get the hash
             files = {
@@ -120,8 +228,8 @@ class IPFSHandler:
             }
             
             # Add to IPFS first time to get hash
-            response = requests.post(
-                f"{self.ipfs_api_url}/add",
+            response = self._post(
+                "add",
                 files=files
             )
             
@@ -136,8 +244,8 @@ class IPFSHandler:
                     'file': ('patent.json', json.dumps(formatted_data, indent=2))
                 }
                 
-                final_response = requests.post(
-                    f"{self.ipfs_api_url}/add",
+                final_response = self._post(
+                    "add",
                     files=files_with_hash
                 )
                 
@@ -145,13 +253,11 @@ class IPFSHandler:
                     final_hash = final_response.json()['Hash']
                     
                     # Save locally
-                    json_path = os.path.join(self.output_dir, f"{patent_number}.json")
-                    with open(json_path, 'w', encoding='utf-8') as f:
-                        json.dump(formatted_data, f, indent=2, ensure_ascii=False)
+                    self.store.put(patent_number, formatted_data)
                     
                     # Pin the file
-                    pin_response = requests.post(
-                        f"{self.ipfs_api_url}/pin/add",
+                    pin_response = self._post(
+                        "pin/add",
                         params={'arg': final_hash}
                     )
                     
@@ -160,8 +266,8 @@ class IPFSHandler:
                     
                     # First ensure the file doesn't already exist
                     try:
-                        requests.post(
-                            f"{self.ipfs_api_url}/files/rm",
+                        self._post(
+                            "files/rm",
                             params={'arg': mfs_path, 'force': 'true'}
                         )
                     except:
@@ -173,8 +279,8 @@ class IPFSHandler:
                         
                             # Try alternative method using files/cp
                         print("Trying alternative upload method...")
-                        cp_response = requests.post(
-                            f"{self.ipfs_api_url}/files/cp",
+                        cp_response = self._post(
+                            "files/cp",
                             params=[
                                 ('arg', f"/ipfs/{final_hash}"),
                                 ('arg', mfs_path)
@@ -191,8 +297,8 @@ class IPFSHandler:
                         print(f"Error during MFS write: {str(e)}")
                     
                     # Verify the file exists in MFS
-                    verify_response = requests.post(
-                        f"{self.ipfs_api_url}/files/stat",
+                    verify_response = self._post(
+                        "files/stat",
                         params={'arg': mfs_path}
                     )
                     
@@ -203,7 +309,7 @@ class IPFSHandler:
                         print(f"Could not verify file in MFS: {mfs_path}")
                         print("Verification error:", verify_response.text)
                     
-                    self.verify_ipfs_upload(final_hash)
+                    self.verify_ipfs_upload(final_hash, patent_number)
                     return final_hash
                 
             return ""
@@ -213,7 +319,134 @@ class IPFSHandler:
             print(f"Upload error: {str(e)}")
             return ""
 
-    def verify_ipfs_upload(self, ipfs_hash: str) -> bool:
+    def _add_patent(self, json_data: str, patent_number: str, mfs_path: str = None):
+        """Add one patent file with pin=true, optionally linking it into MFS in the same call"""
+        params = {'pin': 'true'}
+        if mfs_path:
+            params['to-files'] = mfs_path
+        return self._post(
+            "add",
+            params=params,
+            files={'file': (f"{patent_number}.json", json_data)}
+        )
+
+    def _save_and_upload_lean(self, patent_data: Dict[str, Any], patent_number: str) -> str:
+        """
+        Upload a patent with a single /add call: pinned and linked into
+        /patents in MFS by the daemon itself. The CID is not embedded in the
+        uploaded JSON; it is kept in the local JSON copy instead.
+        """
+        try:
+            formatted_data = format_patent(patent_data, patent_number)
+            json_data = json.dumps(formatted_data, indent=2)
+            mfs_path = f"/patents/{patent_number}.json"
+
+            response = self._add_patent(json_data, patent_number, mfs_path)
+            if response.status_code != 200 and already_exists(response.text):
+                # Re-upload of a patent: replace the old MFS entry
+                self._post(
+                    "files/rm",
+                    params={'arg': mfs_path, 'force': 'true'}
+                )
+                response = self._add_patent(json_data, patent_number, mfs_path)
+
+            if response.status_code != 200:
+                # Daemons without --to-files support: pinned add, then link with files/cp
+                self.logger.warning(f"add with to-files failed, falling back to files/cp: {response.text}")
+                response = self._add_patent(json_data, patent_number)
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to add to IPFS: {response.text}")
+                    return ""
+                ipfs_hash = response.json()['Hash']
+                self._post(
+                    "files/rm",
+                    params={'arg': mfs_path, 'force': 'true'}
+                )
+                self._post(
+                    "files/cp",
+                    params=[('arg', f"/ipfs/{ipfs_hash}"), ('arg', mfs_path)]
+                )
+            else:
+                ipfs_hash = response.json()['Hash']
+
+            save_local(self.store, formatted_data, patent_number, ipfs_hash)
+            self.logger.info(f"Uploaded {patent_number} to IPFS with hash: {ipfs_hash}")
+
+            if self.verify_sample_rate and random.random() < self.verify_sample_rate:
+                self.verify_ipfs_upload(ipfs_hash, patent_number)
+            return ipfs_hash
+
+        except Exception as e:
+            self.logger.error(f"Error in save_and_upload: {str(e)}")
+            print(f"Upload error: {str(e)}")
+            return ""
+
+    def add_many(self, patents: Dict[str, Dict[str, Any]], link_mfs: bool = True) -> Dict[str, str]:
+        """
+        Upload a batch of patents with a single multipart /add call.
+
+        The files are added pinned under one wrapping directory, and the
+        per-file lines of the NDJSON response map every CID back to its
+        patent number. The wrapping directory is linked into MFS under
+        MFS_BATCH_DIR with one files/cp instead of one entry per patent.
+        Local copies are saved as in save_and_upload.
+        Returns {patent_number: ipfs_hash} for the patents that were added.
+        """
+        if not patents:
+            return {}
+        try:
+            formatted = {
+                patent_number: format_patent(patent_data, patent_number)
+                for patent_number, patent_data in patents.items()
+            }
+            files = [
+                ('file', (f"{patent_number}.json", json.dumps(formatted_data, indent=2)))
+                for patent_number, formatted_data in formatted.items()
+            ]
+            response = self._post(
+                "add",
+                params={'pin': 'true', 'wrap-with-directory': 'true'},
+                files=files,
+                timeout=(self.timeout[0], BULK_READ_TIMEOUT)
+            )
+            if response.status_code != 200:
+                self.logger.error(f"Bulk add of {len(patents)} patents failed: {response.text}")
+                return {}
+
+            hashes = {}
+            directory_hash = ""
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'Hash' not in entry:
+                    continue  # progress lines
+                name = entry.get('Name', '')
+                if not name:
+                    directory_hash = entry['Hash']
+                elif name.endswith('.json') and name[:-len('.json')] in formatted:
+                    hashes[name[:-len('.json')]] = entry['Hash']
+
+            if link_mfs and directory_hash:
+                self._post("files/mkdir", params={'arg': MFS_BATCH_DIR, 'parents': 'true'})
+                cp_response = self._post(
+                    "files/cp",
+                    params=[('arg', f"/ipfs/{directory_hash}"), ('arg', f"{MFS_BATCH_DIR}/{directory_hash}")]
+                )
+                if cp_response.status_code != 200 and not already_exists(cp_response.text):
+                    self.logger.warning(f"Failed to link batch {directory_hash} into MFS: {cp_response.text}")
+
+            for patent_number, ipfs_hash in hashes.items():
+                save_local(self.store, formatted[patent_number], patent_number, ipfs_hash)
+            self.logger.info(f"Bulk uploaded {len(hashes)} of {len(patents)} patents in directory {directory_hash}")
+            return hashes
+
+        except Exception as e:
+            self.logger.error(f"Error in add_many: {str(e)}")
+            print(f"Bulk upload error: {str(e)}")
+            return {}
+
+    def verify_ipfs_upload(self, ipfs_hash: str, patent_number: str = None) -> bool:
         """
         Verify that a file was successfully uploaded to IPFS
         """
@@ -230,15 +463,9 @@ class IPFSHandler:
                 print(f"3. Command Line: ipfs cat /ipfs/{ipfs_hash}")
                 print(f"4. WebUI: Files/patents/{data.get('publication_number', 'unknown')}.json")
                 
-                # # Verify the file is pinned and in MFS
-                # pin_check = requests.post(f"{self.ipfs_api_url}/pin/ls", 
-                #                         params={'arg': ipfs_hash})
-                mfs_check = requests.post(f"{self.ipfs_api_url}/files/ls",
-                                        params={'arg': '/patents'})
-                
-                # if pin_check.status_code == 200:
-                #     print("\nFile is pinned locally")
-                if mfs_check.status_code == 200:
+                # Check the one MFS entry rather than listing the whole /patents directory
+                patent_number = patent_number or data.get('publication_number')
+                if patent_number and self.verify_mfs_file(patent_number):
                     print("File is visible in WebUI")
                 
                 return True
@@ -251,11 +478,144 @@ class IPFSHandler:
         """Verify file exists in MFS"""
         try:
             mfs_path = f"/patents/{patent_number}.json"
-            response = requests.post(
-                f"{self.ipfs_api_url}/files/stat",
+            response = self._post(
+                "files/stat",
                 params={'arg': mfs_path}
             )
             return response.status_code == 200
         except Exception as e:
             self.logger.error(f"Error verifying MFS file: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+
+class AsyncIPFSHandler:
+    """
+    asyncio variant of IPFSHandler for concurrent pipelines.
+
+    Shares one pooled httpx.AsyncClient across uploads and always uploads the
+    lean way (a single pinned /add linked into /patents). Retries refused
+    connections and 502/503/504 responses with exponential backoff like the
+    sync handler's session does.
+    """
+
+    def __init__(self, ipfs_api_url: str = "http://127.0.0.1:5001/api/v0",
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries: int = MAX_RETRIES,
+                 max_connections: int = POOL_SIZE, store: SegmentStore = None):
+        self.ipfs_api_url = ipfs_api_url
+        self.owns_store = store is None
+        # An empty store is falsy (it has a length), so test for None
+        self.store = store if store is not None else SegmentStore()
+        self.max_retries = max_retries
+        connect_timeout, read_timeout = split_timeout(timeout)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+        self.logger = logging.getLogger(__name__)
+
+    async def _post(self, endpoint: str, **kwargs) -> httpx.Response:
+        """POST to an IPFS API endpoint, retrying connection errors and 502/503/504 responses"""
+        start = time.perf_counter()
+        try:
+            response = await self._post_with_retries(endpoint, **kwargs)
+        except Exception:
+            IPFS_ERRORS.inc(endpoint)
+            raise
+        finally:
+            IPFS_SECONDS.observe(endpoint, value=time.perf_counter() - start)
+        if response.status_code >= 400:
+            IPFS_ERRORS.inc(endpoint)
+        return response
+
+    async def _post_with_retries(self, endpoint: str, **kwargs) -> httpx.Response:
+        url = f"{self.ipfs_api_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.client.post(url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if last_attempt:
+                    raise
+                self.logger.warning(f"IPFS API {endpoint} connection failed ({e}), retrying")
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                self.logger.warning(f"IPFS API {endpoint} returned {response.status_code}, retrying")
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+    async def init_mfs_directory(self):
+        """Initialize the MFS directory structure"""
+        try:
+            response = await self._post("files/mkdir", params={'arg': '/patents', 'parents': 'true'})
+            if response.status_code != 200:
+                self.logger.warning(f"Failed to create MFS directory: {response.text}")
+        except Exception as e:
+            self.logger.error(f"Error initializing MFS directory: {str(e)}")
+
+    async def _add_patent(self, json_data: str, patent_number: str, mfs_path: str = None):
+        params = {'pin': 'true'}
+        if mfs_path:
+            params['to-files'] = mfs_path
+        return await self._post(
+            "add",
+            params=params,
+            files={'file': (f"{patent_number}.json", json_data)}
+        )
+
+    async def save_and_upload(self, patent_data: Dict[str, Any], patent_number: str) -> str:
+        """Upload one patent pinned and linked into /patents, save it locally and return its CID"""
+        try:
+            formatted_data = format_patent(patent_data, patent_number)
+            json_data = json.dumps(formatted_data, indent=2)
+            mfs_path = f"/patents/{patent_number}.json"
+
+            response = await self._add_patent(json_data, patent_number, mfs_path)
+            if response.status_code != 200 and already_exists(response.text):
+                await self._post("files/rm", params={'arg': mfs_path, 'force': 'true'})
+                response = await self._add_patent(json_data, patent_number, mfs_path)
+
+            if response.status_code != 200:
+                self.logger.warning(f"add with to-files failed, falling back to files/cp: {response.text}")
+                response = await self._add_patent(json_data, patent_number)
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to add to IPFS: {response.text}")
+                    return ""
+                ipfs_hash = response.json()['Hash']
+                await self._post("files/rm", params={'arg': mfs_path, 'force': 'true'})
+                await self._post("files/cp", params=[('arg', f"/ipfs/{ipfs_hash}"), ('arg', mfs_path)])
+            else:
+                ipfs_hash = response.json()['Hash']
+
+            save_local(self.store, formatted_data, patent_number, ipfs_hash)
+            self.logger.info(f"Uploaded {patent_number} to IPFS with hash: {ipfs_hash}")
+            return ipfs_hash
+
+        except Exception as e:
+            self.logger.error(f"Error in save_and_upload: {str(e)}")
+            print(f"Upload error: {str(e)}")
+            return ""
+
+    async def get_from_ipfs(self, ipfs_hash: str) -> Dict[str, Any]:
+        """Retrieve data from IPFS using the hash"""
+        try:
+            response = await self._post("cat", params={'arg': ipfs_hash})
+            if response.status_code == 200:
+                return json.loads(response.text)
+            self.logger.error(f"Failed to get from IPFS: {response.text}")
+            return {}
+        except Exception as e:
+            self.logger.error(f"Error getting from IPFS: {str(e)}")
+            return {}
+
+    async def aclose(self):
+        await self.client.aclose()
+        if self.owns_store:
+            self.store.close()
+
+    async def __aenter__(self):
+        await self.init_mfs_directory()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 5001
+
+
+class StubIPFS:
+    """
+    In-memory stand-in for the subset of the Kubo RPC API used by ipfs_handler:
+    add (single, multipart, wrap-with-directory, to-files), cat and the
+    files/mkdir, rm, cp, stat and ls calls. CIDs are fake but deterministic,
+    so the same content always gets the same hash.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # Seconds added to every call, to mimic a daemon round trip
+        self.blocks = {}  # cid -> bytes
+        self.directories = {}  # cid -> {name: cid}
+        self.mfs = {"/": None}  # path -> cid, None for directories
+        self.pins = set()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _cid(data: bytes) -> str:
+        return "Qm" + hashlib.sha256(data).hexdigest()[:44]
+
+    def _put_directory(self, entries):
+        listing = json.dumps(sorted(entries.items())).encode()
+        cid = self._cid(b"dir:" + listing)
+        self.directories[cid] = dict(entries)
+        return cid
+
+    def _resolve(self, path: str):
+        """Resolve /ipfs/<cid>[/name] or a bare CID"""
+        parts = [part for part in path.split("/") if part]
+        if parts and parts[0] == "ipfs":
+            parts = parts[1:]
+        if not parts:
+            return None
+        cid = parts[0]
+        for name in parts[1:]:
+            cid = self.directories.get(cid, {}).get(name)
+            if cid is None:
+                return None
+        return cid if cid in self.blocks or cid in self.directories else None
+
+    def _parent_exists(self, path: str) -> bool:
+        parent = path.rsplit("/", 1)[0] or "/"
+        return parent in self.mfs and self.mfs[parent] is None
+
+    def add(self, params, files):
+        entries = []
+        for name, data in files:
+            cid = self._cid(data)
+            self.blocks[cid] = data
+            entries.append({"Name": name, "Hash": cid, "Size": str(len(data))})
+        if params.get("wrap-with-directory") == "true":
+            directory = self._put_directory({entry["Name"]: entry["Hash"] for entry in entries})
+            entries.append({"Name": "", "Hash": directory, "Size": "0"})
+        if params.get("pin", "true") == "true":
+            self.pins.update(entry["Hash"] for entry in entries)
+
+        to_files = params.get("to-files")
+        if to_files:
+            root = entries[-1]
+            if to_files.endswith("/"):
+                target = to_files + (root["Name"] or root["Hash"])
+            else:
+                target = to_files
+            if target in self.mfs:
+                raise ValueError(f"cp: cannot put node in path {target}: directory already has entry by that name")
+            if not self._parent_exists(target):
+                raise ValueError(f"cp: cannot get parent of {target}: file does not exist")
+            self.mfs[target] = root["Hash"]
+        return entries
+
+    def handle(self, endpoint, params, files):
+        """Run one API call and return (status, body, content type)"""
+        arg = params.get("arg", [])
+        single = {key: values[-1] for key, values in params.items()}
+        with self.lock:
+            self.calls += 1
+            if endpoint == "add":
+                entries = self.add(single, files)
+                body = "".join(json.dumps(entry) + "\n" for entry in entries)
+                return 200, body, "application/json"
+            if endpoint == "cat":
+                cid = self._resolve(arg[0])
+                if cid not in self.blocks:
+                    raise ValueError(f"cat: {arg[0]} not found")
+                return 200, self.blocks[cid], "text/plain"
+            if endpoint == "pin/add":
+                cid = self._resolve(arg[0])
+                if cid is None:
+                    raise ValueError(f"pin: {arg[0]} not found")
+                self.pins.add(cid)
+                return 200, json.dumps({"Pins": [cid]}), "application/json"
+            if endpoint == "files/mkdir":
+                path = arg[0].rstrip("/") or "/"
+                parts = [part for part in path.split("/") if part]
+                for i in range(1, len(parts) + 1):
+                    prefix = "/" + "/".join(parts[:i])
+                    if prefix in self.mfs and self.mfs[prefix] is not None:
+                        raise ValueError(f"mkdir: {prefix} is a file")
+                    if prefix not in self.mfs:
+                        if i < len(parts) and single.get("parents") != "true":
+                            raise ValueError(f"mkdir: {prefix} does not exist")
+                        self.mfs[prefix] = None
+                return 200, "", "application/json"
+            if endpoint == "files/rm":
+                path = arg[0].rstrip("/")
+                if path not in self.mfs:
+                    raise ValueError(f"rm: {path}: file does not exist")
+                for existing in [p for p in self.mfs if p == path or p.startswith(path + "/")]:
+                    del self.mfs[existing]
+                return 200, "", "application/json"
+            if endpoint == "files/cp":
+                source, target = arg[0], arg[1].rstrip("/")
+                cid = self._resolve(source)
+                if cid is None:
+                    raise ValueError(f"cp: {source} not found")
+                if target in self.mfs:
+                    raise ValueError(f"cp: cannot put node in path {target}: directory already has entry by that name")
+                if not self._parent_exists(target):
+                    raise ValueError(f"cp: cannot get parent of {target}: file does not exist")
+                self.mfs[target] = cid
+                return 200, "", "application/json"
+            if endpoint == "files/stat":
+                path = arg[0].rstrip("/") or "/"
+                if path not in self.mfs:
+                    raise ValueError(f"stat: {path}: file does not exist")
+                cid = self.mfs[path]
+                kind = "directory" if cid is None or cid in self.directories else "file"
+                size = len(self.blocks.get(cid, b""))
+                return 200, json.dumps({"Hash": cid or "", "Size": size, "Type": kind}), "application/json"
+            if endpoint == "files/ls":
+                path = arg[0].rstrip("/") if arg else ""
+                prefix = path + "/"
+                names = sorted(p[len(prefix):] for p in self.mfs if p.startswith(prefix) and "/" not in p[len(prefix):] and p != prefix)
+                return 200, json.dumps({"Entries": [{"Name": name} for name in names]}), "application/json"
+        raise LookupError(endpoint)
+
+
+def parse_multipart(content_type: str, body: bytes):
+    """Return [(filename, data)] for the file parts of a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    files = []
+    for part in message.iter_parts():
+        name = part.get_filename() or part.get_param("name", header="content-disposition") or ""
+        files.append((name, part.get_payload(decode=True) or b""))
+    return files
+
+
+def make_handler(node: StubIPFS):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one segment, or keep-alive clients stall on delayed ACKs
+        wbufsize = 1 << 16
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            endpoint = url.path.split("/api/v0/", 1)[-1]
+            params = parse_qs(url.query)
+            files = []
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/"):
+                files = parse_multipart(content_type, body)
+
+            if node.latency:
+                time.sleep(node.latency)
+            try:
+                status, payload, payload_type = node.handle(endpoint, params, files)
+            except LookupError:
+                status, payload, payload_type = 404, "404 page not found", "text/plain"
+            except Exception as e:
+                status, payload_type = 500, "application/json"
+                payload = json.dumps({"Message": str(e), "Code": 0, "Type": "error"})
+
+            if isinstance(payload, str):
+                payload = payload.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", payload_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(port: int = 0, latency: float = 0.0):
+    """Serve a StubIPFS on a background thread; returns (server, node, api_url)"""
+    node = StubIPFS(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(node))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, node, f"http://127.0.0.1:{server.server_port}/api/v0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the IPFS (Kubo) RPC API")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Delay added to every API call, to mimic a real daemon")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(StubIPFS(args.latency_ms / 1000)))
+    print(f"Stub IPFS API listening on http://127.0.0.1:{args.port}/api/v0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,643 @@
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+from chunking import filing_day, section_text
+from segment_store import SegmentStore, STORE_DIR
+
+INDEX_DIR = "lexical_index"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+FLUSH_DOCS = 500  # Buffered documents written out as one new segment
+MERGE_FACTOR = 8  # Segments of one size tier merged together, so a patent is rewritten O(log n) times
+SNIPPET_CHARS = 300  # Characters of the abstract kept for lexical-only hits
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Segment file layout (<name>.idx, little-endian):
+#   header | postings | term bytes | lexicon entries
+# Postings are (doc, tf) uint32 pairs grouped by term, lexicon entries are
+# sorted by term so a lookup is a binary search over the memory-mapped file.
+MAGIC = b"BM25"
+HEADER = struct.Struct("<4sIQQQ")  # magic, term count, postings/terms/entries offsets
+ENTRY = struct.Struct("<QIQI")  # term offset, term length, postings offset, document frequency
+POSTING_SIZE = 8
+
+# Docs table layout (<name>.docs, little-endian):
+#   header | lengths | meta offsets | keys | metas
+# Lengths are the uint32 token count of each doc, meta offsets n + 1 uint64
+# positions of each doc's compact JSON meta in the metas blob, and keys
+# (publication number hash, doc) pairs sorted so a patent is found by binary
+# search. Deleted docs, i.e. patents re-indexed in a later segment, are a
+# bitmap in <name>.del-<generation>, the generation listed in the manifest.
+DOCS_MAGIC = b"DOCS"
+DOCS_HEADER = struct.Struct("<4sIQQQQ")  # magic, doc count, lengths/meta offsets/keys/metas offsets
+LENGTH = struct.Struct("<I")
+META_RANGE = struct.Struct("<QQ")
+KEY = struct.Struct("<QI")  # publication number hash, doc
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def document_text(patent_data: Dict) -> str:
+    """Text indexed for a patent: title, abstract, claims and assignee"""
+    return "\n".join(section_text(patent_data, field)
+                     for field in ("patent_title", "abstract", "inventions", "assignee_name"))
+
+
+def document_meta(patent_data: Dict) -> Dict:
+    """Fields kept next to the postings so lexical hits can be returned and filtered"""
+    return {
+        "publication_number": patent_data.get("publication_number", ""),
+        "title": section_text(patent_data, "patent_title"),
+        "assignee": section_text(patent_data, "assignee_name"),
+        "filing_date": section_text(patent_data, "filing_date"),
+        "filing_day": filing_day(section_text(patent_data, "filing_date")),
+        "ipfs_hash": patent_data.get("ipfs_hash") or "",
+        "snippet": section_text(patent_data, "abstract")[:SNIPPET_CHARS],
+    }
+
+
+def doc_key(publication_number: str) -> int:
+    return int.from_bytes(hashlib.blake2b(publication_number.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def encode_meta(meta: Dict) -> bytes:
+    return json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def is_deleted(deletes: bytes, doc: int) -> bool:
+    return (doc >> 3) < len(deletes) and bool(deletes[doc >> 3] >> (doc & 7) & 1)
+
+
+def size_tier(live_docs: int) -> int:
+    """0 for a freshly flushed segment, one more per MERGE_FACTOR times as many live patents"""
+    tier, size = 0, FLUSH_DOCS
+    while live_docs > size:
+        tier += 1
+        size *= MERGE_FACTOR
+    return tier
+
+
+def empty_manifest(next_segment: int = 1) -> Dict:
+    return {"version": MANIFEST_VERSION, "segments": [], "next_segment": next_segment, "next_generation": 1}
+
+
+def _uint32_array(data=b"") -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def write_segment(path: str, terms) -> int:
+    """Write (term bytes, [(doc, tf), ...]) pairs, sorted by term, as a segment file"""
+    terms_blob = bytearray()
+    entries = bytearray()
+    n_terms = 0
+    postings_size = 0
+
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(bytes(HEADER.size))
+        for term, postings in terms:
+            values = array("I", (value for posting in postings for value in posting))
+            if sys.byteorder == "big":
+                values.byteswap()
+            f.write(values.tobytes())
+            entries += ENTRY.pack(len(terms_blob), len(term), postings_size, len(postings))
+            terms_blob += term
+            postings_size += len(postings) * POSTING_SIZE
+            n_terms += 1
+
+        postings_offset = HEADER.size
+        terms_offset = postings_offset + postings_size
+        f.write(terms_blob)
+        f.write(entries)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, n_terms, postings_offset, terms_offset, terms_offset + len(terms_blob)))
+
+    os.replace(f"{path}.tmp", path)
+    return n_terms
+
+
+def write_docs(path: str, docs):
+    """Write [(publication number, encoded meta, length), ...], indexed by doc id, as a docs table"""
+    lengths = array("I", (length for _, _, length in docs))
+    meta_offsets = array("Q", [0])
+    for _, meta, _ in docs:
+        meta_offsets.append(meta_offsets[-1] + len(meta))
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        meta_offsets.byteswap()
+    keys = sorted((doc_key(number), doc) for doc, (number, _, _) in enumerate(docs))
+
+    lengths_offset = DOCS_HEADER.size
+    meta_offsets_offset = lengths_offset + len(docs) * LENGTH.size
+    keys_offset = meta_offsets_offset + (len(docs) + 1) * 8
+    metas_offset = keys_offset + len(docs) * KEY.size
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(DOCS_HEADER.pack(DOCS_MAGIC, len(docs), lengths_offset, meta_offsets_offset,
+                                 keys_offset, metas_offset))
+        f.write(lengths.tobytes())
+        f.write(meta_offsets.tobytes())
+        f.write(b"".join(KEY.pack(key, doc) for key, doc in keys))
+        for _, meta, _ in docs:
+            f.write(meta)
+    os.replace(f"{path}.tmp", path)
+
+
+class Segment:
+    """One immutable, memory-mapped segment: its lexicon and postings (.idx) and its docs table (.docs)"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        # Searches in flight on this segment; a replaced segment is unmapped once the last one finishes
+        self._refs = 0
+        self._retired = False
+        self._refs_lock = threading.Lock()
+
+        self._file = open(os.path.join(directory, f"{name}.idx"), "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._docs_file = open(os.path.join(directory, f"{name}.docs"), "rb")
+        except BaseException:
+            if hasattr(self, "_mm"):
+                self._mm.close()
+            self._file.close()
+            raise
+        self._docs_mm = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_terms, self.postings_offset, self.terms_offset, self.entries_offset = \
+            HEADER.unpack_from(self._mm, 0)
+        docs_magic, self.n_docs, self.lengths_offset, self.meta_offsets_offset, self.keys_offset, \
+            self.metas_offset = DOCS_HEADER.unpack_from(self._docs_mm, 0)
+        if magic != MAGIC or docs_magic != DOCS_MAGIC:
+            self._unmap()
+            raise ValueError(f"{name} is not a lexical index segment")
+
+    def _entry(self, i: int):
+        return ENTRY.unpack_from(self._mm, self.entries_offset + i * ENTRY.size)
+
+    def _term(self, entry) -> bytes:
+        start = self.terms_offset + entry[0]
+        return self._mm[start:start + entry[1]]
+
+    def _postings(self, entry) -> List[Tuple[int, int]]:
+        start = self.postings_offset + entry[2]
+        values = _uint32_array(self._mm[start:start + entry[3] * POSTING_SIZE])
+        return list(zip(values[0::2], values[1::2]))
+
+    def postings(self, term: bytes) -> List[Tuple[int, int]]:
+        """Binary-search the lexicon for a term and return its (doc, tf) postings"""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(self._entry(mid)) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms:
+            entry = self._entry(lo)
+            if self._term(entry) == term:
+                return self._postings(entry)
+        return []
+
+    def iter_terms(self):
+        """Yield (term, postings) in term order, used when merging segments"""
+        for i in range(self.n_terms):
+            entry = self._entry(i)
+            yield self._term(entry), self._postings(entry)
+
+    def length(self, doc: int) -> int:
+        return LENGTH.unpack_from(self._docs_mm, self.lengths_offset + doc * LENGTH.size)[0]
+
+    def meta_bytes(self, doc: int) -> bytes:
+        start, end = META_RANGE.unpack_from(self._docs_mm, self.meta_offsets_offset + doc * 8)
+        return self._docs_mm[self.metas_offset + start:self.metas_offset + end]
+
+    def meta(self, doc: int) -> Dict:
+        return json.loads(self.meta_bytes(doc))
+
+    def find(self, publication_number: str) -> Optional[int]:
+        """Binary-search the keys for a patent, return its doc id or None"""
+        key = doc_key(publication_number)
+        lo, hi = 0, self.n_docs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self._docs_mm, self.keys_offset + mid * KEY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        # Hashes can collide, check the candidates' metas
+        for i in range(lo, self.n_docs):
+            found_key, doc = KEY.unpack_from(self._docs_mm, self.keys_offset + i * KEY.size)
+            if found_key != key:
+                break
+            if self.meta(doc)["publication_number"] == publication_number:
+                return doc
+        return None
+
+    def acquire(self):
+        with self._refs_lock:
+            self._refs += 1
+
+    def release(self):
+        with self._refs_lock:
+            self._refs -= 1
+            unmap = self._retired and self._refs == 0
+        if unmap:
+            self._unmap()
+
+    def close(self):
+        """Unmap the segment now, or when the last search still reading it releases it"""
+        with self._refs_lock:
+            self._retired = True
+            unmap = self._refs == 0
+        if unmap:
+            self._unmap()
+
+    def _unmap(self):
+        self._mm.close()
+        self._file.close()
+        self._docs_mm.close()
+        self._docs_file.close()
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over patent titles, abstracts, claims and assignees.
+
+    Documents added during ingestion are buffered and written out as small
+    immutable segments. Indexing a patent again marks its older copy
+    deleted in a per-segment bitmap, and segments of a similar size are
+    merged once MERGE_FACTOR of them pile up. The manifest lists the live
+    segments with their deletions and counts and is replaced atomically, so
+    the API can reload the index while ingestion keeps writing. Opening or
+    reloading the index maps the segments it has not mapped yet and reads
+    the deletion bitmaps; nothing is parsed per document.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pending = {}
+        self.segments = []  # (segment, deletion bitmap) of each segment in the loaded manifest
+        self.doc_count = 0
+        self.avg_length = 0.0
+        self.manifest_mtime = None
+        self._mapped = {}  # Segment name -> Segment, reused across reloads
+        self._deletes = {}  # Deletion bitmap file -> its contents
+        # Guards swapping in a new set of segments against searches picking theirs up
+        self.lock = threading.Lock()
+        # One reload at a time when several API threads notice a new manifest
+        self.reload_lock = threading.Lock()
+        self.load()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return empty_manifest()
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{self._manifest_path()} was written by an older version of the index, "
+                             f"rebuild it with: python lexical_index.py --rebuild")
+        return manifest
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _manifest_stat(self):
+        try:
+            return os.stat(self._manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _segment(self, name: str) -> Segment:
+        segment = self._mapped.get(name)
+        if segment is None:
+            segment = Segment(self.directory, name)
+            with self.lock:
+                self._mapped[name] = segment
+        return segment
+
+    def _read_deletes(self, filename: Optional[str]) -> bytes:
+        if filename is None:
+            return b""
+        deletes = self._deletes.get(filename)
+        if deletes is None:
+            with open(os.path.join(self.directory, filename), "rb") as f:
+                deletes = self._deletes[filename] = f.read()
+        return deletes
+
+    def load(self):
+        """(Re)read the manifest, mapping only the segments that are new since the last load"""
+        for attempt in range(3):
+            self.manifest_mtime = self._manifest_stat()
+            manifest = self._read_manifest()
+            try:
+                segments = [(self._segment(entry["name"]), self._read_deletes(entry["deletes"]))
+                            for entry in manifest["segments"]]
+                break
+            except FileNotFoundError:
+                # Merged away by the writer between reading the manifest and opening its files
+                if attempt == 2:
+                    raise
+        doc_count = sum(entry["docs"] - entry["deleted"] for entry in manifest["segments"])
+        total_length = sum(entry["live_length"] for entry in manifest["segments"])
+
+        in_use = {segment.name for segment, _ in segments}
+        with self.lock:
+            self.segments = segments
+            self.doc_count = doc_count
+            self.avg_length = total_length / doc_count if doc_count else 0.0
+            old_segments = [segment for name, segment in self._mapped.items() if name not in in_use]
+            self._mapped = {name: segment for name, segment in self._mapped.items() if name in in_use}
+        live_deletes = {entry["deletes"] for entry in manifest["segments"]}
+        self._deletes = {name: value for name, value in self._deletes.items() if name in live_deletes}
+        for segment in old_segments:
+            segment.close()
+
+    def reload_if_changed(self) -> bool:
+        """Reload when another process (ingestion) has published new segments"""
+        with self.reload_lock:
+            if self._manifest_stat() != self.manifest_mtime:
+                self.load()
+                return True
+        return False
+
+    def _acquire(self):
+        """The current (segments, doc count, average length), held until _release"""
+        with self.lock:
+            for segment, _ in self.segments:
+                segment.acquire()
+            return self.segments, self.doc_count, self.avg_length
+
+    def _release(self, segments):
+        for segment, _ in segments:
+            segment.release()
+
+    def add(self, patent_data: Dict):
+        """Buffer one patent; a new segment is written every FLUSH_DOCS patents"""
+        meta = document_meta(patent_data)
+        tokens = tokenize(document_text(patent_data))
+        self.pending[meta["publication_number"]] = (meta, Counter(tokens), len(tokens))
+        if len(self.pending) >= FLUSH_DOCS:
+            self.flush()
+
+    def flush(self):
+        """Write buffered patents as a new segment, delete their older copies and publish both"""
+        if not self.pending:
+            return
+
+        docs = []
+        postings = defaultdict(list)
+        for doc, (meta, term_counts, length) in enumerate(self.pending.values()):
+            docs.append((meta["publication_number"], encode_meta(meta), length))
+            for term, tf in term_counts.items():
+                postings[term.encode("utf-8")].append((doc, tf))
+
+        manifest = self._read_manifest()
+        self._delete_older_copies(manifest, list(self.pending))
+        entry = self._write_segment(manifest, docs, sorted(postings.items()))
+        manifest["segments"].append(entry)
+        self._write_manifest(manifest)
+        print(f"Wrote lexical index segment {entry['name']} with {len(docs)} patents")
+        self.pending.clear()
+
+        self.load()
+        self._merge_tiers()
+        self._remove_unused_files(self._read_manifest())
+
+    def _delete_older_copies(self, manifest, publication_numbers):
+        """Mark the live copies of these patents in the manifest's segments deleted, as new bitmap files"""
+        for entry in manifest["segments"]:
+            segment = self._segment(entry["name"])
+            deletes = bytearray(self._read_deletes(entry["deletes"]))
+            deleted = []
+            for number in publication_numbers:
+                doc = segment.find(number)
+                if doc is not None and not is_deleted(deletes, doc):
+                    deleted.append(doc)
+            if not deleted:
+                continue
+            deletes.extend(bytes((segment.n_docs + 7) // 8 - len(deletes)))
+            for doc in deleted:
+                deletes[doc >> 3] |= 1 << (doc & 7)
+            filename = f"{entry['name']}.del-{manifest['next_generation']:06d}"
+            manifest["next_generation"] += 1
+            path = os.path.join(self.directory, filename)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(deletes)
+            os.replace(f"{path}.tmp", path)
+            entry["deletes"] = filename
+            entry["deleted"] += len(deleted)
+            entry["live_length"] -= sum(segment.length(doc) for doc in deleted)
+
+    def _write_segment(self, manifest, docs, terms) -> Dict:
+        name = f"seg-{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        write_segment(os.path.join(self.directory, f"{name}.idx"), terms)
+        write_docs(os.path.join(self.directory, f"{name}.docs"), docs)
+        return {"name": name, "docs": len(docs), "deleted": 0, "deletes": None,
+                "live_length": sum(length for _, _, length in docs)}
+
+    def _merge_tiers(self):
+        """Merge the segments of the smallest size tier that has MERGE_FACTOR of them, until none has"""
+        while True:
+            tiers = defaultdict(list)
+            for entry in self._read_manifest()["segments"]:
+                tiers[size_tier(entry["docs"] - entry["deleted"])].append(entry["name"])
+            full = [names for _, names in sorted(tiers.items()) if len(names) >= MERGE_FACTOR]
+            if not full:
+                return
+            self._merge(full[0])
+
+    def compact(self):
+        """Merge all segments into one, dropping deleted copies of re-ingested patents"""
+        names = [entry["name"] for entry in self._read_manifest()["segments"]]
+        if len(names) >= 2:
+            self._merge(names)
+
+    def _merge(self, names):
+        """Replace the named segments by one holding their live patents"""
+        manifest = self._read_manifest()
+        entries = [entry for entry in manifest["segments"] if entry["name"] in names]
+        merged = [(self._segment(entry["name"]), self._read_deletes(entry["deletes"])) for entry in entries]
+
+        # New doc ids for the live documents, in segment order
+        docs = []
+        remap = []
+        for segment, deletes in merged:
+            segment_remap = {}
+            for doc in range(segment.n_docs):
+                if not is_deleted(deletes, doc):
+                    segment_remap[doc] = len(docs)
+                    meta = segment.meta_bytes(doc)
+                    docs.append((json.loads(meta)["publication_number"], meta, segment.length(doc)))
+            remap.append(segment_remap)
+
+        def tagged_terms(seg_index, segment):
+            for term, postings in segment.iter_terms():
+                yield term, seg_index, postings
+
+        def merged_terms():
+            streams = [tagged_terms(seg_index, segment) for seg_index, (segment, _) in enumerate(merged)]
+            merged_streams = heapq.merge(*streams, key=lambda item: (item[0], item[1]))
+            for term, group in groupby(merged_streams, key=lambda item: item[0]):
+                postings = [
+                    (remap[seg_index][doc], tf)
+                    for _, seg_index, segment_postings in group
+                    for doc, tf in segment_postings
+                    if doc in remap[seg_index]
+                ]
+                if postings:
+                    yield term, postings
+
+        # Each patent is live in one segment only, so the merged segment can go anywhere in the list
+        manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in names]
+        if docs:
+            entry = self._write_segment(manifest, docs, merged_terms())
+            manifest["segments"].append(entry)
+        self._write_manifest(manifest)
+        print(f"Merged {len(entries)} lexical index segments ({len(docs)} patents)")
+
+        self.load()
+        self._remove_unused_files(manifest)
+
+    def _remove_unused_files(self, manifest):
+        """Delete segment and deletion files no longer in the manifest (mapped files may still be busy on Windows)"""
+        in_use = set()
+        for entry in manifest["segments"]:
+            in_use.update((f"{entry['name']}.idx", f"{entry['name']}.docs", entry["deletes"]))
+        for filename in os.listdir(self.directory):
+            if not filename.startswith("seg-") or filename in in_use:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+    def search(self, query: str, k: int, assignee: Optional[str] = None,
+               min_day: Optional[int] = None, max_day: Optional[int] = None) -> List[Tuple[Dict, float]]:
+        """Return the k best (meta, BM25 score) pairs, optionally filtered like /search"""
+        # Search the segments loaded when the call started, even if a reload replaces them meanwhile
+        segments, doc_count, avg_length = self._acquire()
+        try:
+            return self._search(segments, doc_count, avg_length, query, k, assignee, min_day, max_day)
+        finally:
+            self._release(segments)
+
+    def _search(self, segments, doc_count, avg_length, query, k, assignee, min_day, max_day):
+        if not doc_count:
+            return []
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_bytes = term.encode("utf-8")
+            live_postings = [
+                (seg_index, doc, tf)
+                for seg_index, (segment, deletes) in enumerate(segments)
+                for doc, tf in segment.postings(term_bytes)
+                if not is_deleted(deletes, doc)
+            ]
+            if not live_postings:
+                continue
+            df = len(live_postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for seg_index, doc, tf in live_postings:
+                length = segments[seg_index][0].length(doc)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[(seg_index, doc)] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        def matches(meta):
+            if assignee and meta["assignee"] != assignee:
+                return False
+            if min_day is not None and meta["filing_day"] < min_day:
+                return False
+            if max_day is not None and meta["filing_day"] > max_day:
+                return False
+            return True
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        hits = []
+        for (seg_index, doc), score in ranked:
+            meta = segments[seg_index][0].meta(doc)
+            if matches(meta):
+                hits.append((meta, score))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def close(self):
+        with self.lock:
+            old_segments = list(self._mapped.values())
+            self.segments = []
+            self._mapped = {}
+        for segment in old_segments:
+            segment.close()
+
+
+def rebuild(directory: str = INDEX_DIR, store_dir: str = STORE_DIR):
+    """Build the index from scratch over every patent in the patent store"""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    # Keep numbering after the old segments, whatever their format, so none is overwritten in place
+    try:
+        with open(manifest_path, "r") as f:
+            next_segment = json.load(f).get("next_segment", 1)
+    except FileNotFoundError:
+        next_segment = 1
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(empty_manifest(next_segment), f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    index = LexicalIndex(directory)
+
+    with SegmentStore(store_dir) as store:
+        print(f"Indexing {len(store)} patents from {store_dir}/")
+        for patent_no, patent_data in store.iter_records():
+            patent_data["publication_number"] = patent_no
+            index.add(patent_data)
+    index.flush()
+    index.compact()
+    index._remove_unused_files(index._read_manifest())
+    index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the BM25 lexical patent index")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the patent store")
+    parser.add_argument("--store", default=STORE_DIR, help="Directory of the patent segment store")
+    parser.add_argument("--query", help="Run a lexical query against the index")
+    parser.add_argument("-k", type=int, default=10, help="Number of hits for --query")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild(store_dir=args.store)
+    if args.query:
+        index = LexicalIndex()
+        for meta, score in index.search(args.query, args.k):
+            print(f"{score:8.3f}  {meta['publication_number']}  {meta['title']}")
+        index.close()
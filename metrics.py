@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Tuple
+
+METRICS_PORT = 9108  # Port of the ingestion process's /metrics endpoint
+METRICS_FILE = "ingest_metrics.jsonl"  # Rolling file of ingestion metric snapshots
+METRICS_FILE_MAX_BYTES = 5 * 1024 * 1024  # Size at which the file is rotated to METRICS_FILE.1
+METRICS_FILE_BACKUPS = 3
+SNAPSHOT_INTERVAL = 60.0  # Seconds between snapshots written to the rolling file
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Monotonic count per label combination"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {",".join(key) or "": value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    """Current value per label combination"""
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count of observations per label combination"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, *labels, value: float):
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.values.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                ",".join(key) or "": {"count": series[-1], "sum": round(series[-2], 6)}
+                for key, series in self.values.items()
+            }
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+REGISTRY = Registry()
+
+# Ingestion: fetch, parse, embed, chroma_write, ...; the stage label keeps the
+# metric names few and lets one dashboard panel compare where the time goes
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "patent_stage_duration_seconds", "Time spent in one call of an ingestion stage", ["stage"]))
+STAGE_ITEMS = REGISTRY.register(Counter(
+    "patent_stage_items_total", "Items (pages, patents, passages) completed by an ingestion stage", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "patent_stage_errors_total", "Failed calls of an ingestion stage", ["stage"]))
+# IPFS API calls by endpoint (add, pin/add, files/cp, ...)
+IPFS_SECONDS = REGISTRY.register(Histogram(
+    "ipfs_request_duration_seconds", "Round trip of one IPFS API call", ["endpoint"]))
+IPFS_ERRORS = REGISTRY.register(Counter(
+    "ipfs_request_errors_total", "IPFS API calls that failed or returned an error status", ["endpoint"]))
+# Conditional requests for patent pages already in the HTML cache
+PAGE_REVALIDATIONS = REGISTRY.register(Counter(
+    "patent_page_revalidations_total", "Conditional patent page requests by result (not_modified, modified)",
+    ["result"]))
+# Search API
+SEARCH_SECONDS = REGISTRY.register(Histogram(
+    "search_duration_seconds", "Time to answer one /search request", ["mode"]))
+SEARCH_CACHE_HITS = REGISTRY.register(Counter(
+    "search_result_cache_hits_total", "/search requests answered from the result cache", ["mode"]))
+# Set by the pipeline's status loop
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "pipeline_queue_depth", "Patents waiting in a pipeline queue", ["queue"]))
+
+
+@contextmanager
+def track(stage: str, items: int = 1):
+    """Time a block as one call of an ingestion stage, counting items on success and errors on exceptions"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(stage, value=time.perf_counter() - start)
+    STAGE_ITEMS.inc(stage, amount=items)
+
+
+def write_snapshot(path: str = METRICS_FILE, max_bytes: int = METRICS_FILE_MAX_BYTES,
+                   backups: int = METRICS_FILE_BACKUPS, registry: Registry = REGISTRY):
+    """Append one timestamped snapshot line, rotating path -> path.1 -> ... once it grows past max_bytes"""
+    if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+        for i in range(backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        os.replace(path, f"{path}.1")
+    line = json.dumps({"time": time.time(), "pid": os.getpid(), "metrics": registry.snapshot()})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+class SnapshotWriter:
+    """Background thread writing a metrics snapshot to the rolling file every interval seconds"""
+
+    def __init__(self, path: str = METRICS_FILE, interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                write_snapshot(self.path)
+            except OSError as e:
+                print(f"Error writing metrics to {self.path}: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        write_snapshot(self.path)
+
+
+def start_http_server(port: int = METRICS_PORT, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Serve GET /metrics on a background thread; returns the server"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
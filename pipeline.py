@@ -0,0 +1,272 @@
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import getlinks_final
+from ingest_state import IngestState
+from metrics import start_http_server, SnapshotWriter, QUEUE_DEPTH, METRICS_PORT, METRICS_FILE
+from ipfs_handler import IPFSHandler
+from rate_limiter import HostRateLimiter
+from url_frontier import URLFrontier, FRONTIER_FILE
+# Importing working loads the embedding model, once for the life of the process
+from working import (
+    PatentProcessor, discover_new_urls, load_pending, fetch_patent, close_html_cache,
+    MAX_WORKERS, MIN_REQUEST_INTERVAL, EMBED_BATCH_SIZE, FLUSH_INTERVAL, FRONTIER_CONSUMER
+)
+
+DISCOVERY_INTERVAL = 6 * 60 * 60  # Seconds between discovery runs, as the old scheduler tick
+FEED_INTERVAL = 10.0  # Seconds between checks of patent_urls.txt for newly appended URLs
+PROCESS_QUEUE_SIZE = 32  # Fetched patents waiting to be processed before fetchers block
+INDEX_QUEUE_SIZE = 256  # Uploaded patents waiting to be embedded before the uploader blocks
+POLL_INTERVAL = 1.0  # Seconds a stage waits on its queue before checking for idle flushes and shutdown
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    """
+    Long-running, in-process version of running getlinks_final.py and then
+    working.py every few hours. Stages are threads joined by queues:
+
+        discovery -> patent_urls.txt -> feed -> fetch queue -> fetchers
+                  -> process queue -> uploader (local copy, IPFS)
+                  -> index queue -> indexer (embed, ChromaDB, lexical index)
+
+    Discovery appends to the URL frontier as before; the feed thread tails
+    the frontier, so a newly found patent is fetched within seconds instead
+    of at the next tick. The uploader owns the IPFS handler and the indexer
+    owns ChromaDB, the embedding model and the lexical index, so uploads to
+    a slow node overlap with embedding instead of waiting for it. There is
+    one thread of each: a single daemon connection already pipelines the
+    uploads, and a single writer keeps every ChromaDB batch one encode call
+    and one transaction. Each flushes its partial batch once it has been
+    idle for flush_interval. Progress is kept in the ingest state store
+    (shared by both, under its lock), so stopping the pipeline at any point
+    loses nothing.
+    """
+
+    def __init__(self, workers=MAX_WORKERS, min_request_interval=MIN_REQUEST_INTERVAL,
+                 batch_size=EMBED_BATCH_SIZE, flush_interval=FLUSH_INTERVAL, ipfs_bulk_size=0,
+                 discovery_interval=DISCOVERY_INTERVAL, feed_interval=FEED_INTERVAL,
+                 discovery_backend=getlinks_final.BACKEND, discover=True,
+                 metrics_port=METRICS_PORT, metrics_file=METRICS_FILE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ipfs_bulk_size = ipfs_bulk_size
+        self.discovery_interval = discovery_interval
+        self.feed_interval = feed_interval
+        self.discovery_backend = discovery_backend
+        self.discover = discover
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_server = None
+        self.metrics_writer = None
+
+        self.rate_limiter = HostRateLimiter(min_request_interval)
+        self.fetch_queue = queue.Queue()
+        self.process_queue = queue.Queue(maxsize=PROCESS_QUEUE_SIZE)
+        self.index_queue = queue.Queue(maxsize=INDEX_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.fetchers_done = threading.Event()
+        self.uploads_done = threading.Event()
+        self.threads = []
+
+        self.state = IngestState()
+        self.ipfs_handler = IPFSHandler()
+        self.processor = PatentProcessor(self.state, self.ipfs_handler, batch_size, flush_interval, ipfs_bulk_size,
+                                         index_queue=self.index_queue)
+
+    def start(self):
+        if self.metrics_port:
+            self.metrics_server = start_http_server(self.metrics_port)
+            print(f"Serving metrics on http://127.0.0.1:{self.metrics_port}/metrics")
+        if self.metrics_file:
+            self.metrics_writer = SnapshotWriter(self.metrics_file).start()
+
+        with URLFrontier() as frontier:
+            if self.state.created:
+                # A new state store has to see the whole list once
+                frontier.set_cursor(FRONTIER_CONSUMER, 0)
+            new_patents = discover_new_urls(self.state, frontier)
+        pending, resumed = load_pending(self.state, self.ipfs_handler.store)
+        logger.info(f"Pipeline starting: {len(new_patents)} new URLs, {len(pending)} to fetch, "
+                    f"{len(resumed)} to resume")
+        print(f"Fetching {len(pending)} pending patents, resuming {len(resumed)} with {self.workers} workers...")
+        for item in pending:
+            self.fetch_queue.put(item)
+
+        self._spawn("indexer", self._index)
+        self._spawn("uploader", self._upload, resumed)
+        for i in range(self.workers):
+            self._spawn(f"fetcher-{i}", self._fetch)
+        self._spawn("feed", self._feed)
+        if self.discover:
+            self._spawn("discovery", self._discover)
+
+    def _spawn(self, name, target, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _discover(self):
+        """Run the recent-patents scraper now and then every discovery_interval seconds"""
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            logger.info("Starting patent discovery")
+            print(f"\nRunning patent discovery at {datetime.now()}")
+            try:
+                links = getlinks_final.getLinks(backend=self.discovery_backend)
+                logger.info(f"Discovery finished: {len(links)} new patents")
+            except Exception as e:
+                logger.error(f"Error in patent discovery: {e}")
+                print(f"Error in patent discovery: {e}")
+            self.stop_event.wait(max(0.0, self.discovery_interval - (time.monotonic() - started)))
+
+    def _feed(self):
+        """Hand URLs appended to patent_urls.txt to the fetchers as soon as they appear"""
+        with URLFrontier() as frontier:
+            while not self.stop_event.wait(self.feed_interval):
+                if not os.path.exists(FRONTIER_FILE):
+                    continue
+                try:
+                    new_patents = discover_new_urls(self.state, frontier)
+                except Exception as e:
+                    logger.error(f"Error reading new URLs: {e}")
+                    continue
+                if new_patents:
+                    logger.info(f"Queued {len(new_patents)} newly discovered patents")
+                    print(f"\nQueued {len(new_patents)} newly discovered patents")
+                for item in new_patents:
+                    self.fetch_queue.put(item)
+
+    def _fetch(self):
+        while not self.stop_event.is_set():
+            try:
+                url, patent_no = self.fetch_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                patent_data = fetch_patent(url, self.rate_limiter)
+            except Exception as e:
+                print(f"Error fetching patent URL {url}: {str(e)}")
+                patent_data = None
+            # Patents still queued at shutdown stay "discovered" in the state store and are fetched next start
+            self.process_queue.put((url, patent_no, patent_data))
+
+    def _drain(self, source, done, handle, flush):
+        """
+        Call handle on every item of source until done is set and source is
+        empty, and flush once nothing has arrived for flush_interval. The
+        queue is polled every POLL_INTERVAL, so shutdown never waits for the
+        idle timer.
+        """
+        last_item = time.monotonic()
+        while not (done.is_set() and source.empty()):
+            try:
+                item = source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if last_item is not None and time.monotonic() - last_item >= self.flush_interval:
+                    # Nothing arrived for a while, do not let a partial batch wait any longer
+                    try:
+                        flush()
+                    except Exception as e:
+                        logger.error(f"Error flushing batches: {e}")
+                    last_item = None
+                continue
+            last_item = time.monotonic()
+            try:
+                handle(*item)
+            except Exception as e:
+                logger.error(f"Error in {threading.current_thread().name} on {item[0]}: {e}")
+        flush()
+
+    def _upload(self, resumed):
+        processor = self.processor
+        try:
+            for patent_no, stage, patent_data in resumed:
+                if self.stop_event.is_set():
+                    break
+                processor.resume(patent_no, stage, patent_data)
+            self._drain(self.process_queue, self.fetchers_done, processor.process_fetched, processor.upload_queued)
+        finally:
+            self.uploads_done.set()
+
+    def _index(self):
+        self._drain(self.index_queue, self.uploads_done, self.processor.index, self.processor.flush_index)
+
+    def stop(self):
+        """Finish the patents in flight, flush every batch and close the stores"""
+        logger.info("Stopping pipeline")
+        self.stop_event.set()
+        # The feed thread writes discovered patents to the state store, so it has to be out before it closes
+        for thread in self.threads:
+            if thread.name == "feed" or thread.name.startswith("fetcher-"):
+                thread.join()
+        self.fetchers_done.set()
+        # The uploader sets uploads_done when it finishes, then the indexer drains what it handed over
+        for thread in self.threads:
+            if thread.name in ("uploader", "indexer"):
+                thread.join()
+        # The discovery thread may be inside a scrape; it does not touch the stores and saves its own progress
+        try:
+            self.processor.close()
+        finally:
+            self.ipfs_handler.close()
+            self.state.close()
+            close_html_cache()
+            if self.metrics_writer is not None:
+                self.metrics_writer.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
+        print(f"\nPipeline stopped. Patents processed this run: {len(self.processor.processed_patents)}")
+
+    def run_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(60)
+                QUEUE_DEPTH.set("fetch", value=self.fetch_queue.qsize())
+                QUEUE_DEPTH.set("process", value=self.process_queue.qsize())
+                QUEUE_DEPTH.set("index", value=self.index_queue.qsize())
+                counts = self.state.stage_counts()
+                print(f"\r{datetime.now():%Y-%m-%d %H:%M} queued: {self.fetch_queue.qsize()} "
+                      f"fetched: {self.process_queue.qsize()} uploaded: {self.index_queue.qsize()} "
+                      + " ".join(f"{name}: {count}" for name, count in counts.items()), end="", flush=True)
+        except KeyboardInterrupt:
+            print("\nInterrupted, finishing the patents in flight...")
+        finally:
+            self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover, fetch, embed, store and pin patents in one long-running process")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Number of patent pages fetched concurrently")
+    parser.add_argument("--min-request-interval", type=float, default=MIN_REQUEST_INTERVAL,
+                        help="Minimum seconds between requests to the same host")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Number of passages embedded and stored in ChromaDB per batch")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="Seconds without new patents before a partial batch is flushed")
+    parser.add_argument("--ipfs-bulk", type=int, default=0, metavar="N",
+                        help="Upload fetched patents to IPFS N at a time in one /add call")
+    parser.add_argument("--discovery-hours", type=float, default=DISCOVERY_INTERVAL / 3600,
+                        help="Hours between patent discovery runs")
+    parser.add_argument("--discovery-backend", choices=["http", "selenium"], default=getlinks_final.BACKEND,
+                        help="Backend used by the discovery stage")
+    parser.add_argument("--no-discovery", action="store_true",
+                        help="Only process URLs already in, or appended to, patent_urls.txt")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Port of the Prometheus /metrics endpoint, 0 to disable")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(message)s')
+    Pipeline(workers=args.workers, min_request_interval=args.min_request_interval,
+             batch_size=args.batch_size, flush_interval=args.flush_interval, ipfs_bulk_size=args.ipfs_bulk,
+             discovery_interval=args.discovery_hours * 3600, discovery_backend=args.discovery_backend,
+             discover=not args.no_discovery, metrics_port=args.metrics_port).run_forever()
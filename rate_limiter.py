@@ -0,0 +1,29 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """
+    Thread-safe rate limiter that spaces out requests to the same host.
+
+    Each call to wait() reserves the next free slot for the URL's host, so
+    several workers can share one limiter without bursting a single site.
+    """
+
+    def __init__(self, min_interval: float = 2.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url: str) -> float:
+        """Block until a request to the URL's host is allowed, return the delay"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
@@ -5,6 +5,7 @@ import sys
 from datetime import datetime
 import logging
 import os
+import argparse
 from dotenv import load_dotenv
 
 # Set up logging with UTF-8 encoding
@@ -34,15 +35,21 @@ def run_process_with_output(command, env=None):
         env=env
     )
     
-    while True:
-        output = process.stdout.readline()
-        if output:
-            print(output.strip())
-            logging.info(output.strip())
-        if process.poll() is not None:
-            break
+    # Blocks until the next line or EOF, instead of polling readline/poll in a loop
+    for output in process.stdout:
+        print(output.strip())
+        logging.info(output.strip())
     
-    return process.returncode
+    return process.wait()
+
+def ensure_ipfs_daemon():
+    """Start the IPFS daemon if it is not running"""
+    ipfs_check = subprocess.run(['ipfs', 'id'], capture_output=True)
+    if ipfs_check.returncode != 0:
+        logging.error("IPFS daemon not running. Starting daemon...")
+        print("IPFS daemon not running. Starting daemon...")
+        subprocess.Popen(['ipfs', 'daemon'])
+        time.sleep(30)  # Wait for daemon to start
 
 def run_scraper():
     try:
@@ -52,12 +59,7 @@ def run_scraper():
         print(f"{'='*50}\n")
         
         # Check if IPFS daemon is running
-        ipfs_check = subprocess.run(['ipfs', 'id'], capture_output=True)
-        if ipfs_check.returncode != 0:
-            logging.error("IPFS daemon not running. Starting daemon...")
-            print("IPFS daemon not running. Starting daemon...")
-            subprocess.Popen(['ipfs', 'daemon'])
-            time.sleep(30)  # Wait for daemon to start
+        ensure_ipfs_daemon()
         
         # Run getlinks_final.py with real-time output
         print("\nRunning getlinks_final.py to fetch new patents...")
@@ -94,12 +96,8 @@ def run_scraper():
         print(f"\nScheduler error: {str(e)}")
         print(f"{'='*50}\n")
 
-def main():
-    print(f"\n{'='*50}")
-    print("Patent Scraper Scheduler Starting...")
-    print(f"{'='*50}\n")
-    logging.info("Scheduler started")
-    
+def run_subprocess_scheduler():
+    """The old mode: getlinks_final.py and working.py as fresh processes every 6 hours"""
     # Schedule the job every 6 hours
     schedule.every(6).hours.do(run_scraper)
     
@@ -113,5 +111,29 @@ def main():
         schedule.run_pending()
         time.sleep(60)
 
+def main():
+    parser = argparse.ArgumentParser(description="Keep discovering and processing new patents")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="Run getlinks_final.py and working.py as subprocesses every 6 hours "
+                             "instead of the in-process pipeline")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of patent pages fetched concurrently by the pipeline")
+    args = parser.parse_args()
+
+    print(f"\n{'='*50}")
+    print("Patent Scraper Scheduler Starting...")
+    print(f"{'='*50}\n")
+    logging.info("Scheduler started")
+    
+    if args.subprocess:
+        run_subprocess_scheduler()
+        return
+
+    ensure_ipfs_daemon()
+    # Imported here so --subprocess does not load the model and stores it never uses
+    from pipeline import Pipeline
+    logging.info("Running the in-process pipeline")
+    Pipeline(workers=args.workers).run_forever()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
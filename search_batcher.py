@@ -0,0 +1,104 @@
+import asyncio
+import json
+from collections import defaultdict
+
+MAX_BATCH_SIZE = 32  # Queries encoded together in one forward pass
+MAX_WAIT_MS = 5  # How long the first query of a batch waits for company
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+
+
+class QueryBatcher:
+    """
+    Micro-batcher that coalesces concurrent /search queries.
+
+    Queries arriving within max_wait_ms of each other (up to max_batch_size)
+    are encoded in one model.encode call, and queries that share the same
+    n_results and where filter are sent to ChromaDB as one multi-query
+    collection.query. Batches run one at a time on a worker thread, so
+    concurrent requests no longer fight over the CPU with tiny forward passes.
+    """
+
+    def __init__(self, model, collection, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def search(self, query: str, n_results: int, where=None, embedding=None):
+        """
+        Queue one query and wait for its (embedding, collection.query results).
+        A known embedding, e.g. from a cache, skips the encode step.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, n_results, where, embedding, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(None, self._encode_and_query, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _encode_and_query(self, batch):
+        """Encode every new query of a batch at once, then run one query per filter group"""
+        embeddings = [embedding for _, _, _, embedding, _ in batch]
+        to_encode = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if to_encode:
+            encoded = self.model.encode([batch[i][0] for i in to_encode], batch_size=len(to_encode))
+            for i, embedding in zip(to_encode, encoded):
+                embeddings[i] = embedding.tolist()
+
+        groups = defaultdict(list)
+        for i, (_, n_results, where, _, _) in enumerate(batch):
+            groups[(n_results, json.dumps(where, sort_keys=True))].append(i)
+
+        results = [None] * len(batch)
+        for (n_results, _), indexes in groups.items():
+            where = batch[indexes[0]][2]
+            group_results = self.collection.query(
+                query_embeddings=[embeddings[i] for i in indexes],
+                n_results=n_results,
+                where=where
+            )
+            for position, i in enumerate(indexes):
+                results[i] = (embeddings[i], {
+                    field: [group_results[field][position]]
+                    for field in RESULT_FIELDS
+                    if group_results.get(field) is not None
+                })
+        return results
@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import zstandard
+
+STORE_DIR = "patent_store"
+INDEX_FILE = "index.db"
+LEGACY_JSON_DIR = "patent_json"  # One pretty-printed file per patent, before the segment store
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # A new segment is started once the current one reaches this size
+ZSTD_LEVEL = 9
+MIGRATE_BATCH = 500  # Patents written per transaction by the migration
+COMPACT_BATCH = 1000  # Records repointed per index transaction by a compaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    patent_no TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS records_position ON records (segment, offset);
+CREATE TABLE IF NOT EXISTS retired_segments (
+    segment INTEGER PRIMARY KEY
+);
+"""
+
+
+def segment_name(number: int) -> str:
+    return f"seg-{number:06d}.zst"
+
+
+def encode_record(patent_data: Dict) -> bytes:
+    return json.dumps(patent_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class SegmentStore:
+    """
+    Append-only store of patent records: compact JSON, one zstd frame per
+    record, appended to segment files of up to SEGMENT_MAX_BYTES, with an
+    SQLite index of patent number -> (segment, offset, length).
+
+    A read is one index lookup, one seek and one frame decompression; a full
+    scan reads the segments front to back. Rewriting a patent appends a new
+    frame and repoints the index, the old frame stays behind until compact().
+    Every append runs inside an IMMEDIATE transaction on the index, so
+    writers in different processes take turns on the segment files.
+    """
+
+    def __init__(self, directory: str = STORE_DIR, level: int = ZSTD_LEVEL,
+                 segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # Shared by the pipeline's threads; every use of the connection holds the lock
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_FILE), timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self._local = threading.local()
+        self.write_file = None
+        self.write_segment = None
+        self.read_files = {}
+        # Segments a compaction could not delete yet, e.g. still open in the API on Windows
+        self._remove_retired()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, segment_name(number))
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def _open_for_append(self, number: int):
+        if self.write_segment != number:
+            if self.write_file is not None:
+                self.write_file.close()
+            self.write_file = open(self._segment_path(number), "ab")
+            self.write_segment = number
+        # Another process may have appended since, always write at the real end
+        return self.write_file, self.write_file.seek(0, os.SEEK_END)
+
+    def _append_frames(self, frames: List[Tuple[str, bytes]]) -> List[Tuple]:
+        """Append (patent_no, frame) pairs to the segments; returns the index rows. Call inside a transaction."""
+        row = self.conn.execute("SELECT MAX(segment) FROM records").fetchone()
+        number = row[0] or 1
+        f, offset = self._open_for_append(number)
+        rows = []
+        now = time.time()
+        for patent_no, frame in frames:
+            if offset and offset + len(frame) > self.segment_max_bytes:
+                f.flush()
+                number += 1
+                f, offset = self._open_for_append(number)
+            f.write(frame)
+            rows.append((patent_no, number, offset, len(frame), now))
+            offset += len(frame)
+        # On disk (in the OS cache) before the index points at it
+        f.flush()
+        return rows
+
+    def put(self, patent_no: str, patent_data: Dict):
+        self.put_many({patent_no: patent_data})
+
+    def put_many(self, records: Dict[str, Dict]):
+        """Append records in one transaction; a later write of a patent replaces the earlier one"""
+        if not records:
+            return
+        with self.lock:
+            frames = [(patent_no, self.compressor.compress(encode_record(patent_data)))
+                      for patent_no, patent_data in records.items()]
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._append_frames(frames)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO records (patent_no, segment, offset, length, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+    def _read_frame(self, segment: int, offset: int, length: int) -> bytes:
+        with self.lock:
+            f = self.read_files.get(segment)
+            if f is None:
+                f = self.read_files[segment] = open(self._segment_path(segment), "rb")
+            f.seek(offset)
+            return f.read(length)
+
+    def _locate(self, patent_no: str):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT segment, offset, length FROM records WHERE patent_no = ?", (patent_no,)
+            ).fetchone()
+
+    def get_bytes(self, patent_no: str) -> Optional[bytes]:
+        """The record's JSON as UTF-8 bytes, or None if the patent is not stored"""
+        location = self._locate(patent_no)
+        if location is None:
+            return None
+        try:
+            frame = self._read_frame(*location)
+        except FileNotFoundError:
+            # Compacted away between the lookup and the read, look it up again
+            self.reopen()
+            location = self._locate(patent_no)
+            if location is None:
+                return None
+            frame = self._read_frame(*location)
+        return self._decompressor().decompress(frame)
+
+    def get(self, patent_no: str) -> Optional[Dict]:
+        data = self.get_bytes(patent_no)
+        return json.loads(data) if data is not None else None
+
+    def __contains__(self, patent_no: str) -> bool:
+        return self._locate(patent_no) is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _live_rows(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT patent_no, segment, offset, length FROM records ORDER BY segment, offset"
+            ).fetchall()
+
+    def _read_rows(self, rows) -> Iterator[Tuple[Tuple, bytes]]:
+        """Yield (row, compressed frame) for index rows sorted by position, reading each segment front to back"""
+        segment, f = None, None
+        try:
+            for row in rows:
+                _, number, offset, length = row
+                if number != segment:
+                    if f is not None:
+                        f.close()
+                    segment, f = number, open(self._segment_path(number), "rb")
+                if f.tell() != offset:
+                    f.seek(offset)
+                yield row, f.read(length)
+        finally:
+            if f is not None:
+                f.close()
+
+    def iter_frames(self) -> Iterator[Tuple[str, bytes]]:
+        """Yield (patent_no, compressed frame) of every live record, reading each segment front to back"""
+        for row, frame in self._read_rows(self._live_rows()):
+            yield row[0], frame
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield (patent_no, patent data) of every stored patent, in storage order"""
+        decompressor = self._decompressor()
+        for patent_no, frame in self.iter_frames():
+            yield patent_no, json.loads(decompressor.decompress(frame))
+
+    def segment_numbers(self) -> List[int]:
+        numbers = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("seg-") and filename.endswith(".zst"):
+                numbers.append(int(filename[len("seg-"):-len(".zst")]))
+        return sorted(numbers)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            records, live_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM records").fetchone()
+        segments = self.segment_numbers()
+        segment_bytes = sum(os.path.getsize(self._segment_path(number)) for number in segments)
+        return {
+            "records": records,
+            "segments": len(segments),
+            "segment_bytes": segment_bytes,
+            "live_bytes": live_bytes,
+            "index_bytes": os.path.getsize(os.path.join(self.directory, INDEX_FILE)),
+        }
+
+    def compact(self, batch_size: int = COMPACT_BATCH):
+        """
+        Copy the live records into fresh segments and delete the old ones,
+        dropping the frames of superseded writes. Frames are streamed from
+        the old segments and the index is repointed batch_size records per
+        transaction; a record another writer rewrote in the meantime keeps
+        its new location. Old segments that cannot be deleted yet are left
+        for a later open or compaction to remove.
+        """
+        with self.lock:
+            self._remove_retired()
+            old_segments = self.segment_numbers()
+            if self.write_file is not None:
+                self.write_file.close()
+            self.write_file, self.write_segment = None, None
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._live_rows()
+                number = (old_segments[-1] if old_segments else 0) + 1
+                f, offset = self._open_for_append(number)
+                moves = []
+                for (patent_no, segment, old_offset, length), frame in self._read_rows(rows):
+                    if offset and offset + length > self.segment_max_bytes:
+                        f.flush()
+                        number += 1
+                        f, offset = self._open_for_append(number)
+                    f.write(frame)
+                    moves.append((number, offset, time.time(), patent_no, segment, old_offset))
+                    offset += length
+                    if len(moves) >= batch_size:
+                        self._commit_moves(f, moves)
+                        moves = []
+                        self.conn.execute("BEGIN IMMEDIATE")
+                        # Another process may have appended between the transactions
+                        f, offset = self._open_for_append(number)
+                self._commit_moves(f, moves, retired=old_segments)
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.reopen()
+            self._remove_retired()
+
+    def _commit_moves(self, f, moves, retired=()):
+        """Make the copied frames durable, then point their records at them and commit"""
+        f.flush()
+        os.fsync(f.fileno())
+        self.conn.executemany(
+            "UPDATE records SET segment = ?, offset = ?, updated_at = ? "
+            "WHERE patent_no = ? AND segment = ? AND offset = ?",
+            moves
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO retired_segments (segment) VALUES (?)", [(number,) for number in retired]
+        )
+        self.conn.commit()
+
+    def _remove_retired(self):
+        """Delete the segment files a compaction retired, keeping those still open elsewhere for next time"""
+        with self.lock:
+            retired = [row[0] for row in self.conn.execute("SELECT segment FROM retired_segments")]
+            removed = []
+            for number in retired:
+                try:
+                    os.remove(self._segment_path(number))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Could not remove compacted segment {segment_name(number)} yet: {e}")
+                    continue
+                removed.append((number,))
+            if removed:
+                with self.conn:
+                    self.conn.executemany("DELETE FROM retired_segments WHERE segment = ?", removed)
+
+    def reopen(self):
+        """Drop cached segment handles, e.g. after a compaction"""
+        with self.lock:
+            for f in self.read_files.values():
+                f.close()
+            self.read_files = {}
+
+    def flush(self):
+        """fsync the segment being written"""
+        with self.lock:
+            if self.write_file is not None:
+                self.write_file.flush()
+                os.fsync(self.write_file.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            self.flush()
+            if self.write_file is not None:
+                self.write_file.close()
+                self.write_file = None
+            self.reopen()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def legacy_json_files(json_dir: str = LEGACY_JSON_DIR) -> List[str]:
+    if not os.path.isdir(json_dir):
+        return []
+    return sorted(entry.path for entry in os.scandir(json_dir) if entry.name.endswith(".json"))
+
+
+def disk_usage(paths) -> int:
+    """Bytes allocated on disk for the files, whole blocks included where the OS reports them"""
+    total = 0
+    for path in paths:
+        stat = os.stat(path)
+        total += stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+    return total
+
+
+def migrate(json_dir: str = LEGACY_JSON_DIR, directory: str = STORE_DIR, remove: bool = False):
+    """Copy every patent JSON file of json_dir into the segment store, then verify it"""
+    paths = legacy_json_files(json_dir)
+    print(f"Migrating {len(paths)} patents from {json_dir}/ into {directory}/")
+    if not paths:
+        return
+    before = disk_usage(paths)
+
+    with SegmentStore(directory) as store:
+        batch = {}
+        migrated = []
+        for i, path in enumerate(paths, 1):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    batch[os.path.basename(path)[:-len(".json")]] = json.load(f)
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+                continue
+            migrated.append(path)
+            if len(batch) >= MIGRATE_BATCH or i == len(paths):
+                store.put_many(batch)
+                batch = {}
+                print(f"\r{i}/{len(paths)} patents", end="", flush=True)
+        store.put_many(batch)
+        store.flush()
+        print()
+
+        # Read every migrated record back before anything is removed
+        mismatches = 0
+        for path in migrated:
+            with open(path, "r", encoding="utf-8") as f:
+                if store.get(os.path.basename(path)[:-len(".json")]) != json.load(f):
+                    mismatches += 1
+                    print(f"Mismatch after migration: {path}")
+        stats = store.stats()
+
+    after = stats["segment_bytes"] + stats["index_bytes"]
+    print(f"{json_dir}/: {before / 1e6:.1f} MB on disk in {len(paths)} files")
+    print(f"{directory}/: {after / 1e6:.1f} MB in {stats['segments']} segments "
+          f"({before / max(after, 1):.1f}x smaller)")
+    if mismatches:
+        print(f"{mismatches} records did not read back identically, {json_dir}/ was kept")
+        return
+    if remove:
+        for path in migrated:
+            os.remove(path)
+        print(f"Removed {len(migrated)} migrated files from {json_dir}/")
+
+
+def scan_seconds(store: SegmentStore) -> float:
+    start = time.perf_counter()
+    for _ in store.iter_records():
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Patent record store: zstd segments with an offset index")
+    parser.add_argument("--dir", default=STORE_DIR, help="Store directory")
+    parser.add_argument("--migrate", action="store_true", help="Import the JSON files of --json-dir")
+    parser.add_argument("--json-dir", default=LEGACY_JSON_DIR, help="Directory of per-patent JSON files")
+    parser.add_argument("--remove-json", action="store_true",
+                        help="With --migrate, delete the JSON files once they read back identically")
+    parser.add_argument("--compact", action="store_true",
+                        help="Rewrite the live records into new segments (stop ingestion first)")
+    parser.add_argument("--get", metavar="PATENT_NO", help="Print one stored record")
+    parser.add_argument("--scan", action="store_true", help="Time a full scan of the store")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate(args.json_dir, args.dir, remove=args.remove_json)
+    with SegmentStore(args.dir) as store:
+        if args.get:
+            data = store.get_bytes(args.get)
+            if data is None:
+                sys.exit(f"{args.get} is not stored")
+            print(json.dumps(json.loads(data), indent=2, ensure_ascii=False))
+            sys.exit(0)
+        if args.compact:
+            before = store.stats()["segment_bytes"]
+            store.compact()
+            print(f"Compacted {before / 1e6:.1f} MB into {store.stats()['segment_bytes'] / 1e6:.1f} MB")
+        stats = store.stats()
+        print(f"{stats['records']} patents in {stats['segments']} segments, "
+              f"{stats['segment_bytes'] / 1e6:.1f} MB ({stats['live_bytes'] / 1e6:.1f} MB live)")
+        if args.scan:
+            print(f"Full scan: {scan_seconds(store):.2f} s")
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+getlinks = pytest.importorskip("getlinks")
+
+
+def test_date_chunks_follow_window_tiers():
+    # A window keeps the length of the era it starts in, up to the end date
+    assert list(getlinks.get_date_chunks(datetime(1899, 11, 1), datetime(1900, 1, 20))) == [
+        (datetime(1899, 11, 1), datetime(1900, 1, 20)),
+    ]
+    chunks = list(getlinks.get_date_chunks(datetime(1976, 1, 1), datetime(1976, 1, 25)))
+    assert chunks == [
+        (datetime(1976, 1, 1), datetime(1976, 1, 10)),
+        (datetime(1976, 1, 11), datetime(1976, 1, 20)),
+        (datetime(1976, 1, 21), datetime(1976, 1, 25)),
+    ]
+
+
+def test_claim_finish_fail_and_requeue(tmp_path):
+    manifest = getlinks.BackfillManifest(str(tmp_path / "backfill_manifest.db"))
+    try:
+        planned = list(getlinks.get_date_chunks(datetime(1976, 1, 1), datetime(1976, 1, 30)))
+        assert manifest.plan(planned) == 3
+        assert manifest.plan(planned) == 0
+
+        first, second = manifest.claim(), manifest.claim()
+        assert [first, second] == planned[:2]
+        manifest.finish(first[0], pages=2, patents=150, new_patents=140)
+        manifest.fail(second[0], "HTTP 500")
+        assert manifest.status_counts() == {"done": 1, "failed": 1, "pending": 1}
+
+        third = manifest.claim()
+        assert third == planned[2]
+        assert manifest.claim() is None
+
+        # A crashed run left the third window running; it is retried with the failed one
+        assert manifest.requeue() == 2
+        assert [manifest.claim(), manifest.claim(), manifest.claim()] == [second, third, None]
+        row = manifest.conn.execute(
+            "SELECT attempts, error FROM windows WHERE start_date = '1976-01-11'").fetchone()
+        assert row == (2, "HTTP 500")
+    finally:
+        manifest.close()
+
+
+def test_import_progress_marks_earlier_windows_done(tmp_path):
+    manifest = getlinks.BackfillManifest(str(tmp_path / "backfill_manifest.db"))
+    try:
+        manifest.plan(getlinks.get_date_chunks(datetime(1976, 1, 1), datetime(1976, 1, 30)))
+        manifest.import_progress(datetime(1976, 1, 20))
+        assert manifest.status_counts() == {"done": 2, "pending": 1}
+        assert manifest.claim()[0] == datetime(1976, 1, 21)
+    finally:
+        manifest.close()
+
+
+def test_replanning_later_extends_the_truncated_window(tmp_path):
+    manifest = getlinks.BackfillManifest(str(tmp_path / "backfill_manifest.db"))
+    try:
+        manifest.plan(getlinks.get_date_chunks(datetime(2024, 1, 1), datetime(2024, 1, 14)))
+        while True:
+            window = manifest.claim()
+            if window is None:
+                break
+            manifest.finish(window[0], pages=1, patents=1, new_patents=1)
+
+        # A later run on another day
+        assert manifest.plan(getlinks.get_date_chunks(datetime(2024, 1, 1), datetime(2024, 1, 25))) == 2
+        rows = manifest.conn.execute(
+            "SELECT start_date, end_date, status FROM windows ORDER BY start_date").fetchall()
+        assert rows == [
+            ("2024-01-01", "2024-01-10", "done"),
+            ("2024-01-11", "2024-01-20", "pending"),
+            ("2024-01-21", "2024-01-25", "pending"),
+        ]
+        # Consecutive windows leave no day out
+        for (_, end, _), (start, _, _) in zip(rows, rows[1:]):
+            assert datetime.strptime(start, "%Y-%m-%d") - datetime.strptime(end, "%Y-%m-%d") == timedelta(days=1)
+    finally:
+        manifest.close()
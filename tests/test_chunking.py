@@ -0,0 +1,61 @@
+from chunking import chunk_patent, content_hash, split_passages, CHUNK_WORDS, CHUNK_OVERLAP
+
+
+def patent(description_words=400):
+    return {
+        "publication_number": "US1B2",
+        "patent_title": "Widget",
+        "abstract": "A widget that turns.",
+        "inventions": ["1. A widget.", "2. The widget of claim 1."],
+        "patent_text": " ".join(f"w{i}" for i in range(description_words)),
+        "assignee_name": "Acme",
+        "filing_date": "2020-03-14",
+        "ipfs_hash": "QmHash",
+    }
+
+
+def test_split_passages_overlap_and_end():
+    words = " ".join(str(i) for i in range(10))
+    assert list(split_passages(words, chunk_words=4, overlap=1)) == [
+        (0, "0 1 2 3"), (3, "3 4 5 6"), (6, "6 7 8 9"),
+    ]
+    assert list(split_passages("   ", 4, 1)) == []
+
+
+def test_chunk_patent_sections_ids_and_metadata():
+    passages = chunk_patent(patent())
+    sections = [p["metadata"]["section"] for p in passages]
+    assert sections == ["abstract", "claims", "description", "description", "description"]
+    assert [p["id"] for p in passages][:3] == ["US1B2:abstract:0", "US1B2:claims:0", "US1B2:description:0"]
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    assert [p["metadata"]["offset"] for p in passages[2:]] == [0, step, 2 * step]
+
+    # The title rides along with the abstract only
+    assert passages[0]["text"] == "Widget\nA widget that turns."
+    # Passages are rebuilt from the words, so claim lines are joined by spaces
+    assert passages[1]["text"] == "1. A widget. 2. The widget of claim 1."
+
+    meta = passages[0]["metadata"]
+    assert meta["publication_number"] == "US1B2"
+    assert meta["assignee"] == "Acme"
+    assert meta["filing_day"] == 20200314
+    assert meta["ipfs_hash"] == "QmHash"
+    assert len({p["metadata"]["content_hash"] for p in passages}) == 1
+
+
+def test_chunk_patent_skips_placeholders():
+    data = dict(patent(0), abstract="N/A", filing_date="N/A")
+    passages = chunk_patent(data)
+    assert [p["metadata"]["section"] for p in passages] == ["claims"]
+    assert passages[0]["metadata"]["filing_day"] == 0
+
+
+def test_content_hash_tracks_passage_inputs():
+    data = patent()
+    assert content_hash(data) == content_hash(dict(data))
+    # Fields that are not part of any passage or its metadata do not change it
+    assert content_hash(dict(data, claims_text="other")) == content_hash(data)
+    for field, value in (("abstract", "Other."), ("ipfs_hash", "QmOther"), ("filing_date", "2021-01-01")):
+        assert content_hash(dict(data, **{field: value})) != content_hash(data)
+    # A different chunking produces different passages
+    assert content_hash(data, chunk_words=100) != content_hash(data)
@@ -0,0 +1,136 @@
+import os
+
+import pytest
+import requests
+
+from html_cache import HTMLCache, conditional_headers
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "pages")
+URL = "https://patents.google.com/patent/US11000001B2/en"
+
+
+def fixture_page(name="US11000001B2"):
+    with open(os.path.join(PAGES_DIR, f"{name}.html"), "rb") as f:
+        return f.read()
+
+
+def response(status_code, content=b"", headers=None):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = content
+    result.headers.update(headers or {})
+    return result
+
+
+class FakeSession:
+    """Answers GETs from a list of responses and records the headers each was sent with"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.sent_headers.append(headers or {})
+        return self.responses.pop(0)
+
+
+def test_bodies_are_stored_once_by_digest(tmp_path):
+    with HTMLCache(str(tmp_path)) as cache:
+        digest = cache.put("u1", b"<html>same</html>", etag='"v1"')
+        assert cache.put("u2", b"<html>same</html>") == digest
+        assert cache.get("u1") == cache.get("u2") == b"<html>same</html>"
+        assert cache.get("u3") is None
+        stats = cache.stats()
+        assert (stats["pages"], stats["objects"]) == (2, 1)
+        assert conditional_headers(cache.lookup("u1")) == {"If-None-Match": '"v1"'}
+        assert conditional_headers(cache.lookup("u2")) == {}
+
+
+def test_missing_object_is_skipped(tmp_path):
+    with HTMLCache(str(tmp_path)) as cache:
+        digest = cache.put("u1", b"one")
+        cache.put("u2", b"two")
+        os.remove(cache._object_path(digest))
+        assert cache.lookup("u1")["digest"] == digest
+        assert cache.get("u1") is None
+        assert list(cache.iter_pages()) == [("u2", b"two")]
+
+
+def test_prune_removes_unreferenced_objects(tmp_path):
+    with HTMLCache(str(tmp_path)) as cache:
+        old = cache.put("u1", b"version 1")
+        cache.put("u1", b"version 2")
+        cache.put("u2", b"version 2")
+        assert cache.prune() == 1
+        assert not os.path.exists(cache._object_path(old))
+        assert cache.get("u1") == cache.get("u2") == b"version 2"
+        assert cache.prune() == 0
+
+
+@pytest.fixture
+def working(workdir):
+    # working.py loads the embedding model and LangChain at import
+    working = pytest.importorskip("working")
+    yield working
+    working.close_html_cache()
+
+
+def test_not_modified_is_served_from_the_cache(working, monkeypatch):
+    page = fixture_page()
+    session = FakeSession(
+        response(200, page, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+        response(304),
+    )
+    monkeypatch.setattr(working, "get_http_session", lambda: session)
+
+    assert working.fetch_html(URL) == page
+    validated_at = working.get_html_cache().lookup(URL)["validated_at"]
+    assert working.fetch_html(URL) == page
+    assert session.sent_headers == [
+        {},
+        {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"},
+    ]
+    entry = working.get_html_cache().lookup(URL)
+    assert entry["validated_at"] >= validated_at
+    assert entry["etag"] == '"v1"'
+
+
+def test_not_modified_without_the_object_fetches_in_full(working, monkeypatch):
+    page = fixture_page()
+    cache = working.get_html_cache()
+    digest = cache.put(URL, page, etag='"v1"')
+    os.remove(cache._object_path(digest))
+    session = FakeSession(response(304), response(200, page, {"ETag": '"v1"'}))
+    monkeypatch.setattr(working, "get_http_session", lambda: session)
+
+    assert working.fetch_html(URL) == page
+    # The second request is unconditional, and the body is cached again
+    assert session.sent_headers == [{"If-None-Match": '"v1"'}, {}]
+    assert cache.get(URL) == page
+
+
+def test_reparse_moves_changed_patents_back_to_fetched(working):
+    from ingest_state import IngestState, FETCHED, STORED
+    from segment_store import SegmentStore
+
+    pages = {f"https://patents.google.com/patent/{name}/en": fixture_page(name)
+             for name in ("US11000001B2", "US11000002B1")}
+    cache = working.get_html_cache()
+    with IngestState() as state, SegmentStore() as store:
+        state.discover(list(pages))
+        for url, page in pages.items():
+            cache.put(url, page)
+            record = working.build_patent_info(url, working.extract_patent_fields(page))
+            store.put(record["publication_number"], dict(record, ipfs_hash="QmOld"))
+            state.mark(record["publication_number"], STORED)
+        # US11000001B2 was saved by an older parser
+        stored = store.get("US11000001B2")
+        store.put("US11000001B2", dict(stored, abstract="Parsed wrongly"))
+    working.close_html_cache()
+
+    working.reparse_from_cache()
+
+    with IngestState() as state, SegmentStore() as store:
+        stages = dict(state.conn.execute("SELECT patent_no, stage FROM patents"))
+        assert stages == {"US11000001B2": FETCHED, "US11000002B1": STORED}
+        assert store.get("US11000001B2")["abstract"] != "Parsed wrongly"
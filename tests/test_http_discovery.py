@@ -0,0 +1,111 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from http_discovery import HTTPDiscovery, DiscoveryError, ThrottledError, parse_results
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "discovery")
+
+
+def test_replay_fixtures():
+    discovery = HTTPDiscovery(replay_dir=REPLAY_DIR)
+    try:
+        pages = list(discovery.iter_pages(datetime(2024, 1, 1), datetime(2024, 1, 10)))
+    finally:
+        discovery.close()
+    assert pages == [
+        (0, ["US11864567", "US11864568", "US11864570"]),
+        (1, ["US11864571", "US11864575"]),
+    ]
+
+
+def test_replay_missing_window():
+    discovery = HTTPDiscovery(replay_dir=REPLAY_DIR)
+    with pytest.raises(DiscoveryError):
+        list(discovery.iter_pages(datetime(2023, 1, 1), datetime(2023, 1, 10)))
+
+
+def test_parse_results_html_and_garbage():
+    html = "<html><body>US1234567 US1234567 US7654321B2</body></html>"
+    assert parse_results(html) == (["US1234567", "US7654321"], None)
+    with pytest.raises(DiscoveryError):
+        parse_results("not a results page")
+    with pytest.raises(DiscoveryError):
+        parse_results('{"error": "x"}')
+
+
+class FlakyDiscovery:
+    """Throttled once on page 1, then serves three pages"""
+
+    replay_dir = None
+
+    def __init__(self):
+        self.requests = []
+        self.throttled = False
+
+    def iter_pages(self, start_date, end_date, start_page=0):
+        for page_num in range(start_page, 3):
+            self.requests.append(page_num)
+            if page_num == 1 and not self.throttled:
+                self.throttled = True
+                raise ThrottledError("HTTP 429")
+            yield page_num, [f"US{page_num}"]
+
+
+def test_throttling_backs_off_and_resumes_over_http():
+    getlinks_final = pytest.importorskip("getlinks_final")
+
+    class Backoff(getlinks_final.ThrottleBackoff):
+        def wait(self):
+            pass
+
+    discovery = FlakyDiscovery()
+    backoff = Backoff()
+    pages = list(getlinks_final.iter_pages_with_backoff(
+        discovery, datetime(2024, 1, 1), datetime(2024, 1, 10), backoff))
+    assert pages == [(0, ["US0"]), (1, ["US1"]), (2, ["US2"])]
+    # Page 1 is requested again after the backoff, page 0 is not
+    assert discovery.requests == [0, 1, 1, 2]
+
+
+def test_persistent_throttling_does_not_start_a_browser(monkeypatch):
+    getlinks_final = pytest.importorskip("getlinks_final")
+
+    class Throttled(FlakyDiscovery):
+        def iter_pages(self, start_date, end_date, start_page=0):
+            raise ThrottledError("HTTP 429")
+            yield
+
+    class Backoff(getlinks_final.ThrottleBackoff):
+        def wait(self):
+            pass
+
+    def no_browser(index=0):
+        raise AssertionError("Selenium must not be started for throttling")
+
+    monkeypatch.setattr(getlinks_final, "create_driver", no_browser)
+    monkeypatch.setattr(getlinks_final, "load_scraping_state", lambda: {})
+    with pytest.raises(ThrottledError):
+        getlinks_final.scrape_window(0, datetime(2024, 1, 1), datetime(2024, 1, 10), None, None,
+                                     Backoff(), Throttled())
+
+
+def test_completed_window_is_dropped_from_state(workdir):
+    getlinks_final = pytest.importorskip("getlinks_final")
+    from url_frontier import URLFrontier
+
+    class Backoff(getlinks_final.ThrottleBackoff):
+        def wait(self):
+            pass
+
+    getlinks_final.save_scraping_state(datetime(2023, 12, 22), 4)
+    getlinks_final.save_scraping_state(datetime(2024, 1, 1), 0)
+    discovery = HTTPDiscovery(replay_dir=REPLAY_DIR)
+    with URLFrontier(str(workdir / "patent_urls.txt"), str(workdir / "url_frontier.db")) as frontier:
+        links = getlinks_final.scrape_window_http("", datetime(2024, 1, 1), datetime(2024, 1, 10),
+                                                  frontier, discovery, Backoff())
+    discovery.close()
+    assert len(links) == 5
+    # Only the window that is still in progress is kept
+    assert getlinks_final.load_scraping_state() == {"2023-12-22": 4}
@@ -0,0 +1,53 @@
+import json
+
+import ingest_state
+from chunking import content_hash
+from ingest_state import IngestState, DISCOVERED, FETCHED, STORED
+from segment_store import SegmentStore
+
+
+def record(number, ipfs_hash="Qm" + "1" * 44):
+    return {
+        "patent_title": f"Title {number}",
+        "abstract": "Abstract",
+        "inventions": ["1. A claim."],
+        "patent_url": f"https://patents.google.com/patent/{number}/en",
+        "ipfs_hash": ipfs_hash,
+    }
+
+
+def test_import_existing_streams_store_and_legacy_json(workdir, monkeypatch):
+    monkeypatch.setattr(ingest_state, "IMPORT_BATCH", 3)
+    with SegmentStore(str(workdir / "store")) as store:
+        store.put_many({f"US{i}B2": record(f"US{i}B2") for i in range(7)})
+    (workdir / "patent_json").mkdir()
+    (workdir / "patent_json" / "US100B2.json").write_text(json.dumps(record("US100B2", "")))
+
+    with IngestState(str(workdir / "state.db"), store_dir=str(workdir / "store")) as state:
+        assert state.created
+        assert state.stage_counts()["stored"] == 8
+        row = state.conn.execute(
+            "SELECT url, stage, content_hash, ipfs_hash FROM patents WHERE patent_no = 'US3B2'"
+        ).fetchone()
+        assert row == (record("US3B2")["patent_url"], STORED, content_hash(record("US3B2")), "Qm" + "1" * 44)
+        assert state.conn.execute(
+            "SELECT ipfs_hash FROM patents WHERE patent_no = 'US100B2'"
+        ).fetchone() == (None,)
+
+    # Imported once: reopening does not scan again
+    with IngestState(str(workdir / "state.db"), store_dir=str(workdir / "store")) as state:
+        assert not state.created
+
+
+def test_discover_and_resume_stages(workdir):
+    with IngestState(str(workdir / "state.db"), store_dir=str(workdir / "store")) as state:
+        added, invalid = state.discover([
+            "https://patents.google.com/patent/US1B2/en",
+            "https://patents.google.com/patent/US1B2/en",
+            "not a patent url",
+        ])
+        assert added == [("https://patents.google.com/patent/US1B2/en", "US1B2")]
+        assert invalid == ["not a patent url"]
+        assert state.pending() == [("https://patents.google.com/patent/US1B2/en", "US1B2", DISCOVERED)]
+        state.mark("US1B2", FETCHED, content_hash="abc")
+        assert state.pending()[0][2] == FETCHED
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from ipfs_handler import IPFSHandler, MFS_BATCH_DIR, already_exists
+from ipfs_stub import start_stub
+from metrics import IPFS_SECONDS
+from segment_store import SegmentStore
+
+
+def patent(number):
+    return {
+        "patent_title": f"Battery pack {number}",
+        "abstract": "A battery pack with a phase change material.",
+        "inventions": ["1. A battery pack comprising cells."],
+        "filing_date": "2021-03-04",
+        "assignee_name": "Acme",
+        "patent_url": f"https://patents.google.com/patent/{number}/en",
+        "patent_text": "Description of the pack.",
+    }
+
+
+@pytest.fixture
+def stub(workdir):
+    server, node, api_url = start_stub()
+    yield node, api_url
+    server.shutdown()
+
+
+@pytest.fixture
+def handler(stub, workdir):
+    _, api_url = stub
+    store = SegmentStore(str(workdir / "store"))
+    with IPFSHandler(ipfs_api_url=api_url, store=store) as ipfs_handler:
+        yield ipfs_handler
+    store.close()
+
+
+def test_save_and_upload_round_trip(stub, handler):
+    node, _ = stub
+    ipfs_hash = handler.save_and_upload(patent("US1B2"), "US1B2")
+
+    assert ipfs_hash in node.pins
+    assert node.mfs["/patents/US1B2.json"] == ipfs_hash
+    uploaded = handler.get_from_ipfs(ipfs_hash)
+    assert uploaded["publication_number"] == "US1B2"
+    assert uploaded["patent_title"] == "Battery pack US1B2"
+    # The local copy is written once, with the CID attached
+    assert handler.store.get("US1B2") == dict(uploaded, ipfs_hash=ipfs_hash)
+    stats = handler.store.stats()
+    assert stats["segment_bytes"] == stats["live_bytes"]
+
+
+def test_reupload_replaces_mfs_entry_without_retries(stub, handler):
+    node, _ = stub
+    first = handler.save_and_upload(patent("US1B2"), "US1B2")
+    calls = node.calls
+    changed = dict(patent("US1B2"), abstract="Changed")
+    second = handler.save_and_upload(changed, "US1B2")
+
+    assert second != first
+    assert node.mfs["/patents/US1B2.json"] == second
+    # add (500: already has entry), files/rm, add; the 500 is not retried
+    assert node.calls - calls == 3
+
+
+def test_add_many_parses_ndjson_and_links_batch(stub, handler):
+    node, _ = stub
+    adds_before = IPFS_SECONDS.snapshot().get("add", {}).get("count", 0)
+    patents = {number: patent(number) for number in ("US1B2", "US2B2", "US3B2")}
+    hashes = handler.add_many(patents)
+
+    assert set(hashes) == set(patents)
+    for number, ipfs_hash in hashes.items():
+        assert ipfs_hash in node.pins
+        assert json.loads(node.blocks[ipfs_hash])["publication_number"] == number
+        assert handler.store.get(number)["ipfs_hash"] == ipfs_hash
+    batches = [path for path in node.mfs if path.startswith(MFS_BATCH_DIR + "/")]
+    assert len(batches) == 1
+    assert set(node.directories[node.mfs[batches[0]]]) == {f"{number}.json" for number in patents}
+    # The bulk /add goes through _post like every other call, so it is measured
+    assert IPFS_SECONDS.snapshot()["add"]["count"] == adds_before + 1
+
+
+def test_add_many_empty(stub, handler):
+    node, _ = stub
+    calls = node.calls
+    assert handler.add_many({}) == {}
+    assert node.calls == calls
+
+
+def test_add_many_with_a_single_timeout(stub, workdir):
+    _, api_url = stub
+    with SegmentStore(str(workdir / "store")) as store:
+        with IPFSHandler(ipfs_api_url=api_url, timeout=30, store=store) as handler:
+            assert handler.timeout == (30, 30)
+            hashes = handler.add_many({"US1B2": patent("US1B2")})
+            assert store.get("US1B2")["ipfs_hash"] == hashes["US1B2"]
+
+
+def test_already_exists_matches_only_taken_paths():
+    assert already_exists("cp: cannot put node in path /patents/US1B2.json: directory already has entry by that name")
+    assert already_exists("file already exists")
+    assert not already_exists("file does not exist")
+    assert not already_exists("rm: /patents/US1B2.json: no such file or directory, path does not exist")
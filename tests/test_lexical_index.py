@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+import lexical_index
+from lexical_index import LexicalIndex
+
+
+def patent(number, title, abstract, assignee="Acme", filing_date="2020-01-01"):
+    return {
+        "publication_number": number,
+        "patent_title": title,
+        "abstract": abstract,
+        "inventions": [],
+        "assignee_name": assignee,
+        "filing_date": filing_date,
+    }
+
+
+def numbers(hits):
+    return [meta["publication_number"] for meta, _ in hits]
+
+
+def build(directory):
+    index = LexicalIndex(directory)
+    index.add(patent("US1B2", "Solar panel mount", "A mount for a solar panel on a roof."))
+    index.add(patent("US2B2", "Wind turbine blade", "A blade with a solar coating.", assignee="Other"))
+    index.add(patent("US3B2", "Battery pack", "Cells in a housing.", filing_date="2022-05-01"))
+    index.flush()
+    return index
+
+
+def test_build_and_search(tmp_path):
+    index = build(str(tmp_path))
+    try:
+        assert numbers(index.search("solar panel", k=10)) == ["US1B2", "US2B2"]
+        assert numbers(index.search("solar", k=1)) == ["US1B2"]
+        assert numbers(index.search("solar", k=10, assignee="Other")) == ["US2B2"]
+        assert numbers(index.search("a", k=10, min_day=20210101)) == ["US3B2"]
+        assert index.search("hydrogen", k=10) == []
+        meta = index.search("battery", k=1)[0][0]
+        assert meta["snippet"] == "Cells in a housing."
+    finally:
+        index.close()
+
+
+def test_newer_version_shadows_older(tmp_path):
+    index = build(str(tmp_path))
+    try:
+        index.add(patent("US1B2", "Roof mount", "A bracket for roof tiles."))
+        index.flush()
+        assert index.doc_count == 3
+        assert numbers(index.search("solar", k=10)) == ["US2B2"]
+        assert numbers(index.search("bracket", k=10)) == ["US1B2"]
+    finally:
+        index.close()
+
+
+def test_reader_reloads_published_segments(tmp_path):
+    writer = build(str(tmp_path))
+    reader = LexicalIndex(str(tmp_path))
+    try:
+        assert not reader.reload_if_changed()
+        segments, doc_count, avg_length = reader._acquire()
+
+        writer.add(patent("US4B2", "Hydrogen cell", "A hydrogen fuel cell."))
+        writer.flush()
+        assert reader.reload_if_changed()
+        assert numbers(reader.search("hydrogen", k=10)) == ["US4B2"]
+
+        # A search that started before the reload still reads its own, still mapped, segments
+        hits = reader._search(segments, doc_count, avg_length, "battery", 10, None, None, None)
+        assert numbers(hits) == ["US3B2"]
+        reader._release(segments)
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_flush_maps_only_the_new_segment(tmp_path, monkeypatch):
+    index = build(str(tmp_path))
+    try:
+        first = index.segments[0][0]
+        opened = []
+        original = lexical_index.Segment.__init__
+
+        def tracking_init(self, directory, name):
+            opened.append(name)
+            original(self, directory, name)
+
+        monkeypatch.setattr(lexical_index.Segment, "__init__", tracking_init)
+        index.add(patent("US4B2", "Hydrogen cell", "A hydrogen fuel cell."))
+        index.flush()
+        assert opened == ["seg-000002"]
+        assert index.segments[0][0] is first
+    finally:
+        index.close()
+
+
+def test_size_tiered_merges(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "FLUSH_DOCS", 2)
+    monkeypatch.setattr(lexical_index, "MERGE_FACTOR", 2)
+    index = LexicalIndex(str(tmp_path))
+    try:
+        for i in range(8):
+            index.add(patent(f"US{i}B2", f"Widget {i}", "A widget."))
+        # Four flushes of 2 patents: pairs merge into 4, then the two 4s into 8
+        assert [segment.n_docs for segment, _ in index.segments] == [8]
+        index.add(patent("US0B2", "Gadget", "A gadget."))
+        index.add(patent("US8B2", "Widget 8", "A widget."))
+        assert [segment.n_docs for segment, _ in index.segments] == [8, 2]
+        assert index.doc_count == 9
+        assert numbers(index.search("gadget", k=10)) == ["US0B2"]
+        assert "US0B2" not in numbers(index.search("widget", k=10))
+    finally:
+        index.close()
+
+    # The deletions are part of the published index, nothing is recomputed on open
+    reopened = LexicalIndex(str(tmp_path))
+    try:
+        assert reopened.doc_count == 9
+        assert sorted(numbers(reopened.search("widget", k=10))) == [f"US{i}B2" for i in range(1, 9)]
+        reopened.compact()
+        assert [segment.n_docs for segment, _ in reopened.segments] == [9]
+        assert sorted(os.listdir(str(tmp_path))) == ["manifest.json", "seg-000009.docs", "seg-000009.idx"]
+    finally:
+        reopened.close()
+
+
+def test_older_manifest_asks_for_a_rebuild(tmp_path):
+    (tmp_path / "manifest.json").write_text(json.dumps({"segments": ["seg-000001"], "next_segment": 2}))
+    with pytest.raises(ValueError, match="--rebuild"):
+        LexicalIndex(str(tmp_path))
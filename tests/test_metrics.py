@@ -0,0 +1,70 @@
+import json
+import urllib.request
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, start_http_server, write_snapshot
+
+
+def registry():
+    reg = Registry()
+    calls = reg.register(Counter("calls_total", "Calls", ["stage"]))
+    depth = reg.register(Gauge("queue_depth", "Depth", ["queue"]))
+    seconds = reg.register(Histogram("call_seconds", "Latency", ["stage"], buckets=(0.1, 1.0)))
+    calls.inc("fetch")
+    calls.inc("fetch", amount=2)
+    calls.inc('say "hi"\n')
+    depth.set("process", value=3)
+    depth.set("process", value=1.5)
+    for value in (0.05, 0.5, 5.0):
+        seconds.observe("fetch", value=value)
+    return reg
+
+
+def test_render_exposition_format():
+    assert registry().render() == "\n".join([
+        "# HELP calls_total Calls",
+        "# TYPE calls_total counter",
+        'calls_total{stage="fetch"} 3',
+        'calls_total{stage="say \\"hi\\"\\n"} 1',
+        "# HELP queue_depth Depth",
+        "# TYPE queue_depth gauge",
+        'queue_depth{queue="process"} 1.5',
+        "# HELP call_seconds Latency",
+        "# TYPE call_seconds histogram",
+        'call_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'call_seconds_bucket{stage="fetch",le="1"} 2',
+        'call_seconds_bucket{stage="fetch",le="+Inf"} 3',
+        'call_seconds_sum{stage="fetch"} 5.55',
+        'call_seconds_count{stage="fetch"} 3',
+    ]) + "\n"
+
+
+def test_labels_must_match():
+    with pytest.raises(ValueError):
+        Counter("calls_total", "Calls", ["stage"]).inc()
+
+
+def test_snapshot_file_rotates(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    reg = registry()
+    for _ in range(3):
+        write_snapshot(path, max_bytes=1, backups=2, registry=reg)
+    line = json.loads(open(path).read())
+    assert line["metrics"]["calls_total"] == {"fetch": 3, 'say "hi"\n': 1}
+    assert line["metrics"]["call_seconds"]["fetch"]["count"] == 3
+    assert (tmp_path / "metrics.jsonl.1").exists() and (tmp_path / "metrics.jsonl.2").exists()
+    assert not (tmp_path / "metrics.jsonl.3").exists()
+
+
+def test_http_endpoint():
+    reg = registry()
+    server = start_http_server(0, registry=reg)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == reg.render()
+    finally:
+        server.shutdown()
+        server.server_close()
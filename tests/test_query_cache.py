@@ -0,0 +1,34 @@
+import query_cache
+from query_cache import LRUCache, normalize_query
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a", "gone") == "gone"
+    assert cache.stats()["size"] == 0
+
+
+def test_clear_and_normalize_query():
+    cache = LRUCache()
+    cache.set(normalize_query("  Solar   PANEL "), 1)
+    assert cache.get(normalize_query("solar panel")) == 1
+    cache.clear()
+    assert cache.get("solar panel") is None
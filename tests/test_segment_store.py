@@ -0,0 +1,70 @@
+import segment_store
+from segment_store import SegmentStore
+
+
+def record(number, text="x"):
+    return {"patent_title": f"Title {number}", "abstract": text * 200, "patent_url": f"url/{number}"}
+
+
+def test_put_get_and_reopen(tmp_path):
+    with SegmentStore(str(tmp_path)) as store:
+        # Falsy while empty, through __len__; callers test injected stores against None
+        assert len(store) == 0 and not store
+        store.put("US1B2", record(1))
+        store.put_many({"US2B2": record(2), "US3B2": record(3)})
+        assert store.get("US2B2") == record(2)
+        assert store.get("US9B2") is None
+        assert "US3B2" in store and "US9B2" not in store
+
+    with SegmentStore(str(tmp_path)) as store:
+        assert len(store) == 3
+        assert dict(store.iter_records()) == {f"US{i}B2": record(i) for i in (1, 2, 3)}
+
+
+def test_rewrite_and_compact(tmp_path):
+    # Small segments, so the records spread over several files
+    with SegmentStore(str(tmp_path), segment_max_bytes=200) as store:
+        for i in range(6):
+            store.put(f"US{i}B2", record(i))
+        for i in range(3):
+            store.put(f"US{i}B2", record(i, "y"))
+        before = store.stats()
+        assert before["records"] == 6
+        assert before["segments"] > 1
+        assert before["segment_bytes"] > before["live_bytes"]
+
+        store.compact()
+        after = store.stats()
+        assert after["records"] == 6
+        assert after["segment_bytes"] == after["live_bytes"]
+        assert store.get("US0B2") == record(0, "y")
+        assert store.get("US5B2") == record(5)
+
+        # Writes after a compaction go on from the new segments
+        store.put("US6B2", record(6))
+        assert store.get("US6B2") == record(6)
+
+
+def test_compact_in_batches_and_defer_locked_segments(tmp_path, monkeypatch):
+    with SegmentStore(str(tmp_path), segment_max_bytes=200) as store:
+        for i in range(7):
+            store.put(f"US{i}B2", record(i))
+            store.put(f"US{i}B2", record(i, "y"))
+        old_segments = store.segment_numbers()
+
+        # As on Windows while the API process still has the old segments open
+        def locked(path):
+            raise PermissionError(f"{path} is in use")
+
+        monkeypatch.setattr(segment_store.os, "remove", locked)
+        store.compact(batch_size=3)
+        assert set(old_segments) <= set(store.segment_numbers())
+        assert dict(store.iter_records()) == {f"US{i}B2": record(i, "y") for i in range(7)}
+        monkeypatch.undo()
+
+    # The next open removes them
+    with SegmentStore(str(tmp_path), segment_max_bytes=200) as store:
+        assert not set(old_segments) & set(store.segment_numbers())
+        stats = store.stats()
+        assert stats["records"] == 7 and stats["segment_bytes"] == stats["live_bytes"]
+        assert store.get("US6B2") == record(6, "y")
@@ -0,0 +1,62 @@
+from url_frontier import URLFrontier, INDEX_CURSOR
+
+
+def frontier(tmp_path):
+    return URLFrontier(str(tmp_path / "patent_urls.txt"), str(tmp_path / "url_frontier.db"))
+
+
+def test_add_deduplicates_and_appends(tmp_path):
+    with frontier(tmp_path) as f:
+        assert f.add(["u1", "u2", " u1 ", ""]) == ["u1", "u2"]
+        assert f.add(["u2", "u3"]) == ["u3"]
+        assert len(f) == 3 and "u3" in f and "u4" not in f
+    assert (tmp_path / "patent_urls.txt").read_bytes().split() == [b"u1", b"u2", b"u3"]
+
+
+def test_consumer_cursors(tmp_path):
+    with frontier(tmp_path) as f:
+        f.add([f"u{i}" for i in range(5)])
+        assert list(f.iter_new("worker", batch_lines=2)) == [["u0", "u1"], ["u2", "u3"], ["u4"]]
+        assert list(f.iter_new("worker")) == []
+        assert list(f.iter_new("other")) == [[f"u{i}" for i in range(5)]]
+
+        f.add(["u5"])
+        assert list(f.iter_new("worker")) == [["u5"]]
+
+        # A batch that was not finished is read again next time
+        f.add(["u6", "u7"])
+        batches = f.iter_new("worker", batch_lines=1)
+        assert next(batches) == ["u6"]
+        batches.close()
+        assert list(f.iter_new("worker")) == [["u6", "u7"]]
+
+        f.set_cursor("worker", 0)
+        assert sum(len(urls) for urls in f.iter_new("worker")) == 8
+        assert f.get_cursor("worker") == f.get_cursor(INDEX_CURSOR) == (tmp_path / "patent_urls.txt").stat().st_size
+
+
+def test_catches_up_with_hand_edits(tmp_path):
+    (tmp_path / "patent_urls.txt").write_text("u1\nu2\npartial")
+    with frontier(tmp_path) as f:
+        assert len(f) == 2
+        # The unterminated line is ended before appending
+        assert f.add(["u3"]) == ["u3"]
+        assert list(f.iter_new("worker")) == [["u1", "u2", "partial", "u3"]]
+
+
+def test_replaced_shorter_file_resets_consumer_cursors(tmp_path):
+    with frontier(tmp_path) as f:
+        f.add([f"https://patents.google.com/patent/US{i}B2/en" for i in range(5)])
+        assert sum(len(urls) for urls in f.iter_new("worker")) == 5
+        assert sum(len(urls) for urls in f.iter_new("other")) == 5
+
+        # Replaced by hand with a shorter list while the frontier is open
+        (tmp_path / "patent_urls.txt").write_text("u1\nu2\n")
+        assert list(f.iter_new("worker")) == [["u1", "u2"]]
+        assert list(f.iter_new("worker")) == []
+
+    # A consumer that did not read since sees the new file from the start too
+    with frontier(tmp_path) as f:
+        assert list(f.iter_new("other")) == [["u1", "u2"]]
+        f.add(["u3"])
+        assert list(f.iter_new("worker")) == [["u3"]]
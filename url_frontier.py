@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List
+
+FRONTIER_FILE = "patent_urls.txt"
+INDEX_PATH = "url_frontier.db"
+READ_BATCH_LINES = 10000  # URLs handed to a consumer per batch by iter_new
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    url_hash INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    byte_offset INTEGER NOT NULL
+);
+"""
+# Cursor recording how far into the file the seen index is up to date
+INDEX_CURSOR = "_index"
+
+
+def url_hash(url: str) -> int:
+    """64-bit key of a URL in the seen index"""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class URLFrontier:
+    """
+    The append-only patent URL list (patent_urls.txt) plus a small SQLite
+    index beside it.
+
+    The index holds a 64-bit hash of every URL in the file, so deduplicating
+    new links is an indexed lookup instead of a Python set of every URL ever
+    seen, and a byte-offset cursor per consumer, so a reader only streams the
+    lines appended since its last run. Memory and startup time do not grow
+    with the file.
+    """
+
+    def __init__(self, path: str = FRONTIER_FILE, index_path: str = INDEX_PATH):
+        self.path = path
+        self.index_path = index_path
+        # Shared by scraper threads; every use of the connection holds the lock
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Index lines appended by anything that bypassed add(), e.g. a hand edit;
+        # on the first run this indexes the whole existing file once
+        self._catch_up()
+
+    def get_cursor(self, name: str) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT byte_offset FROM cursors WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def set_cursor(self, name: str, offset: int):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursors (name, byte_offset) VALUES (?, ?)", (name, offset)
+            )
+
+    def _iter_lines(self, offset: int, batch_lines: int = READ_BATCH_LINES):
+        """Yield ([urls], end offset) batches of the complete lines after offset"""
+        if not os.path.exists(self.path):
+            return
+        start = offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            urls = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # A line still being written; picked up next time
+                offset += len(line)
+                url = line.decode("utf-8", errors="replace").strip()
+                if url:
+                    urls.append(url)
+                if len(urls) >= batch_lines:
+                    yield urls, offset
+                    urls = []
+            if urls or offset != start:
+                yield urls, offset
+
+    def _catch_up(self):
+        start = self.get_cursor(INDEX_CURSOR)
+        if os.path.exists(self.path) and os.path.getsize(self.path) < start:
+            # The file was replaced by a shorter one: index it again, and have every
+            # consumer read it from the start, their offsets point into the old file
+            with self.lock, self.conn:
+                self.conn.execute("UPDATE cursors SET byte_offset = 0")
+            start = 0
+        for urls, offset in self._iter_lines(start):
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO seen (url_hash) VALUES (?)", [(url_hash(url),) for url in urls]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cursors (name, byte_offset) VALUES (?, ?)", (INDEX_CURSOR, offset)
+                )
+
+    def __contains__(self, url: str) -> bool:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM seen WHERE url_hash = ?", (url_hash(url.strip()),)
+            ).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def add(self, urls: Iterable[str]) -> List[str]:
+        """Append the URLs not seen before to the file and return them, in order"""
+        with self.lock:
+            return self._add(urls)
+
+    def _add(self, urls: Iterable[str]) -> List[str]:
+        self._catch_up()
+        new_urls = []
+        with self.conn:
+            for url in urls:
+                url = url.strip()
+                if not url:
+                    continue
+                cursor = self.conn.execute("INSERT OR IGNORE INTO seen (url_hash) VALUES (?)", (url_hash(url),))
+                if cursor.rowcount:
+                    new_urls.append(url)
+            if new_urls:
+                with open(self.path, "a+b") as f:
+                    # Terminate a last line saved without a newline, so it is not run into
+                    f.seek(0, os.SEEK_END)
+                    if f.tell():
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            f.write(os.linesep.encode())
+                    # os.linesep, as the scrapers wrote the file in text mode before
+                    f.write("".join(f"{url}{os.linesep}" for url in new_urls).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+        # Move the index cursor past the appended lines
+        self._catch_up()
+        return new_urls
+
+    def iter_new(self, consumer: str, batch_lines: int = READ_BATCH_LINES) -> Iterator[List[str]]:
+        """
+        Stream the URLs appended since the consumer's last run, in batches.
+        The consumer's cursor moves past a batch once the next one is
+        requested, so a batch that was being handled when the run died is
+        read again next time.
+        """
+        with self.lock:
+            self._catch_up()
+        for urls, offset in self._iter_lines(self.get_cursor(consumer), batch_lines):
+            if urls:
+                yield urls
+            self.set_cursor(consumer, offset)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the URL frontier and its consumer cursors")
+    parser.add_argument("--path", default=FRONTIER_FILE, help="URL list file")
+    parser.add_argument("--index", default=INDEX_PATH, help="Frontier index database")
+    args = parser.parse_args()
+
+    with URLFrontier(args.path, args.index) as frontier:
+        size = os.path.getsize(args.path) if os.path.exists(args.path) else 0
+        print(f"{len(frontier)} unique URLs in {args.path} ({size} bytes)")
+        for name, offset in frontier.conn.execute("SELECT name, byte_offset FROM cursors ORDER BY name"):
+            print(f"{name:>10}: byte {offset} ({size - offset} bytes unread)")
@@ -13,17 +13,87 @@ import time
 import pandas as pd
 # from getlinks import getLinks
 import re
-from bs4 import BeautifulSoup
 import requests
-import html2text
 import asyncio
-import chromadb
-import uuid
-from sentence_transformers import SentenceTransformer
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from rate_limiter import HostRateLimiter
+from chroma_store import ChromaStore
+from chunking import chunk_patent, content_hash
+from lexical_index import LexicalIndex
+from html_extract import extract_patent_fields
+from ingest_state import IngestState, DISCOVERED, FETCHED, PINNED, STAGE_NAMES
+from url_frontier import URLFrontier, FRONTIER_FILE
+from metrics import track, write_snapshot, PAGE_REVALIDATIONS
+from encoders import load_encoder
+from segment_store import SegmentStore
+from html_cache import HTMLCache, conditional_headers
 # from send_to_api import send_json_to_api  # Comment out or remove this line
 
-# Initialize SentenceTransformer model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Initialize the sentence encoder (PyTorch or ONNX Runtime, see ENCODER_BACKEND in encoders.py)
+model = load_encoder()
+
+MAX_WORKERS = 4  # Number of patent pages fetched and parsed concurrently
+MIN_REQUEST_INTERVAL = 2.0  # Minimum seconds between requests to the same host
+REQUEST_TIMEOUT = 30  # Seconds before a patent page request is abandoned
+EMBED_BATCH_SIZE = 64  # Passages encoded and written to ChromaDB per batch
+FLUSH_INTERVAL = 60.0  # Seconds a partial batch may wait before it is flushed
+IPFS_BULK_SIZE = 256  # Patents uploaded per multipart /add with --ipfs-bulk
+FRONTIER_CONSUMER = "working"  # Name of this script's read cursor in the URL frontier
+
+# One requests.Session per worker thread so connections are kept alive
+_thread_local = threading.local()
+
+def get_http_session() -> requests.Session:
+    """Return the keep-alive session owned by the current thread"""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+# Raw page responses, shared by the fetcher threads and opened on first use
+_html_cache = None
+_html_cache_lock = threading.Lock()
+
+def get_html_cache() -> HTMLCache:
+    global _html_cache
+    with _html_cache_lock:
+        if _html_cache is None:
+            _html_cache = HTMLCache()
+        return _html_cache
+
+def close_html_cache():
+    global _html_cache
+    with _html_cache_lock:
+        if _html_cache is not None:
+            _html_cache.close()
+            _html_cache = None
+
+def fetch_html(url: str) -> bytes:
+    """
+    Download a patent page and keep the raw response in the HTML cache. A page
+    fetched before is requested with its ETag / Last-Modified, and a 304 Not
+    Modified answer is served from the cache instead of downloaded again.
+    """
+    cache = get_html_cache()
+    cached = cache.lookup(url)
+    response = get_http_session().get(url, timeout=REQUEST_TIMEOUT, headers=conditional_headers(cached))
+    if response.status_code == 304 and cached:
+        content = cache.read(cached["digest"])
+        if content is not None:
+            PAGE_REVALIDATIONS.inc("not_modified")
+            cache.revalidated(url)
+            return content
+        # The cached body is gone, fetch the page in full
+        response = get_http_session().get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    if cached:
+        PAGE_REVALIDATIONS.inc("modified")
+    cache.put(url, response.content, etag=response.headers.get("ETag"),
+              last_modified=response.headers.get("Last-Modified"))
+    return response.content
 
 # Define a Pydantic model for structured output
 class PatentInfo(BaseModel):
@@ -89,49 +159,12 @@ def clean_html_content(url: str) -> Dict:
     Returns a dictionary with all patent information except claims
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Parse HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Create HTML 2 text convertor for patent_text
-        h = html2text.HTML2Text()
-        h.ignore_links = True  # Ignore hyperlinks
-        h.ignore_images = True  # Ignore images
-        h.ignore_tables = False  # Keep tables as they might contain important data
-        h.body_width = 0  # Don't wrap text at a certain width
-        
-        # Extract all relevant sections
-        claims = soup.find('section', itemprop='claims')
-        abstract = soup.find('section', itemprop='abstract')
-        inventor = soup.find('dd', itemprop='inventor')
-        assigneeCurrent = soup.find('dd', itemprop='assigneeCurrent')
-        assigneeOriginal = soup.find('dd', itemprop='assigneeOriginal')
-        filingDate = soup.find('time', itemprop='filingDate')
-        title = soup.find('span', itemprop='title')
-        
-        # Process full text
-        full_text = h.handle(str(soup))
-        full_text = '\n'.join(line.strip() for line in full_text.splitlines() if line.strip())
-        
-        # Process claims text
-        claims_text = h.handle(str(claims)) if claims else None
-        if claims_text:
-            claims_text = '\n'.join(line.strip() for line in claims_text.splitlines() if line.strip())
+        with track("fetch"):
+            content = fetch_html(url)
         
-        # Create structured data
-        patent_data = {
-            'patent_title': title.text.strip() if title else 'N/A',
-            'abstract': abstract.text.strip() if abstract else 'N/A',
-            'inventor_name': inventor.text.strip() if inventor else 'N/A',
-            'assignee_name': (assigneeCurrent.text.strip() if assigneeCurrent else 
-                            assigneeOriginal.text.strip() if assigneeOriginal else 'N/A'),
-            'filing_date': filingDate.text.strip() if filingDate else 'N/A',
-            'claims_text': claims_text,
-            "patent_text": full_text
-        }
-        return patent_data
+        # Parse the raw bytes once and extract every field in a single pass
+        with track("parse"):
+            return extract_patent_fields(content)
         
     except Exception as e:
         print(f"Error extracting HTML content: {e}")
@@ -143,7 +176,10 @@ def extract_patent_info_with_llm(url):
     if not patent_data:
         print(f"Failed to fetch patent data for URL: {url}")
         return None
-    
+    return build_patent_info(url, patent_data)
+
+def build_patent_info(url, patent_data):
+    """The patent record saved and uploaded for the fields extracted from its page"""
     # Initialize patent_info with the basic data
     patent_info = patent_data.copy()
     patent_info['patent_url'] = url
@@ -160,141 +196,447 @@ def extract_patent_info_with_llm(url):
     patent_info.pop('claims_text', None)
     return patent_info
 
-def read_patent_urls_from_file(filename="patent_urls.txt"):
-    """Read patent URLs from the text file"""
-    try:
-        with open(filename, 'r') as f:
-            return [line.strip() for line in f if line.strip()]
-    except FileNotFoundError:
-        print(f"Error: {filename} not found. Please run getlinks.py first to generate the file.")
-        return []
+def fetch_patent(url: str, rate_limiter: HostRateLimiter) -> Dict:
+    """Wait for a free slot on the patent host, then fetch and parse the page"""
+    rate_limiter.wait(url)
+    return extract_patent_info_with_llm(url)
+
+def iter_fetched_patents(pending, max_workers=MAX_WORKERS, rate_limiter=None):
+    """
+    Fetch patents on a worker pool and yield (url, patent_no, patent_data)
+    as soon as each one completes. At most 2 * max_workers fetches are in
+    flight, so parsed pages never pile up faster than they are consumed.
+    """
+    rate_limiter = rate_limiter or HostRateLimiter(MIN_REQUEST_INTERVAL)
+    pending = iter(pending)
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit_next():
+            for url, patent_no in pending:
+                future = executor.submit(fetch_patent, url, rate_limiter)
+                in_flight[future] = (url, patent_no)
+                return True
+            return False
+
+        while len(in_flight) < max_workers * 2 and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, patent_no = in_flight.pop(future)
+                try:
+                    patent_data = future.result()
+                except Exception as e:
+                    print(f"Error fetching patent URL {url}: {str(e)}")
+                    patent_data = None
+                submit_next()
+                yield url, patent_no, patent_data
+
+async def generate_embeddings(texts, model_name="all-MiniLM-L6-v2", batch_size=EMBED_BATCH_SIZE):
+    print(f"Generating embeddings for {len(texts)} texts using model: {model_name}")
+    embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    print("Generated embeddings")
+    return embeddings
 
-async def generate_embeddings(text, model_name="all-MiniLM-L6-v2"):
-    print(f"Generating embeddings using model: {model_name}")
-    embedding = model.encode(text, convert_to_numpy=True)
-    print("Generated embedding")
-    return embedding
-
-async def store_in_chromadb(text, embedding, collection_name="patents_collection"):
-    print(f"Storing data in ChromaDB collection: {collection_name}")
-    client = chromadb.PersistentClient(path="./chromadb_store")
-    collection = client.get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"}, embedding_function=None)
-
-    doc_id = str(uuid.uuid4())
-    collection.add(
-        ids=[doc_id],
-        embeddings=[embedding.tolist()],
-        documents=[text],
+async def store_in_chromadb(passages, embeddings, store: ChromaStore):
+    print(f"Storing {len(passages)} passages in ChromaDB collection: {store.collection_name}")
+    doc_ids = [passage["id"] for passage in passages]
+    store.upsert(
+        ids=doc_ids,
+        embeddings=[embedding.tolist() for embedding in embeddings],
+        documents=[passage["text"] for passage in passages],
+        metadatas=[passage["metadata"] for passage in passages],
     )
-    print(f"Added document with ID {doc_id} to ChromaDB.")
-    return doc_id
+    print(f"Upserted {len(doc_ids)} passages to ChromaDB.")
+    return doc_ids
+
+class EmbeddingBatcher:
+    """
+    Buffer passages of parsed patents and embed/upsert them in batches.
+
+    A batch is flushed once it holds batch_size passages or when the oldest
+    buffered patent has waited flush_interval seconds, so every flush is one
+    model.encode call and one ChromaDB transaction. The age is only checked
+    on add(): a caller whose patents stop arriving has to call flush()
+    itself, as pipeline.py's indexer does after flush_interval without new
+    patents and working.py does at the end of a run.
+
+    The patents of a batch that fails are listed in failed with the error,
+    for the caller to record; they are not returned as stored.
+    """
+
+    def __init__(self, store: ChromaStore, batch_size=EMBED_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.patent_numbers = []
+        self.passages = []
+        self.first_added_at = None
+        self.failed = []  # (patent_no, error) of patents whose batch could not be stored
+
+    def add(self, patent_no: str, passages: List[Dict]) -> List[str]:
+        """Buffer one patent's passages, return the patent numbers stored if a flush happened"""
+        if not self.patent_numbers:
+            self.first_added_at = time.monotonic()
+        self.patent_numbers.append(patent_no)
+        self.passages.extend(passages)
+
+        if (len(self.passages) >= self.batch_size
+                or time.monotonic() - self.first_added_at >= self.flush_interval):
+            return self.flush()
+        return []
+
+    def flush(self) -> List[str]:
+        """Embed and store everything buffered, return the stored patent numbers"""
+        if not self.patent_numbers:
+            return []
+
+        patent_numbers, passages = self.patent_numbers, self.passages
+        self.patent_numbers, self.passages = [], []
+        self.first_added_at = None
 
-# Example usage
-def main():
-    # Initialize IPFS handler
-    ipfs_handler = IPFSHandler()
-    
-    # Create patent_json directory if it doesn't exist
-    if not os.path.exists('patent_json'):
-        os.makedirs('patent_json')
-        print("Created patent_json directory")
-    
-    # Read patent URLs from the text file instead of calling getLinks
-    patent_urls = read_patent_urls_from_file()
-    if not patent_urls:
-        print("No patent URLs found in patent_urls.txt. Exiting...")
-        return
-        
-    print(f"Found {len(patent_urls)} patent URLs to process from patent_urls.txt")
-    
-    processed_patents = []
-    skipped_patents = []
-    
-    for url in patent_urls:
-        # Clean the URL (remove @ symbol if present)
-        url = url.strip().replace("@", "")
-        print(f"\nProcessing URL: {url}")
-        
         try:
-            # Updated regex pattern to match the exact format
-            pattern = r"/patent/([A-Z0-9]+)"
+            # Skip patents whose stored passages already match their content hash
+            new_hashes = {p["metadata"]["publication_number"]: p["metadata"]["content_hash"] for p in passages}
+            stored_hashes = self.store.stored_hashes(list(new_hashes))
+            changed = {no: h for no, h in new_hashes.items() if stored_hashes.get(no) != h}
+            passages = [p for p in passages if p["metadata"]["publication_number"] in changed]
+            if len(changed) < len(new_hashes):
+                print(f"Skipping {len(new_hashes) - len(changed)} unchanged patents")
+            if not passages:
+                return patent_numbers
 
-            match = re.search(pattern, url)
-            patent_no = match.group(1)
-            
-            if not patent_no:
-                print("Invalid URL format. Skipping...")
-                skipped_patents.append(url)
+            texts = [passage["text"] for passage in passages]
+            with track("embed", items=len(texts)):
+                embeddings = asyncio.run(generate_embeddings(texts, batch_size=self.batch_size))
+            with track("chroma_write", items=len(passages)):
+                asyncio.run(store_in_chromadb(passages, embeddings, self.store))
+                # Drop passages of an older version that the new chunking no longer produces
+                self.store.delete_stale(changed)
+            print(f"Successfully stored {len(changed)} patents in ChromaDB")
+            return patent_numbers
+        except Exception as e:
+            print(f"Error storing batch of {len(patent_numbers)} patents in ChromaDB: {e}")
+            self.failed.extend((patent_no, str(e)) for patent_no in patent_numbers)
+            return []
+
+def reembed_existing(batch_size=EMBED_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+    """Chunk and embed every patent already saved in patent_store/ into the passage collection"""
+    patent_store = SegmentStore()
+    print(f"Re-embedding {len(patent_store)} patents from {patent_store.directory}/")
+
+    store = ChromaStore()
+    batcher = EmbeddingBatcher(store, batch_size, flush_interval)
+    try:
+        for patent_no, patent_data in patent_store.iter_records():
+            patent_data["publication_number"] = patent_no
+            batcher.add(patent_no, chunk_patent(patent_data))
+        batcher.flush()
+    finally:
+        store.close()
+        patent_store.close()
+
+def reparse_from_cache():
+    """
+    Extract every page in the HTML cache again, without network access, e.g.
+    after a parser fix. Patents whose record changes are saved and set back
+    to "fetched", so the next run uploads, embeds and indexes the new version.
+    """
+    state = IngestState()
+    patent_store = SegmentStore()
+    cache = get_html_cache()
+    parsed, changed, failed = 0, 0, 0
+    start = time.perf_counter()
+    try:
+        for url, content in cache.iter_pages():
+            try:
+                with track("parse"):
+                    patent_data = build_patent_info(url, extract_patent_fields(content))
+            except Exception as e:
+                print(f"Error parsing cached page of {url}: {e}")
+                failed += 1
                 continue
-            
-            # patent_no = patent_no.group(1)  # Extract the actual patent number
-            print("PNO", patent_no)
-            # Check if JSON already exists
-            json_path = f"patent_json/{patent_no}.json"
-            if os.path.exists(json_path):
-                print(f"Patent {patent_no} already exists in local storage, skipping...")
-                skipped_patents.append(patent_no)
+            parsed += 1
+            patent_no = patent_data["publication_number"]
+            if patent_no == 'N/A':
                 continue
+            stored = patent_store.get(patent_no)
+            # The stored record carries its IPFS hash, compare it as if the new one had the same
+            if stored is not None:
+                if content_hash(stored) == content_hash(dict(patent_data, ipfs_hash=stored.get("ipfs_hash"))):
+                    continue
+            patent_store.put(patent_no, patent_data)
+            state.mark(patent_no, FETCHED, content_hash=content_hash(patent_data))
+            changed += 1
+    finally:
+        patent_store.close()
+        state.close()
+        close_html_cache()
+        write_snapshot()
+
+    elapsed = time.perf_counter() - start
+    print(f"Re-parsed {parsed} cached pages in {elapsed:.1f} s ({parsed / max(elapsed, 1e-9):.0f} pages/s), "
+          f"{failed} failed")
+    print(f"{changed} patents changed; run working.py (or the pipeline) to upload, embed and index them")
+
+class PatentProcessor:
+    """
+    Everything that happens to a patent once its page is fetched: the local
+    JSON copy, the IPFS upload, and passage embedding into ChromaDB and the
+    lexical index, each recorded in the ingest state. Used by main() for one
+    pass over the pending patents and by pipeline.py for a long-running one.
+
+    With an index_queue, uploaded patents are put on it as (patent_no,
+    patent_data, ipfs_hash) instead of being indexed inline, so another
+    thread can call index() and flush_index() while the next uploads run.
+    """
+
+    def __init__(self, state: IngestState, ipfs_handler: IPFSHandler, batch_size=EMBED_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, ipfs_bulk_size=0, index_queue=None):
+        self.state = state
+        self.ipfs_handler = ipfs_handler
+        self.ipfs_bulk_size = ipfs_bulk_size
+        # Local copies of the patent records, shared with the IPFS handler
+        self.patent_store = ipfs_handler.store
+        self.store = ChromaStore()
+        self.batcher = EmbeddingBatcher(self.store, batch_size, flush_interval)
+        self.lexical_index = LexicalIndex()
+        # Patents fetched but not yet uploaded, when uploading to IPFS in bulk
+        self.upload_queue = {}
+        self.index_queue = index_queue
+        self.processed_patents = []
 
-            # Extract patent information using LLM
-            patent_data = extract_patent_info_with_llm(url)
+    def process_fetched(self, url, patent_no, patent_data):
+        """Save, upload and index one freshly fetched patent"""
+        print(f"\nProcessing URL: {url}")
+        print("PNO", patent_no)
+
+        try:
             # print(patent_data)
             if patent_data:
                 # Get patent number from the data
                 # patent_number = patent_data.get('publication_number', '')
                 patent_data["publication_number"] = patent_no
-                
-                # Save JSON file locally
-                # json_path = f"patent_json/{patent_number}.json"
-                try:
-                    with open(json_path, 'w', encoding='utf-8') as f:
-                        json.dump(patent_data, f, indent=4, ensure_ascii=False)
-                    print(f"Saved JSON file locally: {json_path}")
-                    
-                    # Generate embeddings and store in ChromaDB
-                    text = json.dumps(patent_data)  # Convert patent data to string
-                    embedding = asyncio.run(generate_embeddings(text))
-                    doc_id = asyncio.run(store_in_chromadb(text, embedding))
-                    print(f"Successfully stored in ChromaDB with ID: {doc_id}")
-                        
-                except Exception as e:
-                    print(f"Error saving JSON file or storing in ChromaDB: {e}")
-                    continue
-                
-                # Save to IPFS and get the hash
-                print(f"Uploading patent {patent_no} to IPFS...")
-                ipfs_hash = ipfs_handler.save_and_upload(patent_data, patent_no)
-                
-                if ipfs_hash:
-                    print(f"Successfully processed patent {patent_no}")
-                    print(f"IPFS Hash: {ipfs_hash}")
-                    print(f"Local JSON file saved in: {json_path}")
-                    processed_patents.append(patent_no)
-                else:
-                    print(f"Failed to upload patent {patent_no} to IPFS")
+            
+                # The local copy is written once, by the IPFS handler with the CID
+                # attached, or by index() when the upload fails
+                self.state.mark(patent_no, FETCHED, content_hash=content_hash(patent_data))
+                self.upload(patent_no, patent_data)
             else:
                 print("Failed to extract patent information")
-                
+                self.state.record_error(patent_no, "Failed to extract patent information")
+            
         except Exception as e:
             print(f"Error processing patent URL {url}: {str(e)}")
+            self.state.record_error(patent_no, str(e))
+
+    def resume(self, patent_no, stage, patent_data):
+        """Continue a patent that an earlier run left after the given stage"""
+        print(f"\nResuming patent {patent_no} after stage: {STAGE_NAMES[stage]}")
+        patent_data["publication_number"] = patent_no
+        if stage == PINNED:
+            self._uploaded(patent_no, patent_data, patent_data.get("ipfs_hash", ""))
+        else:
+            self.upload(patent_no, patent_data)
+
+    def upload(self, patent_no, patent_data):
+        if self.ipfs_bulk_size > 0:
+            self.upload_queue[patent_no] = patent_data
+            if len(self.upload_queue) >= self.ipfs_bulk_size:
+                self.upload_queued()
+            return
+
+        # Save to IPFS and get the hash
+        print(f"Uploading patent {patent_no} to IPFS...")
+        ipfs_hash = self.ipfs_handler.save_and_upload(patent_data, patent_no)
+        self._uploaded(patent_no, patent_data, ipfs_hash)
+
+    def upload_queued(self):
+        if not self.upload_queue:
+            return
+        print(f"Uploading {len(self.upload_queue)} patents to IPFS in one batch...")
+        hashes = self.ipfs_handler.add_many(self.upload_queue)
+        for patent_no, patent_data in self.upload_queue.items():
+            self._uploaded(patent_no, patent_data, hashes.get(patent_no, ""))
+        self.upload_queue.clear()
+
+    def _uploaded(self, patent_no, patent_data, ipfs_hash):
+        if self.index_queue is not None:
+            self.index_queue.put((patent_no, patent_data, ipfs_hash))
+        else:
+            self.index(patent_no, patent_data, ipfs_hash)
+
+    def index(self, patent_no, patent_data, ipfs_hash):
+        patent_data["ipfs_hash"] = ipfs_hash
+        if ipfs_hash:
+            self.state.mark(patent_no, PINNED, content_hash=content_hash(patent_data), ipfs_hash=ipfs_hash)
+        else:
+            # Stays at "fetched", so the next run retries the upload from the local copy
+            self.state.record_error(patent_no, "IPFS upload failed")
+            try:
+                self.patent_store.put(patent_no, patent_data)
+            except Exception as e:
+                print(f"Error saving patent locally: {e}")
+
+        # Queue the patent's passages for batched embedding and ChromaDB storage,
+        # after the upload so the IPFS hash is part of their metadata
+        self.mark_stored(self.batcher.add(patent_no, chunk_patent(patent_data)))
+        self.lexical_index.add(patent_data)
+
+        if ipfs_hash:
+            print(f"Successfully processed patent {patent_no}")
+            print(f"IPFS Hash: {ipfs_hash}")
+            print(f"Local copy saved in: {self.patent_store.directory}/")
+            self.processed_patents.append(patent_no)
+        else:
+            print(f"Failed to upload patent {patent_no} to IPFS")
+
+    def flush(self):
+        """Upload, embed and index everything still buffered"""
+        self.upload_queued()
+        self.flush_index()
+
+    def flush_index(self):
+        # Embed and store whatever is left in the last partial batch
+        self.mark_stored(self.batcher.flush())
+        self.lexical_index.flush()
+
+    def mark_stored(self, patent_numbers):
+        self.state.mark_stored(patent_numbers)
+        # Patents of a failed batch stay "pinned" with the error recorded, and are
+        # embedded again from their local copy on the next start
+        failed, self.batcher.failed = self.batcher.failed, []
+        for patent_no, error in failed:
+            self.state.record_error(patent_no, f"Embedding failed: {error}")
+
+    def close(self):
+        # Flush and close the ChromaDB store and the lexical index once for the whole run
+        self.store.close()
+        self.lexical_index.flush()
+        self.lexical_index.close()
+
+
+def discover_new_urls(state: IngestState, frontier: URLFrontier):
+    """Record the URLs appended to patent_urls.txt since the last read, return the new (url, patent_no)"""
+    new_patents = []
+    for urls in frontier.iter_new(FRONTIER_CONSUMER):
+        added, invalid_urls = state.discover(urls)
+        new_patents.extend(added)
+        for url in invalid_urls:
+            print(f"Invalid URL format: {url}. Skipping...")
+    return new_patents
+
+def load_pending(state: IngestState, patent_store: SegmentStore):
+    """
+    Split the patents that are not stored yet into (url, patent_no) to fetch
+    and (patent_no, stage, patent_data) to resume from their saved record
+    """
+    pending = []  # (url, patent_no) still to fetch
+    resumed = []  # (patent_no, stage, patent_data) fetched by an earlier run
+    for url, patent_no, stage in state.pending():
+        if stage == DISCOVERED:
+            pending.append((url, patent_no))
             continue
-            
-        # Add a small delay between requests to avoid rate limiting
-        time.sleep(2)
+        try:
+            patent_data = patent_store.get(patent_no)
+        except Exception:
+            patent_data = None
+        if patent_data is None:
+            # Stopped before the upload saved a local copy (or it is gone), start the patent
+            # over; its page is usually revalidated from the HTML cache
+            state.mark(patent_no, DISCOVERED)
+            pending.append((url, patent_no))
+        else:
+            resumed.append((patent_no, stage, patent_data))
+    return pending, resumed
+
+# Example usage
+def main(max_workers=MAX_WORKERS, min_request_interval=MIN_REQUEST_INTERVAL,
+         batch_size=EMBED_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+         lean_ipfs_upload=True, ipfs_verify_rate=0.0, ipfs_bulk_size=0):
+    # Initialize IPFS handler
+    ipfs_handler = IPFSHandler(lean_upload=lean_ipfs_upload, verify_sample_rate=ipfs_verify_rate)
+    
+    if not os.path.exists(FRONTIER_FILE):
+        print(f"Error: {FRONTIER_FILE} not found. Please run getlinks.py first to generate the file.")
+        ipfs_handler.close()
+        return
+
+    state = IngestState()
+
+    # Record the URLs appended to patent_urls.txt since the last run, then
+    # pick up every patent that has not been stored yet
+    with URLFrontier() as frontier:
+        if state.created:
+            # A new state store has to see the whole list once
+            frontier.set_cursor(FRONTIER_CONSUMER, 0)
+        new_count = len(discover_new_urls(state, frontier))
+    pending, resumed = load_pending(state, ipfs_handler.store)
+
+    stored_count = state.stage_counts()["stored"]
+    print(f"New patent URLs: {new_count}")
+    print(f"Patents already stored: {stored_count}")
+    print(f"Resuming {len(resumed)} partially processed patents")
+    print(f"Fetching {len(pending)} patents with {max_workers} workers...")
+
+    rate_limiter = HostRateLimiter(min_request_interval)
+    processor = PatentProcessor(state, ipfs_handler, batch_size, flush_interval, ipfs_bulk_size)
+    try:
+        for patent_no, stage, patent_data in resumed:
+            processor.resume(patent_no, stage, patent_data)
+
+        for url, patent_no, patent_data in iter_fetched_patents(pending, max_workers, rate_limiter):
+            processor.process_fetched(url, patent_no, patent_data)
+
+        processor.flush()
+    finally:
+        processor.close()
+        ipfs_handler.close()
+        state.close()
+        close_html_cache()
+        # Keep this run's stage timings next to the pipeline's in the rolling metrics file
+        write_snapshot()
     
     # Print summary
     print("\nProcessing Summary:")
-    print(f"Total patents processed: {len(processed_patents)}")
-    print(f"Patents skipped (already existed): {len(skipped_patents)}")
-    if processed_patents:
+    print(f"Total patents processed: {len(processor.processed_patents)}")
+    print(f"Patents skipped (already stored): {stored_count}")
+    if processor.processed_patents:
         print("\nSuccessfully processed patents:")
-        for patent in processed_patents:
-            print(f"- {patent}")
-    if skipped_patents:
-        print("\nSkipped patents (already existed):")
-        for patent in skipped_patents:
+        for patent in processor.processed_patents:
             print(f"- {patent}")
 
 # Run the extraction
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch, embed and store patents listed in patent_urls.txt")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Number of patent pages fetched concurrently")
+    parser.add_argument("--min-request-interval", type=float, default=MIN_REQUEST_INTERVAL,
+                        help="Minimum seconds between requests to the same host")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Number of passages embedded and stored in ChromaDB per batch")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="Seconds a partial embedding batch may wait before it is flushed")
+    parser.add_argument("--reembed-existing", action="store_true",
+                        help="Chunk and embed the patents already in patent_store/ instead of fetching new ones")
+    parser.add_argument("--reparse-from-cache", action="store_true",
+                        help="Extract every page in html_cache/ again, offline, and save the patents that changed")
+    parser.add_argument("--legacy-ipfs-upload", action="store_true",
+                        help="Use the old multi-request IPFS upload instead of a single pinned /add")
+    parser.add_argument("--ipfs-verify-rate", type=float, default=0.0,
+                        help="Fraction of IPFS uploads read back to verify them (0 to 1)")
+    parser.add_argument("--ipfs-bulk", nargs="?", type=int, const=IPFS_BULK_SIZE, default=0,
+                        metavar="N",
+                        help=f"Upload fetched patents to IPFS N at a time in one /add call (default N: {IPFS_BULK_SIZE})")
+    args = parser.parse_args()
+    if args.reembed_existing:
+        reembed_existing(batch_size=args.batch_size, flush_interval=args.flush_interval)
+    elif args.reparse_from_cache:
+        reparse_from_cache()
+    else:
+        main(max_workers=args.workers, min_request_interval=args.min_request_interval,
+             batch_size=args.batch_size, flush_interval=args.flush_interval,
+             lean_ipfs_upload=not args.legacy_ipfs_upload, ipfs_verify_rate=args.ipfs_verify_rate,
+             ipfs_bulk_size=args.ipfs_bulk)